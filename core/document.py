@@ -13,13 +13,13 @@ import os.path as op
 from functools import wraps
 
 from hscommon.notify import Repeater
-from hscommon.util import nonone, allsame, dedupe, extract, first
+from hscommon.util import nonone, allsame, dedupe, extract, first, flatten
 from hscommon.trans import tr
 from hscommon.gui.base import GUIObject
 
 from .const import NOEDIT, DATE_FORMAT_FOR_PREFERENCES
 from .exception import FileFormatError, OperationAborted
-from .loader import native
+from .loader import native, snapshot, journal
 from .model.account import Account, Group, AccountList, GroupList, AccountType
 from .model.amount import parse_amount, format_amount
 from .model.currency import Currency
@@ -32,7 +32,10 @@ from .model.oven import Oven
 from .model.recurrence import Spawn
 from .model.transaction_list import TransactionList
 from .model.undo import Undoer, Action
+from .saver.frozen import FrozenDocument
+from .saver.journal import Journal, journal_filename
 from .saver.native import save as save_native
+from .saver.snapshot import save as save_snapshot
 
 SELECTED_DATE_RANGE_PREFERENCE = 'SelectedDateRange'
 SELECTED_DATE_RANGE_START_PREFERENCE = 'SelectedDateRangeStart'
@@ -70,6 +73,12 @@ class ScheduleScope:
     Cancel = 2
 
 AUTOSAVE_BUFFER_COUNT = 10 # Number of autosave files that will be kept in the cache.
+# Number of records we append to an autosave journal before saving a new autosave snapshot.
+JOURNAL_MAX_RECORDS = 50
+
+def affected_accounts(transactions):
+    """Returns the set of all accounts affected by ``transactions``."""
+    return set(flatten(t.affected_accounts() for t in transactions))
 
 def handle_abort(method):
     @wraps(method)
@@ -81,6 +90,18 @@ def handle_abort(method):
 
     return wrapper
 
+def records_actions(method):
+    # The document records undo actions before making their changes. Once ``method`` is done, tell
+    # the undoer that they're applied, which makes them visible to autosaves.
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._undoer.applied()
+
+    return wrapper
+
 class BaseDocument:
     """Provides a common base for :class:`Document` and :class:`ImportDocument`.
 
@@ -121,7 +142,7 @@ class BaseDocument:
         for txn in transactions:
             self.transactions.add(txn)
         min_date = min(t.date for t in transactions)
-        self._cook(from_date=min_date)
+        self._cook(from_date=min_date, dirty_accounts=affected_accounts(transactions))
 
     def _change_transaction(
             self, transaction, date=NOEDIT, description=NOEDIT, payee=NOEDIT,
@@ -137,6 +158,7 @@ class BaseDocument:
         # needlessly complexifying the code. Some day, we'll have to find an elegant solution to
         # this. In fact, it's the same thing with all these `global_scope` flags we have to
         # propagate everywhere. No easy solution right now.
+        changed = [transaction]
         if isinstance(transaction, Spawn):
             if global_scope:
                 transaction.recurrence.change_globally(transaction)
@@ -144,12 +166,13 @@ class BaseDocument:
                 transaction.recurrence.delete(transaction)
                 materialized = transaction.replicate()
                 self.transactions.add(materialized)
+                changed.append(materialized)
         else:
             if transaction not in self.transactions:
                 self.transactions.add(transaction)
             elif date_changed:
                 self.transactions.move_last(transaction)
-        self.transactions.clear_cache()
+        self.transactions.clear_cache(changed)
 
     def _clean_empty_categories(self, from_account=None):
         for account in list(self.accounts.auto_created):
@@ -163,9 +186,9 @@ class BaseDocument:
         self.transactions.clear()
         self._cook()
 
-    def _cook(self, from_date=None):
+    def _cook(self, from_date=None, dirty_accounts=None):
         # Without date ranges and spawns, it's OK to pass `None` as an `until_date`.
-        self.oven.cook(from_date=from_date, until_date=None)
+        self.oven.cook(from_date=from_date, until_date=None, dirty_accounts=dirty_accounts)
 
     # --- Public
     def change_transaction(self, original, new, global_scope=False):
@@ -193,13 +216,15 @@ class BaseDocument:
         for split in new.splits:
             if split.account is not None:
                 split.account = self.accounts.find(split.account.name, split.account.type)
+        dirty_accounts = original.affected_accounts()
         original.set_splits(new.splits, preserve_instances=True)
         min_date = min(original.date, new.date)
         self._change_transaction(
             original, date=new.date, description=new.description,
             payee=new.payee, checkno=new.checkno, notes=new.notes, global_scope=global_scope
         )
-        self._cook(from_date=min_date)
+        dirty_accounts |= original.affected_accounts()
+        self._cook(from_date=min_date, dirty_accounts=dirty_accounts)
         self._clean_empty_categories()
 
     def change_transactions(
@@ -237,13 +262,15 @@ class BaseDocument:
             Currency.get_rates_db().ensure_rates(date, currencies_to_ensure)
 
         min_date = date if date is not NOEDIT else datetime.date.max
+        dirty_accounts = affected_accounts(transactions)
         for transaction in transactions:
             min_date = min(min_date, transaction.date)
             self._change_transaction(
                 transaction, date=date, description=description, payee=payee, checkno=checkno,
                 from_=from_, to=to, amount=amount, currency=currency, global_scope=global_scope
             )
-        self._cook(from_date=min_date)
+        dirty_accounts |= affected_accounts(transactions)
+        self._cook(from_date=min_date, dirty_accounts=dirty_accounts)
         self._clean_empty_categories()
 
     def delete_transactions(self, transactions, from_account=None, global_scope=False):
@@ -263,16 +290,15 @@ class BaseDocument:
         :param from_account: the :class:`.Account` from which the operation takes place, if any.
         :param bool global_scope: Whether this changes affect the whole recurrence (if applicable)
         """
-        for txn in transactions:
-            if isinstance(txn, Spawn):
-                if global_scope:
-                    txn.recurrence.stop_before(txn)
-                else:
-                    txn.recurrence.delete(txn)
+        spawns, txns = extract(lambda t: isinstance(t, Spawn), transactions)
+        for spawn in spawns:
+            if global_scope:
+                spawn.recurrence.stop_before(spawn)
             else:
-                self.transactions.remove(txn)
+                spawn.recurrence.delete(spawn)
+        self.transactions.remove_many(txns)
         min_date = min(t.date for t in transactions)
-        self._cook(from_date=min_date)
+        self._cook(from_date=min_date, dirty_accounts=affected_accounts(transactions))
         self._clean_empty_categories(from_account=from_account)
 
     def duplicate_transactions(self, transactions):
@@ -332,6 +358,7 @@ class BaseDocument:
             Currency.get_rates_db().ensure_rates(date, [amount.currency.code, entry.account.currency.code])
         candidate_dates = [entry.date, date, reconciliation_date, entry.reconciliation_date]
         min_date = min(d for d in candidate_dates if d is not NOEDIT and d is not None)
+        dirty_accounts = entry.transaction.affected_accounts()
         if reconciliation_date is not NOEDIT:
             entry.split.reconciliation_date = reconciliation_date
         if (amount is not NOEDIT) and (len(entry.splits) == 1):
@@ -344,7 +371,8 @@ class BaseDocument:
             entry.transaction, date=date, description=description,
             payee=payee, checkno=checkno, global_scope=global_scope
         )
-        self._cook(from_date=min_date)
+        dirty_accounts |= entry.transaction.affected_accounts()
+        self._cook(from_date=min_date, dirty_accounts=dirty_accounts)
         self._clean_empty_categories()
 
     def delete_entries(self, entries):
@@ -427,6 +455,12 @@ class Document(BaseDocument, Repeater, GUIObject):
         self._filter_type = None
         self._document_id = None
         self._dirty_flag = False
+        # Journal of the last autosave snapshot, and what the snapshot had that can't be journaled.
+        self._journal = None
+        self._journal_accounts = None
+        self._journal_properties = None
+        # Copies of our instances that autosaves write, see _async_autosave().
+        self._frozen = FrozenDocument()
         self._restore_preferences()
 
     # --- Private
@@ -446,20 +480,75 @@ class Document(BaseDocument, Repeater, GUIObject):
         return True
 
     def _async_autosave(self):
-        # Because this method is called asynchronously, it's possible that, if unlucky, it happens
-        # exactly as the user is commiting a change. In these cases, the autosaved file might be a
-        # save of the data in a quite weird state. I think this risk is acceptable. The alternative
-        # is to put locks everywhere, which would complexify the application.
-        existing_names = [name for name in os.listdir(self.app.cache_path) if name.startswith('autosave')]
+        # Because this method is called asynchronously, the user might be changing the document as
+        # we save it. Rather than writing live instances, we write frozen copies of them, which
+        # nobody else touches. Only instances changed since our last autosave are copied again, so
+        # we don't spend much time reading live instances. If, when unlucky, we copy an instance
+        # exactly as the user is commiting a change to it, that copy might be in a weird state, but
+        # the change's action is only played once the change is done (see records_actions()), so
+        # the next autosave copies it again. The alternative is to put locks everywhere, which would
+        # complexify the application.
+        # When only transactions changed since our last autosave, we append them to the journal of
+        # our last snapshot. Otherwise, or when the journal is getting long, we save a new snapshot.
+        actions = self._undoer.pop_played_actions()
+        if actions is None:
+            self._frozen.invalidate()
+        else:
+            self._frozen.invalidate(flatten(action.changed_instances() for action in actions))
+        transactions = self._journalable_transactions(actions)
+        if transactions is not None and self._journal.record_count < JOURNAL_MAX_RECORDS:
+            self._journal.append(transactions, self.transactions, freeze=self._frozen.transaction)
+            return
+        existing_names = [
+            name for name in os.listdir(self.app.cache_path)
+            if name.startswith('autosave') and name.endswith('.moneyguru')
+        ]
         existing_names.sort()
         timestamp = int(time.time())
         autosave_name = 'autosave{0}.moneyguru'.format(timestamp)
         while autosave_name in existing_names:
             timestamp += 1
             autosave_name = 'autosave{0}.moneyguru'.format(timestamp)
-        self.save_to_xml(op.join(self.app.cache_path, autosave_name), autosave=True)
+        autosave_path = op.join(self.app.cache_path, autosave_name)
+        if self._document_id is None:
+            self._document_id = uuid.uuid4().hex
+        # What we compare the document to when journaling has to be what we save, not what the
+        # document becomes while we save.
+        saved_accounts = list(self.accounts)
+        saved_properties = dict(self._properties)
+        saved_transactions = list(self.transactions)
+        frozen = self._frozen.freeze(
+            saved_accounts, self.groups, saved_transactions, self.schedules, self.budgets
+        )
+        save_native(autosave_path, self._document_id, saved_properties, *frozen)
+        self._journal = Journal(autosave_path, saved_transactions)
+        self._journal_accounts = set(saved_accounts)
+        self._journal_properties = saved_properties
         if len(existing_names) >= AUTOSAVE_BUFFER_COUNT:
-            os.remove(op.join(self.app.cache_path, existing_names[0]))
+            oldest_path = op.join(self.app.cache_path, existing_names[0])
+            os.remove(oldest_path)
+            oldest_journal = journal_filename(oldest_path)
+            if op.exists(oldest_journal):
+                os.remove(oldest_journal)
+
+    def _journalable_transactions(self, actions):
+        # Returns the transactions changed by ``actions`` (played since the last autosave) if that's
+        # all there is to journal. Otherwise, returns None.
+        if self._journal is None or actions is None:
+            return None
+        if set(self.accounts) != self._journal_accounts:
+            return None # accounts were auto-created or auto-deleted
+        if self._properties != self._journal_properties:
+            return None
+        result = set()
+        for action in actions:
+            transactions = action.changed_transactions_only()
+            if transactions is None:
+                return None
+            result |= transactions
+        if not self._journal.keeps_order(result, self.transactions):
+            return None # moved transactions, or transactions re-added at their old position
+        return result
 
     def _clear(self):
         self._document_id = None
@@ -468,10 +557,14 @@ class Document(BaseDocument, Repeater, GUIObject):
         del self.budgets[:]
         self._undoer.clear()
         self._dirty_flag = False
+        self._journal = None
+        self._frozen = FrozenDocument()
         BaseDocument._clear(self)
 
-    def _cook(self, from_date=None):
-        self.oven.cook(from_date=from_date, until_date=self.date_range.end)
+    def _cook(self, from_date=None, dirty_accounts=None):
+        self.oven.cook(
+            from_date=from_date, until_date=self.date_range.end, dirty_accounts=dirty_accounts
+        )
 
     def _get_action_from_changed_transactions(self, transactions, global_scope=False):
         if len(transactions) == 1 and not isinstance(transactions[0], Spawn) \
@@ -559,6 +652,21 @@ class Document(BaseDocument, Repeater, GUIObject):
             self.select_all_transactions_range()
         self.notify('document_restoring_preferences')
 
+    def _save(self, save_func, filename, autosave):
+        # When called from _async_autosave, it should not disrupt the user: no stop edition, no
+        # change in the save state.
+        if not autosave:
+            self.stop_edition()
+        if self._document_id is None:
+            self._document_id = uuid.uuid4().hex
+        save_func(
+            filename, self._document_id, self._properties, self.accounts, self.groups,
+            self.transactions, self.schedules, self.budgets
+        )
+        if not autosave:
+            self._undoer.set_save_point()
+            self._dirty_flag = False
+
     def _save_preferences(self):
         dr = self.date_range
         selected_range = DATE_RANGE_MONTH
@@ -583,6 +691,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self.set_default(EXCLUDED_ACCOUNTS_PREFERENCE, excluded_account_names)
 
     # --- Account
+    @records_actions
     def change_accounts(
             self, accounts, name=NOEDIT, type=NOEDIT, currency=NOEDIT, group=NOEDIT,
             account_number=NOEDIT, inactive=NOEDIT, notes=NOEDIT):
@@ -616,6 +725,7 @@ class Document(BaseDocument, Repeater, GUIObject):
                 account.group = group
             if account_number is not NOEDIT:
                 account.account_number = account_number
+                self.accounts.reindex([account])
             if inactive is not NOEDIT:
                 account.inactive = inactive
             if notes is not NOEDIT:
@@ -625,6 +735,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self.transactions.clear_cache()
         self.notify('account_changed')
 
+    @records_actions
     def delete_accounts(self, accounts, reassign_to=None):
         """Removes ``accounts`` from the document.
 
@@ -664,6 +775,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self._cook()
         self.notify('account_deleted')
 
+    @records_actions
     def new_account(self, type, group):
         """Create a new account in the document.
 
@@ -702,6 +814,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self.notify('accounts_excluded')
 
     # --- Group
+    @records_actions
     def change_group(self, group, name=NOEDIT):
         """Properly sets properties for ``group``.
 
@@ -719,6 +832,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self._undoer.record(action)
         self.notify('account_changed')
 
+    @records_actions
     def delete_groups(self, groups):
         """Removes ``groups`` from the document.
 
@@ -739,6 +853,7 @@ class Document(BaseDocument, Repeater, GUIObject):
             account.group = None
         self.notify('account_deleted')
 
+    @records_actions
     def new_group(self, type):
         """Creates a new group of type ``type``.
 
@@ -781,6 +896,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         after_date = after.date if after else None
         return from_date in (before_date, after_date)
 
+    @records_actions
     @handle_abort
     def change_transaction(self, original, new):
         """Changes the attributes of ``original`` so that they match those of ``new``.
@@ -800,6 +916,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         if not self._adjust_date_range(original.date):
             self.notify('transaction_changed')
 
+    @records_actions
     @handle_abort
     def change_transactions(
             self, transactions, date=NOEDIT, description=NOEDIT, payee=NOEDIT, checkno=NOEDIT,
@@ -834,6 +951,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         if action.changed_schedules:
             self.notify('schedule_changed')
 
+    @records_actions
     @handle_abort
     def delete_transactions(self, transactions, from_account=None):
         """Removes every transaction in ``transactions`` from the document.
@@ -860,6 +978,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         if action.changed_schedules:
             self.notify('schedule_changed')
 
+    @records_actions
     def duplicate_transactions(self, transactions):
         """Create copies of ``transactions`` in the document.
 
@@ -878,6 +997,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self._add_transactions(duplicated)
         self.notify('transaction_changed')
 
+    @records_actions
     def move_transactions(self, transactions, to_transaction):
         """Re-orders ``transactions`` so that they are right before ``to_transaction``.
 
@@ -898,6 +1018,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self.notify('transaction_changed')
 
     # --- Entry
+    @records_actions
     @handle_abort
     def change_entry(
             self, entry, date=NOEDIT, reconciliation_date=NOEDIT, description=NOEDIT, payee=NOEDIT,
@@ -937,6 +1058,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         if not self._adjust_date_range(entry.date):
             self.notify('transaction_changed')
 
+    @records_actions
     def toggle_entries_reconciled(self, entries):
         """Toggle the reconcile flag of `entries`.
 
@@ -966,7 +1088,8 @@ class Document(BaseDocument, Repeater, GUIObject):
         else:
             for split in splits:
                 split.reconciliation_date = None
-        self._cook(from_date=min_date)
+        dirty_accounts = {entry.account for entry in entries}
+        self._cook(from_date=min_date, dirty_accounts=dirty_accounts)
         self.notify('transaction_changed')
 
     # --- Budget
@@ -1005,6 +1128,7 @@ class Document(BaseDocument, Repeater, GUIObject):
             budgeted_amount = target.normalize_amount(budgeted_amount)
         return budgeted_amount
 
+    @records_actions
     def change_budget(self, original, new):
         """Changes the attributes of ``original`` so that they match those of ``new``.
 
@@ -1036,6 +1160,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self._cook(from_date=min_date)
         self.notify('budget_changed')
 
+    @records_actions
     def delete_budgets(self, budgets):
         """Removes ``budgets`` from the document.
 
@@ -1053,6 +1178,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self.notify('budget_deleted')
 
     # --- Schedule
+    @records_actions
     def change_schedule(self, schedule, new_ref, repeat_type, repeat_every, stop_date):
         """Change attributes of ``schedule``.
 
@@ -1091,6 +1217,7 @@ class Document(BaseDocument, Repeater, GUIObject):
         self._cook(from_date=min_date)
         self.notify('schedule_changed')
 
+    @records_actions
     def delete_schedules(self, schedules):
         """Removes ``schedules`` from the document.
 
@@ -1127,6 +1254,7 @@ class Document(BaseDocument, Repeater, GUIObject):
             return
         for txn in self.transactions[:]:
             txn.date = inc_month_overflow(txn.date, month_diff)
+            self.transactions.reindex([txn])
             if txn.date > TODAY:
                 self.transactions.remove(txn)
             for split in txn.splits:
@@ -1158,14 +1286,23 @@ class Document(BaseDocument, Repeater, GUIObject):
     def load_from_xml(self, filename):
         """Clears the document and loads data from ``filename``.
 
-        ``filename`` must be a path to a moneyGuru XML document.
+        ``filename`` must be a path to a moneyGuru XML document or to a moneyGuru snapshot (see
+        :meth:`save_to_snapshot`). If ``filename`` is an autosave with a journal, the journal is
+        replayed on top of it.
 
         :param filename: ``str``
         """
-        loader = native.Loader(self.default_currency)
-        try:
-            loader.parse(filename)
-        except FileFormatError:
+        loaderclasses = (native.Loader, snapshot.Loader)
+        if journal.has_journal(filename):
+            loaderclasses = (journal.Loader, ) + loaderclasses
+        for loaderclass in loaderclasses:
+            loader = loaderclass(self.default_currency)
+            try:
+                loader.parse(filename)
+                break
+            except FileFormatError:
+                pass
+        else:
             raise FileFormatError(tr('"%s" is not a moneyGuru file') % filename)
         loader.load()
         self._clear()
@@ -1202,20 +1339,20 @@ class Document(BaseDocument, Repeater, GUIObject):
         :param filename: ``str``
         :param autosave: ``bool``
         """
-        # When called from _async_autosave, it should not disrupt the user: no stop edition, no
-        # change in the save state.
-        if not autosave:
-            self.stop_edition()
-        if self._document_id is None:
-            self._document_id = uuid.uuid4().hex
-        save_native(
-            filename, self._document_id, self._properties, self.accounts, self.groups,
-            self.transactions, self.schedules, self.budgets
-        )
-        if not autosave:
-            self._undoer.set_save_point()
-            self._dirty_flag = False
+        self._save(save_native, filename, autosave)
 
+    def save_to_snapshot(self, filename, autosave=False):
+        """Saves the document to ``filename`` as a moneyGuru snapshot.
+
+        Snapshots hold the same data as XML documents, but in a compact binary (SQLite) form that
+        is much faster to load. They're loaded with :meth:`load_from_xml` as well.
+
+        :param filename: ``str``
+        :param autosave: ``bool``. Same as in :meth:`save_to_xml`.
+        """
+        self._save(save_snapshot, filename, autosave)
+
+    @records_actions
     def import_entries(self, target_account, ref_account, matches):
         """Imports entries in ``mathes`` into ``target_account``.
 
@@ -1271,9 +1408,11 @@ class Document(BaseDocument, Repeater, GUIObject):
             self.accounts.add(account)
         if target_account is not ref_account and ref_account.reference is not None:
             target_account.reference = ref_account.reference
+            self.accounts.reindex([target_account])
         for entry, ref in matches:
             if ref is not None:
                 ref.transaction.date = entry.date
+                self.transactions.reindex([ref.transaction])
                 ref.split.amount = entry.split.amount
                 ref.transaction.balance(strong_split=ref.split, keep_two_splits=True)
                 ref.split.reference = entry.split.reference
@@ -1393,8 +1532,8 @@ class Document(BaseDocument, Repeater, GUIObject):
     def undo(self):
         """Undo the last undoable action."""
         self.stop_edition()
-        self._undoer.undo()
-        self._cook()
+        from_date, dirty_accounts = self._undoer.undo()
+        self._cook(from_date=from_date, dirty_accounts=dirty_accounts)
         self.notify('performed_undo_or_redo')
 
     def can_redo(self):
@@ -1408,8 +1547,8 @@ class Document(BaseDocument, Repeater, GUIObject):
     def redo(self):
         """Redo the last redoable action."""
         self.stop_edition()
-        self._undoer.redo()
-        self._cook()
+        from_date, dirty_accounts = self._undoer.redo()
+        self._cook(from_date=from_date, dirty_accounts=dirty_accounts)
         self.notify('performed_undo_or_redo')
 
     # --- Misc
@@ -1584,8 +1723,10 @@ class ImportDocument(BaseDocument):
         to re-do it's account entries.
         """
         self.cook_flag = True
+        # Import actions can change the date of our transactions.
+        self.transactions.reindex()
         self.oven.cook(from_date=None, until_date=None)
 
-    def _cook(self, from_date=None):
+    def _cook(self, from_date=None, dirty_accounts=None):
         pass
 
@@ -7,7 +7,7 @@
 from hscommon.util import nonone, dedupe
 
 from .base import DocumentGUIObject
-from ..model.completion import CompletionList
+from ..model.completion import CompletionIndex, CompletionList
 
 class CompletableEdit(DocumentGUIObject):
     def __init__(self, mainwindow):
@@ -15,6 +15,7 @@ class CompletableEdit(DocumentGUIObject):
         self.mainwindow = mainwindow
         self._attrname = ''
         self._candidates = None
+        self._completion_index = None
         self._completions = None
         self._complete_completion = ''
         self.completion = ''
@@ -42,6 +43,20 @@ class CompletableEdit(DocumentGUIObject):
             self._candidates = result
         self._candidates = dedupe([name for name in self._candidates if name.strip()])
 
+    def _refresh_completion_index(self):
+        if self.mainwindow is None or not self.attrname:
+            return
+        doc = self.mainwindow.document
+        attrname = self.attrname
+        if attrname == 'description':
+            self._completion_index = doc.transactions.description_index
+        elif attrname == 'payee':
+            self._completion_index = doc.transactions.payee_index
+        elif attrname in {'from', 'to', 'account', 'transfer'}:
+            # Account candidates aren't only coming from transactions. There aren't many of them
+            # so we index them on the spot.
+            self._completion_index = CompletionIndex(self.candidates)
+
     def _set_completion(self, completion):
         completion = nonone(completion, '')
         self._complete_completion = completion
@@ -100,6 +115,7 @@ class CompletableEdit(DocumentGUIObject):
             return
         self._attrname = value
         self._candidates = None
+        self._completion_index = None
         self._text = ''
         self._set_completion('')
         self._completions = None
@@ -110,6 +126,12 @@ class CompletableEdit(DocumentGUIObject):
             self._refresh_candidates()
         return self._candidates
 
+    @property
+    def completion_index(self):
+        if self._completion_index is None:
+            self._refresh_completion_index()
+        return self._completion_index
+
     @property
     def text(self):
         return self._text
@@ -117,8 +139,8 @@ class CompletableEdit(DocumentGUIObject):
     @text.setter
     def text(self, value):
         self._text = value
-        if self.candidates:
-            self._completions = CompletionList(value, self._candidates)
+        if self.completion_index:
+            self._completions = CompletionList(value, self._completion_index)
             self._set_completion(self._completions.current())
         else:
             self._completions = None
@@ -126,6 +148,7 @@ class CompletableEdit(DocumentGUIObject):
     # --- Events
     def transaction_changed(self):
         self._candidates = None
+        self._completion_index = None
 
     account_added = transaction_changed
     account_changed = transaction_changed
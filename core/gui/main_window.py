@@ -6,6 +6,7 @@
 
 import logging
 import weakref
+from operator import attrgetter
 
 from hscommon.notify import Repeater
 from hscommon.util import first, minmax
@@ -17,7 +18,7 @@ from ..document import FilterType
 from ..exception import OperationAborted, FileFormatError
 from ..model.date import inc_month, DateFormat
 from ..model.recurrence import Recurrence, RepeatType
-from ..loader import csv, qif, ofx, native
+from ..loader import csv, batch
 from .base import MESSAGES_DOCUMENT_CHANGED
 from .search_field import SearchField
 from .date_range_selector import DateRangeSelector
@@ -105,6 +106,8 @@ class MainWindow(Repeater, GUIObject):
         self.completion_lookup = CompletionLookup(self)
 
         self.csv_options = CSVOptions(self)
+        # CSV loaders waiting for their turn in the CSV options window.
+        self._csv_loaders = []
         self.import_window = ImportWindow(self)
 
         msgs = MESSAGES_DOCUMENT_CHANGED | {'filter_applied', 'date_range_changed'}
@@ -272,12 +275,14 @@ class MainWindow(Repeater, GUIObject):
 
     def _visible_entries_for_account(self, account):
         date_range = self.document.date_range
-        entries = [e for e in account.entries if e.date in date_range]
+        entries = account.entries.entries_in_range(date_range)
         query_string = self.document.filter_string
         filter_type = self.document.filter_type
         if query_string:
             query = self.app.parse_search_query(query_string)
-            entries = [e for e in entries if e.transaction.matches(query)]
+            entries = self.document.oven.search_index.filter(
+                entries, query, key=attrgetter('transaction')
+            )
         if filter_type is FilterType.Unassigned:
             entries = [e for e in entries if not e.transfer]
         elif (filter_type is FilterType.Income) or (filter_type is FilterType.Expense):
@@ -356,14 +361,15 @@ class MainWindow(Repeater, GUIObject):
     def jump_to_account(self):
         self.account_lookup.show()
 
-    def load_parsed_file_for_import(self):
+    def load_parsed_file_for_import(self, infos=None):
         """Load a parsed file for import and trigger the opening of the Import window.
 
         When the document's ``loader`` has finished parsing (either after having done CSV
         configuration or directly after :meth:`parse_file_for_import`), call this method to load the
-        parsed data into model instances, ready to be shown in the Import window.
+        parsed data into model instances, ready to be shown in the Import window. ``infos`` is
+        passed to the loader's ``load()``.
         """
-        self.loader.load()
+        self.loader.load(infos)
         if any(a.is_balance_sheet_account() for a in self.loader.accounts) and self.loader.transactions:
             self.import_window.show()
         else:
@@ -441,29 +447,45 @@ class MainWindow(Repeater, GUIObject):
         """Parses ``filename`` in preparation for importing.
 
         Opens and parses ``filename`` and try to determine its format by successively trying to read
-        is as a moneyGuru file, an OFX, a QIF and finally a CSV. Once parsed, take the appropriate
-        action for the file which is either to show the CSV options window or to call
-        :meth:`load_parsed_file_for_import`.
+        is as a moneyGuru file, a moneyGuru snapshot, an OFX, a QIF and finally a CSV. Once parsed,
+        take the appropriate action for the file which is either to show the CSV options window or
+        to call :meth:`load_parsed_file_for_import`.
         """
         default_date_format = DateFormat(self.app.date_format).sys_format
-        for loaderclass in (native.Loader, ofx.Loader, qif.Loader, csv.Loader):
-            try:
-                loader = loaderclass(
-                    self.document.default_currency, default_date_format=default_date_format
-                )
-                loader.parse(filename)
-                break
-            except FileFormatError:
-                pass
-        else:
-            # No file fitted
-            raise FileFormatError(tr('%s is of an unknown format.') % filename)
+        loader = batch.parse_file(
+            filename, self.document.default_currency, default_date_format=default_date_format
+        )
         self.loader = loader
         if isinstance(self.loader, csv.Loader):
             self.csv_options.show()
         else:
             self.load_parsed_file_for_import()
 
+    def parse_files_for_import(self, filenames):
+        """Parses and loads ``filenames`` for import in one go.
+
+        Files are parsed in parallel (see :func:`.batch.parse_files`) and each of them gets its
+        panes in the Import window. CSV files need configuration, so they're shown in the CSV options
+        window one after the other (see :meth:`show_next_csv_options`). Files that couldn't be
+        imported are reported at the end with a ``FileFormatError``.
+        """
+        default_date_format = DateFormat(self.app.date_format).sys_format
+        parsed, failed = batch.parse_files(
+            filenames, self.document.default_currency, default_date_format=default_date_format
+        )
+        for filename, loader, infos in parsed:
+            if isinstance(loader, csv.Loader):
+                self._csv_loaders.append(loader)
+                continue
+            self.loader = loader
+            try:
+                self.load_parsed_file_for_import(infos)
+            except FileFormatError:
+                failed.append(filename)
+        self.show_next_csv_options()
+        if failed:
+            raise FileFormatError(tr("These files couldn't be imported: %s") % ', '.join(failed))
+
     def select_pane_of_type(self, pane_type, clear_filter=True):
         if clear_filter:
             self.document.filter_string = ''
@@ -503,6 +525,15 @@ class MainWindow(Repeater, GUIObject):
     def show_message(self, message):
         self.view.show_message(message)
 
+    def show_next_csv_options(self):
+        """Shows the CSV options window for the next CSV file waiting to be configured.
+
+        CSV files are queued by :meth:`parse_files_for_import`. Does nothing if the queue is empty.
+        """
+        if self._csv_loaders:
+            self.loader = self._csv_loaders.pop(0)
+            self.csv_options.show()
+
     def toggle_area_visibility(self, area):
         if area in self.hidden_areas:
             self.hidden_areas.remove(area)
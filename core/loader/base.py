@@ -15,7 +15,7 @@ from hscommon.trans import tr
 
 from ..exception import FileFormatError
 from ..model.account import Account, Group, AccountList, GroupList, AccountType
-from ..model.amount import parse_amount, of_currency, UnsupportedCurrencyError
+from ..model.amount import Amount, parse_amount, of_currency, UnsupportedCurrencyError
 from ..model.budget import Budget
 from ..model.currency import Currency
 from ..model.oven import Oven
@@ -66,6 +66,12 @@ class Loader:
     # Whether we fail with a ``FileFormatError`` when encountering an unsupported currency or we
     # fall back to the default currency
     STRICT_CURRENCY = False
+    # Attributes that we fill while reading parsed data and that load() needs afterwards. Their
+    # values are picklable. See read_infos().
+    INFO_ATTRS = [
+        'document_id', 'properties', 'parsing_date_format', 'group_infos', 'account_infos',
+        'transaction_infos', 'recurrence_infos', 'budget_infos',
+    ]
 
     def __init__(self, default_currency, default_date_format=None):
         self.default_currency = default_currency
@@ -97,6 +103,10 @@ class Loader:
         # parsing dates. This format is used in the ImportWindow. It is also used in
         # self.parse_date_str as a default value
         self.parsing_date_format = self.NATIVE_DATE_FORMAT
+        # (string, currency) -> parsed amount. Many amounts in a file tend to be the same.
+        self._parsed_amounts = {}
+        # (string, format) -> parsed date. Same thing for dates.
+        self._parsed_dates = {}
 
     # --- Virtual
     def _parse(self, infile):
@@ -151,11 +161,17 @@ class Loader:
         """
         if not date_format:
             date_format = self.parsing_date_format
+        key = (date_str, date_format)
+        try:
+            return self._parsed_dates[key]
+        except KeyError:
+            pass
         result = datetime.datetime.strptime(date_str, date_format).date()
         if result.year < 1900:
             # we have a typo in the house. Just use 2000 + last-two-digits
             year = (result.year % 100) + 2000
             result = result.replace(year=year)
+        self._parsed_dates[key] = result
         return result
 
     def start_group(self):
@@ -225,22 +241,40 @@ class Loader:
         except IOError:
             raise FileFormatError()
 
-    @classmethod
-    def parse_amount(cls, string, currency):
+    def parse_amount(self, string, currency):
+        key = (string, currency)
+        try:
+            return self._parsed_amounts[key]
+        except KeyError:
+            pass
         try:
-            return parse_amount(
-                string, currency, with_expression=False, strict_currency=cls.STRICT_CURRENCY
+            result = parse_amount(
+                string, currency, with_expression=False, strict_currency=self.STRICT_CURRENCY
             )
         except UnsupportedCurrencyError as e:
             msg = tr(
                 "Unsupported currency: {}. Aborting load. Did you disable a currency plugin?"
             ).format(e.currency)
             raise FileFormatError(msg)
+        self._parsed_amounts[key] = result
+        return result
 
-    def load(self):
+    def read_infos(self):
+        """Reads parsed data into infos and returns them in a dict.
+
+        This is the first half of :meth:`load`. The returned dict only contains picklable values
+        and can be given to :meth:`load` on another loader of the same class, which doesn't have to
+        live in the same process.
+        """
+        self._load()
+        self.flush_account() # Implicit
+        return {attr: getattr(self, attr) for attr in self.INFO_ATTRS}
+
+    def load(self, infos=None):
         """Loads the parsed info into self.accounts and self.transactions.
 
-        You must have called parse() before calling this.
+        You must have called parse() before calling this, unless you pass ``infos``, as returned by
+        :meth:`read_infos`, in which case we use them instead of our own parsed data.
         """
         def load_transaction_info(info):
             description = info.description
@@ -276,8 +310,11 @@ class Loader:
                         split.reference = info.reference
             return transaction
 
-        self._load()
-        self.flush_account() # Implicit
+        if infos is None:
+            self.read_infos()
+        else:
+            for attr, value in infos.items():
+                setattr(self, attr, value)
         # Now, we take the info we have and transform it into model instances
         currencies = set()
         start_date = datetime.date.max
@@ -317,19 +354,22 @@ class Loader:
             if info.transfer and info.transfer not in split_accounts:
                 info.splits.append(SplitInfo(info.transfer, info.amount, info.currency, True))
             for split_info in info.splits:
-                # this amount is just to determine the auto_create_type
-                str_amount = split_info.amount
-                if split_info.currency:
-                    str_amount += split_info.currency
-                amount = self.parse_amount(str_amount, self.default_currency)
-                auto_create_type = AccountType.Income if amount >= 0 else AccountType.Expense
-                split_info.account = (
-                    self.accounts.find(split_info.account, auto_create_type)
-                    if split_info.account
-                    else None
-                )
-                currency = split_info.account.currency if split_info.account is not None else self.default_currency
-                split_info.amount = self.parse_amount(str_amount, currency)
+                account_name = split_info.account
+                account = self.accounts.find(account_name) if account_name else None
+                amount = split_info.amount
+                # Some loaders give us amounts that are already parsed.
+                if not isinstance(amount, (Amount, int)):
+                    if split_info.currency:
+                        amount += split_info.currency
+                    # Accounts that we auto-create have the default currency, so parsing with it
+                    # when there's no account yet gives us the right amount.
+                    currency = account.currency if account is not None else self.default_currency
+                    amount = self.parse_amount(amount, currency)
+                if account is None and account_name:
+                    auto_create_type = AccountType.Income if amount >= 0 else AccountType.Expense
+                    account = self.accounts.find(account_name, auto_create_type)
+                split_info.account = account
+                split_info.amount = amount
                 if split_info.amount:
                     currencies.add(split_info.amount.currency)
 
@@ -365,7 +405,9 @@ class Loader:
             if account is None:
                 continue
             target = self.accounts.find(info.target) if info.target else None
-            amount = self.parse_amount(info.amount, account.currency)
+            amount = info.amount
+            if not isinstance(amount, (Amount, int)):
+                amount = self.parse_amount(amount, account.currency)
             start_date = nonone(info.start_date, fallback_start_date)
             budget = Budget(account, target, amount, start_date, repeat_type=info.repeat_type)
             budget.notes = nonone(info.notes, '')
@@ -470,5 +512,6 @@ class BudgetInfo:
         self.stop_date = None
 
     def is_valid(self):
-        return self.account and self.amount
+        # Amounts are strings to parse, except with snapshots, where a zero amount is valid.
+        return bool(self.account) and self.amount is not None and self.amount != ''
 
@@ -0,0 +1,134 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from hscommon.trans import tr
+from hscommon.util import dedupe
+
+from ..exception import FileFormatError
+from ..model.currency import Currency
+from . import csv, qif, ofx, native, snapshot
+
+# The order in which we try loaders when we can't tell a file's format from its first bytes.
+LOADER_CLASSES = (native.Loader, snapshot.Loader, ofx.Loader, qif.Loader, csv.Loader)
+# Loaders that can read their infos in another process. The snapshot loader holds a database
+# connection and the CSV loader needs user input before loading, so they stay in our process.
+PARALLEL_LOADER_CLASSES = (native.Loader, ofx.Loader, qif.Loader)
+SNIFF_SIZE = 1024
+UTF8_BOM = b'\xef\xbb\xbf'
+
+def sniff_loader_class(filename):
+    """Returns the loader class for ``filename`` by looking at its first bytes.
+
+    Returns ``None`` when the format can't be determined that way. Sniffing is a guess: the
+    returned loader still has to successfully parse the file.
+    """
+    try:
+        with open(filename, 'rb') as fp:
+            head = fp.read(SNIFF_SIZE)
+    except IOError:
+        return None
+    if head.startswith(snapshot.SQLITE_HEADER):
+        return snapshot.Loader
+    if b'<moneyguru-file' in head:
+        return native.Loader
+    text = head.lstrip(UTF8_BOM).decode('latin-1')
+    lines = [line.strip() for line in text.replace('\r', '\n').split('\n')]
+    firstline = next((line for line in lines if line), '')
+    if firstline == 'OFXHEADER:100' or (firstline.startswith('<?xml') and '<?OFX' in text):
+        return ofx.Loader
+    if firstline.startswith('!'):
+        return qif.Loader
+    return None
+
+def parse_file(filename, default_currency, default_date_format=None, loader_classes=None):
+    """Returns a loader that successfully parsed ``filename``.
+
+    We try ``loader_classes`` (:const:`LOADER_CLASSES` by default) in order and raise
+    ``FileFormatError`` if none of them fits.
+    """
+    if loader_classes is None:
+        loader_classes = LOADER_CLASSES
+    for loaderclass in loader_classes:
+        try:
+            loader = loaderclass(default_currency, default_date_format=default_date_format)
+            loader.parse(filename)
+            return loader
+        except FileFormatError:
+            pass
+    raise FileFormatError(tr('%s is of an unknown format.') % filename)
+
+def read_file_infos(loaderclass, filename, default_currency_code, default_date_format):
+    # Runs in worker processes, hence it being a module level function. We get a currency code
+    # rather than a currency because currencies registered by plugins don't exist in workers.
+    default_currency = Currency(default_currency_code)
+    loader = loaderclass(default_currency, default_date_format=default_date_format)
+    loader.parse(filename)
+    return loader.read_infos()
+
+def parse_files(filenames, default_currency, default_date_format=None, max_workers=None):
+    """Parses ``filenames`` and returns a ``(parsed, failed)`` tuple.
+
+    ``parsed`` is a list of ``(filename, loader, infos)`` in the order of ``filenames`` and
+    ``failed`` is the list of filenames we couldn't parse.
+
+    The format of each file is sniffed with :func:`sniff_loader_class`. Files that can be read in
+    another process are read in parallel and come back with their ``infos``, which have to be given
+    to ``loader.load()``. Other files are parsed here, the usual way, and come with ``None`` infos.
+    When a file doesn't fit its sniffed format, we fall back to trying all loaders in order. When
+    a worker process fails for any other reason, the file is parsed here.
+    """
+    def new_loader(loaderclass):
+        return loaderclass(default_currency, default_date_format=default_date_format)
+
+    loaderclasses = [sniff_loader_class(filename) for filename in filenames]
+    jobs = [
+        (index, loaderclass) for index, loaderclass in enumerate(loaderclasses)
+        if loaderclass in PARALLEL_LOADER_CLASSES
+    ]
+    results = [None] * len(filenames)
+    failed_classes = [None] * len(filenames)
+    if len(jobs) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    (index, loaderclass, filenames[index], executor.submit(
+                        read_file_infos, loaderclass, filenames[index], default_currency.code,
+                        default_date_format
+                    ))
+                    for index, loaderclass in jobs
+                ]
+                for index, loaderclass, filename, future in futures:
+                    try:
+                        results[index] = (filename, new_loader(loaderclass), future.result())
+                    except FileFormatError:
+                        # The sniffed format was wrong. Don't try that loader again below.
+                        loaderclasses[index] = None
+                        failed_classes[index] = loaderclass
+                    except Exception:
+                        # Unknown currency in the worker, broken pool, etc. We parse it below.
+                        logging.warning("Couldn't parse %s in a worker process", filename, exc_info=True)
+        except Exception:
+            # We couldn't use worker processes at all. Files not parsed yet are parsed below.
+            logging.warning("Couldn't parse files in worker processes", exc_info=True)
+    parsed = []
+    failed = []
+    for filename, loaderclass, failed_class, result in zip(
+            filenames, loaderclasses, failed_classes, results):
+        if result is None:
+            loader_classes = [c for c in LOADER_CLASSES if c is not failed_class]
+            if loaderclass is not None:
+                loader_classes = dedupe([loaderclass] + loader_classes)
+            try:
+                loader = parse_file(filename, default_currency, default_date_format, loader_classes)
+            except FileFormatError:
+                failed.append(filename)
+                continue
+            result = (filename, loader, None)
+        parsed.append(result)
+    return parsed, failed
@@ -28,6 +28,8 @@ class CsvField:
     Reference = 'reference'
 
 MERGABLE_FIELDS = {CsvField.Description, CsvField.Payee}
+# Number of lines at the beginning of a file that we look at to guess its CSV dialect.
+SNIFF_LINE_COUNT = 500
 
 class Loader(base.Loader):
     FILE_ENCODING = 'latin-1'
@@ -63,8 +65,9 @@ class Loader(base.Loader):
         content = infile.read()
         content = content.replace('\0', '')
         lines = content.split('\n')
-        stripped_lines = [line.strip() for line in lines]
-        stripped_lines = [line for line in lines if line and not line.startswith('#')]
+        # Sniffing is slow on big files, so we only sniff the beginning of the file.
+        head = lines[:SNIFF_LINE_COUNT]
+        stripped_lines = [line for line in head if line and not line.startswith('#')]
         try:
             self.dialect = csv.Sniffer().sniff('\n'.join(stripped_lines))
         except csv.Error:
@@ -75,9 +78,10 @@ class Loader(base.Loader):
             # delimiters per line has to be at least 2, but headers and/or footers can have less,
             # do to play on the safe side, we go with 1.5.
             DELIMITERS = set(';,\t|')
-            delim2count = {delim: content.count(delim) for delim in DELIMITERS}
+            head_content = '\n'.join(head)
+            delim2count = {delim: head_content.count(delim) for delim in DELIMITERS}
             delim, count = max(delim2count.items(), key=lambda x: x[1])
-            if count / len(lines) < 1.5:
+            if count / len(head) < 1.5:
                 raise FileFormatError()
 
             class ManualDialect(csv.excel):
@@ -104,30 +108,34 @@ class Loader(base.Loader):
         self.lines = lines
 
     def _parse_date_format(self, lines, ci):
+        # Returns the date format of the Date column, the lines that have a date, and a mapping of
+        # the strings in the Date column to their parsed dates. Lots of lines share the same date,
+        # so we clean and parse each distinct date string only once.
         date_index = ci[CsvField.Date]
+        str_dates = {line[date_index] for line in lines}
+        str2cleaned = {str_date: self.clean_date(str_date) for str_date in str_dates}
         lines_to_load = []
         for line in lines:
-            line = line[:]
-            cleaned_str_date = self.clean_date(line[date_index])
-            if cleaned_str_date is None:
+            if str2cleaned[line[date_index]] is None:
                 logging.warning('{0} is not a date. Ignoring line'.format(line[date_index]))
             else:
-                line[date_index] = cleaned_str_date
                 lines_to_load.append(line)
-        del line
-        str_dates = [line[date_index] for line in lines_to_load]
+        str_dates = {cleaned for cleaned in str2cleaned.values() if cleaned is not None}
         date_format = self.guess_date_format(str_dates)
         if date_format is None:
             raise FileLoadError(tr("The Date column has been set on a column that doesn't contain dates."))
-        return date_format, lines_to_load
+        str2date = {
+            str_date: self.parse_date_str(cleaned, date_format)
+            for str_date, cleaned in str2cleaned.items() if cleaned is not None
+        }
+        return date_format, lines_to_load, str2date
 
     def _check_amount_values(self, lines, ci):
-        for line in lines:
-            for attr in [CsvField.Amount, CsvField.Increase, CsvField.Decrease]:
-                if attr not in ci:
-                    continue
-                index = ci[attr]
-                value = line[index]
+        for attr in [CsvField.Amount, CsvField.Increase, CsvField.Decrease]:
+            if attr not in ci:
+                continue
+            index = ci[attr]
+            for value in {line[index] for line in lines}:
                 try:
                     self.parse_amount(value, self.default_currency)
                 except ValueError:
@@ -152,14 +160,14 @@ class Loader(base.Loader):
         if not (hasdate and hasamount):
             raise FileLoadError(tr("The Date and Amount columns must be set."))
         self.account_info.name = 'CSV Import'
-        self.parsing_date_format, lines_to_load = self._parse_date_format(lines, ci)
+        self.parsing_date_format, lines_to_load, str2date = self._parse_date_format(lines, ci)
         self._check_amount_values(lines_to_load, ci)
         for line in lines_to_load:
             self.start_transaction()
             for attr, index in ci.items():
                 value = line[index]
                 if attr == CsvField.Date:
-                    value = self.parse_date_str(value, self.parsing_date_format)
+                    value = str2date[value]
                 elif attr == CsvField.Increase:
                     attr = CsvField.Amount
                 elif attr == CsvField.Decrease:
@@ -0,0 +1,71 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import os.path as op
+import xml.etree.cElementTree as ET
+
+from ..saver.journal import journal_filename
+from . import native
+
+RECORD_END = '</record>\n'
+
+def has_journal(filename):
+    """Returns whether ``filename`` has a journal to replay."""
+    return op.exists(journal_filename(filename))
+
+def read_records(filename):
+    """Yields the records of the journal ``filename`` as XML elements.
+
+    A half-written record at the end of the journal (we crashed while writing it) is ignored.
+    """
+    try:
+        with open(filename, 'rt', encoding='utf-8') as fp:
+            content = fp.read()
+    except IOError:
+        return
+    for chunk in content.split(RECORD_END)[:-1]:
+        try:
+            yield ET.fromstring(chunk + RECORD_END)
+        except SyntaxError:
+            return
+
+class Loader(native.Loader):
+    """Loads a native snapshot and replays its journal (see :class:`.saver.journal.Journal`) on top
+    of it.
+
+    Changed transactions are read from the journal in place of their snapshot version and deleted
+    ones are skipped. Transactions added after the snapshot come last.
+    """
+    def parse(self, filename):
+        # id -> transaction element, or None if deleted.
+        self._id2element = {}
+        for record in read_records(journal_filename(filename)):
+            for element in record:
+                try:
+                    txn_id = int(element.attrib['id'])
+                except (KeyError, ValueError):
+                    continue
+                if element.tag == 'delete':
+                    self._id2element[txn_id] = None
+                else:
+                    self._id2element[txn_id] = element.find('transaction')
+        self._transaction_count = 0
+        native.Loader.parse(self, filename)
+
+    def _parse(self, infile):
+        native.Loader._parse(self, infile)
+        for txn_id, element in sorted(self._id2element.items()):
+            if txn_id >= self._transaction_count and element is not None:
+                native.Loader._read_transaction(self, element)
+
+    def _read_transaction(self, element):
+        txn_id = self._transaction_count
+        self._transaction_count += 1
+        if txn_id in self._id2element:
+            element = self._id2element[txn_id]
+            if element is None:
+                return
+        native.Loader._read_transaction(self, element)
@@ -9,37 +9,137 @@
 #
 # Sections refer to the OFX 1.0.3 spec.
 
-from itertools import dropwhile
+import codecs
+import re
 
 from ..exception import FileFormatError
-from .sgmllib import SGMLParser
 from . import base
 
-class Loader(SGMLParser, base.Loader):
+# Tokens of an OFX body, be it SGML (OFX 1.x) or XML (OFX 2.x). We used to feed OFX bodies to a
+# vendored copy of Python 2's ``sgmllib`` and we still follow its rules for tags, character and
+# entity references so that we read the same data out of the same files. One difference is that
+# we understand XML empty elements (``<TAG/>``).
+re_token = re.compile(r"""
+    (?P<data>[^<&]+)
+    |(?P<starttag><(?P<tag>[a-zA-Z][-_.a-zA-Z0-9]*)[^<>]*?(?P<empty>/?)(?:>|(?=<)))
+    |(?P<endtag></(?P<endtagname>[^<>]*)(?:>|(?=<)))
+    |(?P<ignored><!--.*?-->|<[!?][^>]*>)
+    |(?P<charref>&\#(?P<charnum>[0-9]+)(?:;|(?=[^0-9])))
+    |(?P<entityref>&(?P<entityname>[a-zA-Z][-.a-zA-Z0-9]*)(?:;|(?=[^a-zA-Z0-9])))
+    |(?P<literal>[<&])
+""", re.VERBOSE | re.DOTALL)
+re_xml_encoding = re.compile(rb'''encoding\s*=\s*["']([-\w.]+)["']''')
+re_body_start = re.compile(r'^<', re.MULTILINE)
+
+ENTITIES = {'lt': '<', 'gt': '>', 'amp': '&', 'quot': '"', 'apos': '\''}
+
+class Loader(base.Loader):
+    """Loads OFX and QFX files, SGML (OFX 1.x) or XML (OFX 2.x).
+
+    The body of the file is tokenized with :data:`re_token` and tags are dispatched to
+    ``start_<tag>`` and ``end_<tag>`` methods. Like in an SGML parser, tags with a start method
+    are pushed on a stack and closing a tag closes all the tags opened after it. In SGML OFX,
+    leaf elements aren't closed: their data ends at the next tag.
+    """
+    FILE_OPEN_MODE = 'rb'
     FILE_ENCODING = 'cp1252'
     NATIVE_DATE_FORMAT = '%Y%m%d'
 
     def __init__(self, default_currency, default_date_format=None):
-        SGMLParser.__init__(self)
         base.Loader.__init__(self, default_currency, default_date_format)
         self.data = ''
         self.data_handler = None
+        self._stack = []
+        self._tag2method = {}
 
     # --- Override
     def _parse(self, infile):
-        # First line is OFXHEADER (section 2.2.1)
-        line = '\n'
-        while line and not line.strip(): # skip the first lines if they're blank
-            line = infile.readline()
-        if line.strip() != 'OFXHEADER:100':
+        content = infile.read()
+        if content.startswith(codecs.BOM_UTF8):
+            content = content[len(codecs.BOM_UTF8):]
+        # skip the first lines if they're blank
+        firstline, _, rest = content.lstrip().partition(b'\n')
+        firstline = firstline.strip()
+        if firstline == b'OFXHEADER:100':
+            # SGML header (section 2.2.1)
+            encoding = self.FILE_ENCODING
+        elif firstline.startswith(b'<?xml') and b'<?OFX' in content[:1024]:
+            # XML declaration followed by the OFX processing instruction (OFX 2.x, section 2.2)
+            match = re_xml_encoding.search(firstline)
+            encoding = match.group(1).decode('ascii') if match else 'utf-8'
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                encoding = 'utf-8'
+        else:
             raise FileFormatError()
-        self.lines = list(infile)
+        text = rest.decode(encoding, errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+        # The body starts at the first line starting with a tag. Everything before is header.
+        match = re_body_start.search(text)
+        self.body = text[match.start():] if match is not None else ''
 
     def _load(self):
-        is_header = lambda line: not line.startswith('<')
-        for line in dropwhile(is_header, self.lines):
-            self.feed(line)
-        self.close()
+        finish_starttag = self._finish_starttag
+        finish_endtag = self._finish_endtag
+        for match in re_token.finditer(self.body):
+            kind = match.lastgroup
+            if kind == 'data' or kind == 'literal':
+                self.data += match.group()
+            elif kind == 'starttag':
+                tag = match.group('tag').lower()
+                finish_starttag(tag)
+                if match.group('empty'):
+                    finish_endtag(tag)
+            elif kind == 'endtag':
+                finish_endtag(match.group('endtagname').strip().lower())
+            elif kind == 'charref':
+                codepoint = int(match.group('charnum'))
+                if codepoint <= 127:
+                    self.handle_data(chr(codepoint))
+            elif kind == 'entityref':
+                replacement = ENTITIES.get(match.group('entityname'))
+                if replacement is not None:
+                    self.handle_data(replacement)
+        del self.body
+
+    # --- Private
+    def _get_method(self, prefix, tag):
+        key = (prefix, tag)
+        try:
+            return self._tag2method[key]
+        except KeyError:
+            result = self._tag2method[key] = getattr(self, prefix + tag, None)
+            return result
+
+    def _finish_starttag(self, tag):
+        method = self._get_method('start_', tag)
+        if method is None:
+            self.unknown_starttag(tag, [])
+        else:
+            self._stack.append(tag)
+            self.handle_starttag(tag, method, [])
+
+    def _finish_endtag(self, tag):
+        stack = self._stack
+        if not tag:
+            found = len(stack) - 1
+            if found < 0:
+                self.unknown_endtag(tag)
+                return
+        elif tag not in stack:
+            # An unbalanced end tag for which we have a method is ignored altogether.
+            if self._get_method('end_', tag) is None:
+                self.unknown_endtag(tag)
+            return
+        else:
+            found = len(stack) - 1 - stack[::-1].index(tag)
+        while len(stack) > found:
+            tag = stack.pop()
+            method = self._get_method('end_', tag)
+            if method is None:
+                self.unknown_endtag(tag)
+            else:
+                self.handle_endtag(tag, method)
 
     # --- Helper methods
 
@@ -53,11 +153,11 @@ class Loader(SGMLParser, base.Loader):
 
     def handle_starttag(self, tag, method, attributes):
         self.flush_data()
-        SGMLParser.handle_starttag(self, tag, method, attributes)
+        method(attributes)
 
     def handle_endtag(self, tag, method):
         self.flush_data()
-        SGMLParser.handle_endtag(self, tag, method)
+        method()
 
     def unknown_starttag(self, tag, attributes):
         self.flush_data()
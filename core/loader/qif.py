@@ -9,10 +9,10 @@
 import logging
 import re
 from collections import namedtuple, defaultdict
-from itertools import groupby, combinations
+from itertools import chain, groupby, combinations
 from operator import attrgetter
 
-from hscommon.util import first, stripfalse
+from hscommon.util import first
 
 from ..exception import FileFormatError
 from ..model.account import AccountType
@@ -41,6 +41,9 @@ re_not_amount = re.compile(r'[^\d.,\-]+')
 
 ENTRY_HEADERS = {'Type:Bank', 'Type:Invst', 'Type:Cash', 'Type:Oth A', 'Type:CCard', 'Type:Oth L'}
 
+# Number of entry dates we look at to guess the date format of a file. See Loader._parse().
+DATE_SAMPLE_SIZE = 100
+
 class BlockType:
     Account = 1
     Entry = 2
@@ -57,19 +60,100 @@ class Block:
         return first(line for line in self.lines if line.header == line_header)
 
 
+def remove_brackets(name):
+    if name.startswith('[') and name.endswith(']'):
+        return name[1:-1].strip()
+    else:
+        return name
+
 class Loader(base.Loader):
+    """Loads QIF files.
+
+    The file is streamed: blocks are read one at a time and fed to the base loader right away, so
+    we never hold more than one block in memory. Because of this, all the work happens in
+    :meth:`_parse` and :meth:`_load` has nothing left to do.
+
+    The date format is guessed from the first :const:`DATE_SAMPLE_SIZE` entries. If a later entry
+    has a date that doesn't fit that format, we guess again with the dates of all entries read so
+    far and re-parse the dates of the transactions we've already read.
+    """
     NATIVE_DATE_FORMAT = '%m/%d/%y'
     EXTRA_DATE_FORMATS = ['%m/%d/%Y'] # Also try the YYYY version of the date format in priority
+    # _post_load() needs to know which accounts had their own section in the file.
+    INFO_ATTRS = base.Loader.INFO_ATTRS + ['seen_account_names']
 
     def _parse(self, infile):
-        content = infile.read()
-        lines = stripfalse(content.split('\n'))
-        blocks = []
-        autoswitch_blocks = [] # blocks in the middle of an AutoSwitch option
+        self.seen_account_names = set()
+        self.autoswitch_blocks = [] # blocks in the middle of an AutoSwitch option
+        # Dates (the first D line of each entry) we've guessed our date format with.
+        self._str_dates = set()
+        # Date strings of each transaction info we've read, starting at transaction_infos[
+        # self._first_info_index]. Used to re-parse dates when we have to guess the date format
+        # again. We only keep the strings: infos are already held by transaction_infos.
+        self._first_info_index = len(self.transaction_infos)
+        self._info_str_dates = []
+        blocks = self._iter_blocks(infile)
+        sample = []
+        for block in blocks:
+            sample.append(block)
+            if block.type == BlockType.Entry:
+                self._str_dates.add(block.get_line('D').data)
+                if len(self._str_dates) >= DATE_SAMPLE_SIZE:
+                    break
+        if not sample:
+            raise FileFormatError()
+        self.parsing_date_format = self.guess_date_format(self._str_dates)
+        if self.parsing_date_format is None:
+            raise FileFormatError()
+        # "Empty" accounts, that is, accounts that aren't followed by entries, are read at the end,
+        # along with autoswitch blocks.
+        empty_account_blocks = []
+        account_block = None
+        for block in chain(sample, blocks):
+            if account_block is not None:
+                if block.type == BlockType.Entry:
+                    self._read_account_block(account_block)
+                else:
+                    empty_account_blocks.append(account_block)
+                account_block = None
+            if block.type == BlockType.Account:
+                account_block = block
+            elif block.type == BlockType.Entry:
+                self._read_entry_block(block)
+        if account_block is not None:
+            empty_account_blocks.append(account_block)
+        del self._str_dates
+        del self._info_str_dates
+        self.flush_account()
+        # For accounts that haven't been added in normal blocks, we complete the list with autoswitch
+        # blocks (so that we can have correct types for income/expense accounts)
+        for block in chain(self.autoswitch_blocks, empty_account_blocks):
+            if block.type == BlockType.Account:
+                self.start_account()
+                for header, data in block.lines:
+                    self._read_account_line(header, data)
+                if self.account_info.name in self.seen_account_names:
+                    self.cancel_account()
+                else:
+                    self.seen_account_names.add(self.account_info.name)
+                    self.flush_account()
+        del self.autoswitch_blocks
+
+    def _load(self):
+        pass # Everything was loaded in _parse()
+
+    # --- Private
+    def _iter_blocks(self, infile):
+        # Yields blocks to read in order. Blocks in the middle of an AutoSwitch option are put aside
+        # in self.autoswitch_blocks instead.
         block = Block()
         current_block_type = BlockType.Entry
         autoswitch_mode = False
-        for line in lines:
+        for line in infile:
+            if line.endswith('\n'):
+                line = line[:-1]
+            if not line:
+                continue
             header, data = line[0], line[1:].strip()
             if header == '!':
                 if data == 'Account':
@@ -79,8 +163,8 @@ class Loader(base.Loader):
                     if autoswitch_mode:
                         # We have a buggy qif that doesn't clear its autoswitch flag. The last block
                         # we added to autoswitch actually belonged to normal blocks. move it.
-                        if autoswitch_blocks:
-                            blocks.append(autoswitch_blocks.pop())
+                        if self.autoswitch_blocks:
+                            yield self.autoswitch_blocks.pop()
                         autoswitch_mode = False
                 elif data.startswith('Type:'): # if it doesn't, just ignore it
                     current_block_type = BlockType.Other
@@ -98,116 +182,108 @@ class Loader(base.Loader):
                         if date_line is None or self.clean_date(date_line.data) is None:
                             block.type = BlockType.Other
                     if autoswitch_mode:
-                        autoswitch_blocks.append(block)
+                        self.autoswitch_blocks.append(block)
                     else:
-                        blocks.append(block)
+                        yield block
                 block = Block()
                 if current_block_type == BlockType.Account and not autoswitch_mode:
                     current_block_type = BlockType.Entry
             if header != '^':
                 block.lines.append(Line(header, data))
-        del block
-        if not blocks:
-            raise FileFormatError()
-        logging.debug('This is a QIF file. {0} blocks'.format(len(blocks)))
-        entry_blocks = [block for block in blocks if block.type == BlockType.Entry]
-        date_lines = (block.get_line('D') for block in entry_blocks)
-        str_dates = [line.data for line in date_lines if line]
-        self.parsing_date_format = self.guess_date_format(str_dates)
+
+    def _parse_dates(self, str_dates):
+        # The last date that we can parse wins.
+        result = None
+        for str_date in str_dates:
+            try:
+                result = self.parse_date_str(str_date, self.parsing_date_format)
+            except ValueError:
+                pass
+        return result
+
+    def _reguess_date_format(self, str_date):
+        logging.debug("Date {0} doesn't fit {1}. Guessing again.".format(str_date, self.parsing_date_format))
+        # Entries read after the sample have to fit the new format too.
+        self._str_dates.update(str_dates[0] for str_dates in self._info_str_dates)
+        self._str_dates.add(str_date)
+        self.parsing_date_format = self.guess_date_format(self._str_dates)
         if self.parsing_date_format is None:
             raise FileFormatError()
-        self.blocks = blocks
-        self.autoswitch_blocks = autoswitch_blocks
+        infos = self.transaction_infos[self._first_info_index:]
+        for info, str_dates in zip(infos, self._info_str_dates):
+            info.date = self._parse_dates(str_dates)
+            if info.date is None:
+                raise FileFormatError()
 
-    def _load(self):
-        def remove_brackets(name):
-            if name.startswith('[') and name.endswith(']'):
-                return name[1:-1].strip()
-            else:
-                return name
+    def _read_account_block(self, block):
+        self.start_account()
+        for header, data in block.lines:
+            self._read_account_line(header, data)
+        if self.account_info.name:
+            self.seen_account_names.add(self.account_info.name)
 
-        def parse_account_line(header, data):
-            if header == 'N':
-                self.account_info.name = data.strip()
-            if header == 'T' and data in ('Oth L', 'CCard'):
-                self.account_info.type = AccountType.Liability
+    def _read_account_line(self, header, data):
+        if header == 'N':
+            self.account_info.name = data.strip()
+        if header == 'T' and data in ('Oth L', 'CCard'):
+            self.account_info.type = AccountType.Liability
 
-        def parse_split_line(header, data):
-            if header == 'S':
-                data = remove_brackets(data)
-                self.split_info.account = data
-            elif header == 'E':
-                self.split_info.memo = data
-            elif header == '$':
-                self.split_info.amount = re_not_amount.sub('', data)
-                self.split_info.amount_reversed = True # Split amounts in QIF are REVERSED
-
-        def parse_entry_line(header, data):
-            if header == 'D':
+    def _read_entry_block(self, block):
+        if not self.seen_account_names:
+            # If no account has been seen yet, add the txn to a default 'Account' one
+            self.account_info.name = 'Account'
+        info = self.transaction_info
+        str_dates = []
+        seen_split_fields = set()
+        for header, data in block.lines:
+            if header in {'S', 'E', '$'}: # splits field
+                if header in seen_split_fields: # must flush the split
+                    self.flush_split()
+                    seen_split_fields.clear()
+                self._read_split_line(header, data)
+                seen_split_fields.add(header)
+            elif header == 'D':
+                str_dates.append(data)
                 try:
-                    self.transaction_info.date = self.parse_date_str(data, self.parsing_date_format)
+                    info.date = self.parse_date_str(data, self.parsing_date_format)
                 except ValueError:
-                    pass
-            elif header == 'M':
-                self.transaction_info.description = data
-            elif header == 'P':
-                self.transaction_info.payee = data
-            elif header == 'N':
-                self.transaction_info.checkno = data
-            elif header == 'L':
-                data = remove_brackets(data)
-                self.transaction_info.transfer = data
-            elif header == 'T':
-                self.transaction_info.amount = re_not_amount.sub('', data)
-            elif header == '!': # yeah, this thing is in the entry data...
-                if data in ('Type:CCard', 'Type:Oth L'):
-                    self.account_info.type = AccountType.Liability
+                    if len(str_dates) == 1:
+                        # The first date of an entry is always valid for the whole file. Our
+                        # guess, made on a sample, was wrong.
+                        self._reguess_date_format(data)
+                        info.date = self.parse_date_str(data, self.parsing_date_format)
+            else:
+                self._read_entry_line(header, data)
+        info_count = len(self.transaction_infos)
+        self.flush_transaction()
+        if len(self.transaction_infos) > info_count: # invalid infos aren't kept
+            self._info_str_dates.append(tuple(str_dates))
 
-        self.seen_account_names = set()
-        # Send "empty" accounts to the autoswitch_blocks list
-        for block, nextblock in zip(self.blocks[:], self.blocks[1:]+[None]):
-            if block.type == BlockType.Account and (nextblock is None or nextblock.type != BlockType.Entry):
-                self.autoswitch_blocks.append(block)
-                self.blocks.remove(block)
-        for block in self.blocks:
-            block_type = block.type
-            lines = block.lines
-            if block_type == BlockType.Account:
-                self.start_account()
-                for header, data in lines:
-                    parse_account_line(header, data)
-                if self.account_info.name:
-                    self.seen_account_names.add(self.account_info.name)
-            elif block_type == BlockType.Entry:
-                if not self.seen_account_names:
-                    # If no account has been seen yet, add the txn to a default 'Account' one
-                    self.account_info.name = 'Account'
-                seen_split_fields = set()
-                for header, data in lines:
-                    if header in {'S', 'E', '$'}: # splits field
-                        if header in seen_split_fields: # must flush the split
-                            self.flush_split()
-                            seen_split_fields.clear()
-                        parse_split_line(header, data)
-                        seen_split_fields.add(header)
-                        continue
-                    parse_entry_line(header, data)
-                self.flush_transaction()
-        self.flush_account()
-        # For accounts that haven't been added in normal blocks, we complete the list with autoswitch
-        # blocks (so that we can have correct types for income/expense accounts)
-        for block in self.autoswitch_blocks:
-            block_type = block.type
-            lines = block.lines
-            if block_type == BlockType.Account:
-                self.start_account()
-                for header, data in lines:
-                    parse_account_line(header, data)
-                if self.account_info.name in self.seen_account_names:
-                    self.cancel_account()
-                else:
-                    self.seen_account_names.add(self.account_info.name)
-                    self.flush_account()
+    def _read_entry_line(self, header, data):
+        if header == 'M':
+            self.transaction_info.description = data
+        elif header == 'P':
+            self.transaction_info.payee = data
+        elif header == 'N':
+            self.transaction_info.checkno = data
+        elif header == 'L':
+            data = remove_brackets(data)
+            self.transaction_info.transfer = data
+        elif header == 'T':
+            self.transaction_info.amount = re_not_amount.sub('', data)
+        elif header == '!': # yeah, this thing is in the entry data...
+            if data in ('Type:CCard', 'Type:Oth L'):
+                self.account_info.type = AccountType.Liability
+
+    def _read_split_line(self, header, data):
+        if header == 'S':
+            data = remove_brackets(data)
+            self.split_info.account = data
+        elif header == 'E':
+            self.split_info.memo = data
+        elif header == '$':
+            self.split_info.amount = re_not_amount.sub('', data)
+            self.split_info.amount_reversed = True # Split amounts in QIF are REVERSED
 
     def _post_load(self):
         # The reader of this piece of code has to understand that QIF duplicate transaction matching
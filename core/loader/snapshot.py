@@ -0,0 +1,150 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from collections import defaultdict
+from datetime import date
+import sqlite3 as sqlite
+
+from hscommon.util import tryint
+from hscommon.trans import tr
+
+from ..exception import FileFormatError
+from ..model.amount import Amount
+from ..model.currency import Currency
+from ..saver.snapshot import FORMAT_NAME, FORMAT_VERSION
+from .base import SplitInfo, TransactionInfo
+from . import base
+
+SQLITE_HEADER = b'SQLite format 3\0'
+
+def ordinal2date(ordinal):
+    return date.fromordinal(ordinal) if ordinal is not None else None
+
+# Queries whose rows are read during parsing, by name.
+QUERIES = [
+    ('properties', "select name, value from properties"),
+    ('groups', "select name, type from groups order by rowid"),
+    ('accounts', "select * from accounts order by rowid"),
+    ('splits', "select * from splits order by rowid"),
+    ('transactions', "select * from transactions order by id"),
+    ('recurrence_dates', "select * from recurrence_dates order by rowid"),
+    ('recurrences', "select * from recurrences order by id"),
+    ('budgets', "select * from budgets order by rowid"),
+]
+
+class Loader(base.Loader):
+    """Loads moneyGuru snapshots, as written by :func:`.saver.snapshot.save`.
+
+    Amounts and dates in snapshots are already in their binary form, so infos we produce hold
+    :class:`.Amount` and ``datetime.date`` instances rather than strings to parse.
+
+    All rows are read during parsing, so that the database connection doesn't outlive it.
+    """
+    FILE_OPEN_MODE = 'rb'
+
+    def _parse(self, infile):
+        if infile.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+            raise FileFormatError()
+        try:
+            con = sqlite.connect(infile.name)
+        except sqlite.DatabaseError:
+            raise FileFormatError()
+        try:
+            meta = dict(con.execute("select name, value from meta"))
+            if meta.get('format') != FORMAT_NAME or tryint(meta.get('version')) > FORMAT_VERSION:
+                raise FileFormatError()
+            self._rows = {name: con.execute(query).fetchall() for name, query in QUERIES}
+        except sqlite.DatabaseError:
+            raise FileFormatError()
+        finally:
+            con.close()
+        self.document_id = meta.get('document_id')
+
+    def _load(self):
+        def row2amount(value, code):
+            if code is None:
+                return 0
+            currency = Currency.by_code.get(code)
+            if currency is None:
+                msg = tr(
+                    "Unsupported currency: {}. Aborting load. Did you disable a currency plugin?"
+                ).format(code)
+                raise FileFormatError(msg)
+            return Amount(value / 10 ** currency.exponent, currency)
+
+        for name, value in self._rows['properties']:
+            if name == 'default_currency':
+                value = Currency.by_code.get(value)
+            else:
+                value = tryint(value, default=None)
+            if name and value is not None:
+                self.properties[name] = value
+        for name, type in self._rows['groups']:
+            self.start_group()
+            self.group_info.name = name
+            self.group_info.type = type
+            self.flush_group()
+        for row in self._rows['accounts']:
+            self.start_account()
+            info = self.account_info
+            (info.name, info.currency, info.type, info.group, info.reference,
+                info.account_number, inactive, info.notes) = row
+            info.inactive = bool(inactive)
+            self.flush_account()
+        id2splits = defaultdict(list)
+        for row in self._rows['splits']:
+            txn_id, account, amount, currency, memo, reference, recdate = row
+            split_info = SplitInfo(account, row2amount(amount, currency))
+            split_info.memo = memo
+            split_info.reference = reference
+            split_info.reconciliation_date = ordinal2date(recdate)
+            id2splits[txn_id].append(split_info)
+        id2txn = {}
+        for row in self._rows['transactions']:
+            txn_id, root, ordinal, description, payee, checkno, notes, mtime = row
+            info = TransactionInfo()
+            info.date = date.fromordinal(ordinal)
+            info.description = description
+            info.payee = payee
+            info.checkno = checkno
+            info.notes = notes
+            info.mtime = mtime
+            info.splits = id2splits[txn_id]
+            if root:
+                self.start_transaction()
+                self.transaction_info = info
+                self.flush_transaction()
+            else:
+                id2txn[txn_id] = info
+        id2dates = defaultdict(list)
+        for row in self._rows['recurrence_dates']:
+            recurrence_id, kind, ordinal, txn_id = row
+            id2dates[recurrence_id].append((kind, date.fromordinal(ordinal), id2txn.get(txn_id)))
+        for row in self._rows['recurrences']:
+            recurrence_id, repeat_type, repeat_every, stop_date, ref_id = row
+            info = self.recurrence_info
+            info.repeat_type = repeat_type
+            info.repeat_every = repeat_every
+            info.stop_date = ordinal2date(stop_date)
+            info.transaction_info = id2txn[ref_id]
+            for kind, d, txn in id2dates[recurrence_id]:
+                if kind == 'change':
+                    info.date2globalchange[d] = txn
+                else:
+                    info.date2exception[d] = txn
+            self.flush_recurrence()
+        for row in self._rows['budgets']:
+            account, repeat_type, every, amount, currency, notes, target, start, stop = row
+            info = self.budget_info
+            info.account = account
+            info.repeat_type = repeat_type
+            info.repeat_every = every
+            info.amount = row2amount(amount, currency)
+            info.notes = notes
+            info.target = target
+            info.start_date = ordinal2date(start)
+            info.stop_date = ordinal2date(stop)
+            self.flush_budget()
@@ -4,9 +4,10 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
+import itertools
 from functools import partial
 
-from .entry import EntryList
+from .entry import EntryList, ColumnarEntryList, USE_COLUMNAR_ENTRIES
 from .sort import sort_string
 from ..exception import DuplicateAccountNameError
 from ..const import Const
@@ -35,6 +36,10 @@ class AccountType:
 NOT_GIVEN = Const("NOT_GIVEN")
 ACCOUNT_SORT_KEY = lambda a: (AccountType.InOrder.index(a.type), sort_string(a.name))
 
+def normalize_name(name):
+    """Returns ``name`` in the form used to compare account names."""
+    return name.lower().strip()
+
 def sort_accounts(accounts):
     """Sort accounts according first to their type, then to their name.
     """
@@ -71,7 +76,7 @@ class Account:
         self.notes = ''
         #: *readonly*. :class:`.EntryList` belonging to that account. This list is computed from
         #: :attr:`.Document.transactions` by the :class:`.Oven`.
-        self.entries = EntryList(self)
+        self.entries = ColumnarEntryList(self) if USE_COLUMNAR_ENTRIES else EntryList(self)
 
     def __repr__(self):
         return '<Account %r>' % self.name
@@ -158,13 +163,56 @@ class AccountList(list):
     ``default_currency`` is the currency that we want new accounts (created in :meth:`find`) to
     have.
 
+    To avoid scanning the whole list on each :meth:`find`, we index our accounts by normalized name,
+    account number and reference. Whenever one of those attributes is changed outside of
+    :meth:`set_account_name`, :meth:`reindex` has to be called.
+
     Subclasses ``list``.
     """
     def __init__(self, default_currency):
         list.__init__(self)
         self.default_currency = default_currency
         self.auto_created = set()
+        # account -> insertion order, which is our list order. Lets us compare positions without
+        # calling list.index().
+        self._account2order = {}
+        self._order_counter = itertools.count()
+        self._clear_index()
+
+    # --- Private
+    def _clear_index(self):
+        # For each of these dicts, key -> accounts having that key, in list order.
+        self._name2accounts = {}
+        self._number2accounts = {}
+        self._reference2accounts = {}
+        # account -> (name, number, reference) keys under which it is indexed
+        self._account2keys = {}
+
+    def _index(self, account, keep_order=False):
+        keys = (normalize_name(account.name), account.account_number, account.reference)
+        self._account2keys[account] = keys
+        for key, key2accounts in zip(keys, self._indexes()):
+            if key is None or key == '':
+                continue
+            accounts = key2accounts.setdefault(key, [])
+            accounts.append(account)
+            if keep_order and len(accounts) > 1:
+                accounts.sort(key=self._account2order.__getitem__)
+
+    def _indexes(self):
+        return (self._name2accounts, self._number2accounts, self._reference2accounts)
+
+    def _unindex(self, account):
+        keys = self._account2keys.pop(account)
+        for key, key2accounts in zip(keys, self._indexes()):
+            accounts = key2accounts.get(key)
+            if accounts is None:
+                continue
+            accounts.remove(account)
+            if not accounts:
+                del key2accounts[key]
 
+    # --- Public
     def add(self, account):
         """Adds ``account`` to the list.
 
@@ -172,10 +220,14 @@ class AccountList(list):
         """
         if self.find_reference(account.reference) is None:
             list.append(self, account)
+            self._account2order[account] = next(self._order_counter)
+            self._index(account)
 
     def clear(self):
         """Removes all elements from the list."""
         del self[:]
+        self._account2order = {}
+        self._clear_index()
 
     def filter(self, group=NOT_GIVEN, type=NOT_GIVEN):
         """Returns all accounts of the given ``type`` and/or ``group``.
@@ -196,12 +248,19 @@ class AccountList(list):
         If ``auto_create_type`` is not ``None`` and no account is found, create an account of type
         ``auto_create_type`` and return it.
         """
-        normalized = name.lower().strip()
-        for account in self:
-            if account.name.lower().strip() == normalized:
-                return account
-            elif account.account_number and normalized.startswith(account.account_number):
-                return account
+        normalized = normalize_name(name)
+        candidates = self._name2accounts.get(normalized, [])[:1]
+        if self._number2accounts:
+            # Accounts with a number matching the start of the name also match.
+            for length in range(1, len(normalized) + 1):
+                accounts = self._number2accounts.get(normalized[:length])
+                if accounts:
+                    candidates.append(accounts[0])
+        if candidates:
+            # When many accounts match, it's the first one in the list that we want.
+            if len(candidates) > 1:
+                return min(candidates, key=self._account2order.__getitem__)
+            return candidates[0]
         if auto_create_type:
             account = Account(name.strip(), self.default_currency, type=auto_create_type)
             self.add(account)
@@ -212,9 +271,8 @@ class AccountList(list):
         """Returns the account with ``reference`` or ``None`` if it isn't there."""
         if reference is None:
             return None
-        for account in self:
-            if account.reference == reference:
-                return account
+        accounts = self._reference2accounts.get(reference)
+        return accounts[0] if accounts else None
 
     def has_multiple_currencies(self):
         """Returns whether there's at least one account with a different currency.
@@ -234,8 +292,27 @@ class AccountList(list):
     def remove(self, account):
         """Removes ``account`` from the list."""
         list.remove(self, account)
+        del self._account2order[account]
+        self._unindex(account)
         self.auto_created.discard(account)
 
+    def reindex(self, accounts=None):
+        """Updates the name, number and reference index for ``accounts``.
+
+        Call this after having changed the name, account number or reference of accounts in the
+        list. If ``accounts`` is ``None``, the whole index is rebuilt.
+        """
+        if accounts is None:
+            self._clear_index()
+            for account in self:
+                self._index(account)
+            return
+        accounts = [a for a in accounts if a in self._account2keys]
+        for account in accounts:
+            self._unindex(account)
+        for account in accounts:
+            self._index(account, keep_order=True)
+
     def set_account_name(self, account, new_name):
         """Rename ``account`` to ``new_name``.
 
@@ -247,6 +324,7 @@ class AccountList(list):
         if (other is not None) and (other is not account):
             raise DuplicateAccountNameError()
         account.name = new_name.strip()
+        self.reindex([account])
 
 
 class GroupList(list):
@@ -41,6 +41,8 @@ re_decimal_sep_2 = re.compile(r"[,.](?=\d{1,2}$)")
 re_decimal_sep_x = re.compile(r"[,.](?=\d{1,10}$)")
 # A valid amount, once it has been pre-processed
 re_amount = re.compile(r"\d+\.\d+|\.\d+|\d+")
+# An amount as format_amount() writes it with its default arguments, such as "CAD -42.54"
+re_normalized_amount = re.compile(r"^(?:([A-Z]{3}) )?-?\d+(?:\.(\d+))?$")
 
 def format_amount(
         amount, default_currency=None, blank_zero=False, zero_currency=None, decimal_sep='.',
@@ -165,6 +167,36 @@ def parse_amount_single(string, exponent, auto_decimal_place, parens_for_negativ
             value = -value
     return value
 
+def parse_normalized_amount(string, default_currency=None):
+    """Returns an :class:`Amount` from ``string`` if it's a normalized amount, ``None`` otherwise.
+
+    Normalized amounts are amounts written by :func:`format_amount` with its default arguments:
+    an optional currency code followed by a plain decimal number. This is what we save in our
+    documents, and we can parse those much faster than with :func:`parse_amount`.
+
+    ``None`` is also returned for normalized amounts that :func:`parse_amount` would parse
+    differently, such as "1.234" in a currency with 2 decimal places (which it reads as having a
+    thousands separator).
+    """
+    m = re_normalized_amount.match(string)
+    if m is None:
+        return None
+    code, decimals = m.groups()
+    if code is None:
+        currency = default_currency
+    else:
+        currency = Currency.by_code.get(code)
+        string = string[4:]
+    if currency is None:
+        return None
+    if decimals is not None:
+        exponent = currency.exponent
+        max_decimals = 10 if exponent >= 3 else 2 if exponent == 2 else 0
+        if len(decimals) > max_decimals:
+            return None
+    value = float(string)
+    return Amount(value, currency) if value else 0
+
 def parse_amount(
         string, default_currency=None, with_expression=True, auto_decimal_place=False,
         strict_currency=False):
@@ -190,6 +222,10 @@ def parse_amount(
     if string is None or not string.strip():
         return 0
 
+    if not auto_decimal_place:
+        amount = parse_normalized_amount(string, default_currency)
+        if amount is not None:
+            return amount
     currency = None
     m = re_currency.search(string)
     if m is not None:
@@ -6,26 +6,110 @@
 # which should be included with this package. The terms are also available at 
 # http://www.gnu.org/licenses/gpl-3.0.html
 
+import bisect
+from collections import Counter
+
 from hscommon.util import dedupe
 
 from .sort import sort_string
 
+class CompletionIndex:
+    """Index of completion candidates, searchable by prefix.
+
+    Candidates are kept sorted by their normalized (:func:`.sort_string`) and stripped form, which
+    lets us find those starting with a partial value by bisection. Each candidate is ranked by its
+    highest mtime, ties going to the candidate that was added first.
+
+    The same value can be added more than once, with different mtimes. It stays in the index until
+    all its occurrences are removed.
+
+    :param candidates: An optional list of candidates to add, the most likely candidate first.
+    """
+    def __init__(self, candidates=None):
+        # sorted list of (normalized, value)
+        self._keys = []
+        # value -> Counter of the mtimes it has been added with
+        self._value2mtimes = {}
+        # value -> (highest mtime, -insertion order)
+        self._value2rank = {}
+        self._order = 0
+        self._values = None
+        if candidates:
+            for index, candidate in enumerate(candidates):
+                self.add(candidate, -index)
+
+    def __len__(self):
+        return len(self._value2mtimes)
+
+    def _rank(self, value):
+        return self._value2rank[value]
+
+    def add(self, value, mtime):
+        """Adds an occurrence of ``value`` modified at ``mtime``."""
+        mtimes = self._value2mtimes.get(value)
+        if mtimes is None:
+            mtimes = self._value2mtimes[value] = Counter()
+            bisect.insort(self._keys, (sort_string(value.strip()), value))
+            self._order += 1
+            self._value2rank[value] = (mtime, -self._order)
+        else:
+            maxmtime, order = self._value2rank[value]
+            if mtime > maxmtime:
+                self._value2rank[value] = (mtime, order)
+        mtimes[mtime] += 1
+        self._values = None
+
+    def remove(self, value, mtime):
+        """Removes an occurrence of ``value`` that was added with ``mtime``."""
+        mtimes = self._value2mtimes[value]
+        mtimes[mtime] -= 1
+        if mtimes[mtime] <= 0:
+            del mtimes[mtime]
+        if not mtimes:
+            key = (sort_string(value.strip()), value)
+            del self._keys[bisect.bisect_left(self._keys, key)]
+            del self._value2mtimes[value]
+            del self._value2rank[value]
+        else:
+            maxmtime, order = self._value2rank[value]
+            if mtime == maxmtime and mtime not in mtimes:
+                self._value2rank[value] = (max(mtimes), order)
+        self._values = None
+
+    def completions(self, partial):
+        """Returns the stripped candidates starting with ``partial``, the most likely first.
+
+        Case and diacritics are ignored.
+        """
+        partial = sort_string(partial)
+        if not partial:
+            return []
+        keys = self._keys
+        index = bisect.bisect_left(keys, (partial, ))
+        found = []
+        while index < len(keys) and keys[index][0].startswith(partial):
+            found.append(keys[index][1])
+            index += 1
+        found.sort(key=self._rank, reverse=True)
+        return dedupe(value.strip() for value in found)
+
+    def values(self):
+        """Returns a list of all candidates, the most likely first."""
+        if self._values is None:
+            self._values = sorted(self._value2mtimes, key=self._rank, reverse=True)
+        return self._values[:]
+
+
 class CompletionList:
-    def __init__(self, partial, candidates):
+    def __init__(self, partial, index):
         """Build a completion list.
 
         'partial' is the partial value to be completed
-        'candidates' is the list of candidate values to be tried, the most likely candidate first."""
+        'index' is the :class:`CompletionIndex` of candidate values to be tried."""
         if not partial:
             self._completions = None
             return
-        partial = sort_string(partial)
-        candidates = dedupe(c.strip() for c in candidates)
-        self._completions = []
-        for candidate in candidates:
-            normalized = sort_string(candidate)
-            if normalized.startswith(partial):
-                self._completions.append(candidate)
+        self._completions = index.completions(partial)
         self._completions.reverse()
         if self._completions:
             self._index = len(self._completions) - 1
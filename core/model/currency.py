@@ -10,7 +10,9 @@
 easily figure out their exchange value.
 """
 
+import bisect
 import os
+from array import array
 from datetime import datetime, date, timedelta
 import logging
 import sqlite3 as sqlite
@@ -159,6 +161,9 @@ CAD = Currency.register('CAD', 'Canadian dollar', latest_rate=1)
 def date2str(date):
     return '%d%02d%02d' % (date.year, date.month, date.day)
 
+def str2date(s):
+    return date(int(s[:4]), int(s[4:6]), int(s[6:8]))
+
 class RatesDB:
     """Stores exchange rates for currencies.
 
@@ -166,7 +171,9 @@ class RatesDB:
     The rates are represented as float and represent the value of the currency in CAD.
     """
     def __init__(self, db_or_path=':memory:', async=True):
-        self._cache = {} # {(date, currency): CAD value
+        # currency -> (ordinals, values). Rates of a currency, sorted by date, read from the DB the
+        # first time we need them.
+        self._currency2rates = {}
         self.db_or_path = db_or_path
         if isinstance(db_or_path, str):
             self.con = sqlite.connect(str(db_or_path))
@@ -178,16 +185,22 @@ class RatesDB:
         self._fetched_values = Queue()
         self._fetched_ranges = {} # a currency --> (start, end) map
 
-    def _execute(self, *args, **kwargs):
+    def _execute(self, sql, params=(), many=False):
+        def execute():
+            method = self.con.executemany if many else self.con.execute
+            return method(sql, params)
+
         def create_tables():
             # date is stored as a TEXT YYYYMMDD
             sql = "create table rates(date TEXT, currency TEXT, rate REAL NOT NULL)"
             self.con.execute(sql)
             sql = "create unique index idx_rate on rates (date, currency)"
             self.con.execute(sql)
+            # We're starting over with an empty DB, whatever rates we loaded are gone.
+            self.clear_cache()
 
         try:
-            return self.con.execute(*args, **kwargs)
+            return execute()
         except sqlite.OperationalError: # new db, or other problems
             try:
                 create_tables()
@@ -204,20 +217,30 @@ class RatesDB:
             else:
                 self.con = sqlite.connect(':memory:')
             create_tables()
-        return self.con.execute(*args, **kwargs) # try again
-
-    def _seek_value_in_CAD(self, str_date, currency_code):
+        return execute() # try again
+
+    def _rates(self, currency_code):
+        # Returns the (ordinals, values) arrays for currency_code, loading them if needed.
+        rates = self._currency2rates.get(currency_code)
+        if rates is None:
+            ordinals = array('l')
+            values = array('d')
+            sql = "select date, rate from rates where currency = ? order by date"
+            for str_date, rate in self._execute(sql, [currency_code]).fetchall():
+                ordinals.append(str2date(str_date).toordinal())
+                values.append(rate)
+            rates = self._currency2rates[currency_code] = (ordinals, values)
+        return rates
+
+    def _seek_value_in_CAD(self, date, currency_code):
         if currency_code == 'CAD':
             return 1
-
-        def seek(date_op, desc):
-            sql = "select rate from rates where date %s ? and currency = ? order by date %s limit 1" % (date_op, desc)
-            cur = self._execute(sql, [str_date, currency_code])
-            row = cur.fetchone()
-            if row:
-                return row[0]
-
-        return seek('<=', 'desc') or seek('>=', '') or Currency(currency_code).latest_rate
+        ordinals, values = self._rates(currency_code)
+        if not ordinals:
+            return Currency(currency_code).latest_rate
+        # We use the rate of the nearest previous date, or the first rate if there's none.
+        index = bisect.bisect_right(ordinals, date.toordinal()) - 1
+        return values[max(index, 0)]
 
     def _ensure_filled(self, date_start, date_end, currency_code):
         """Make sure that the cache contains *something* for each of the dates in the range.
@@ -230,32 +253,44 @@ class RatesDB:
         # provider gives it to us.
         if date_end >= date.today():
             date_end = date.today() - timedelta(1)
-        sql = "select rate from rates where date = ? and currency = ?"
+        sql = "select date, rate from rates where currency = ? and date >= ? and date <= ?"
+        cur = self._execute(sql, [currency_code, date2str(date_start), date2str(date_end)])
+        existing = dict(cur.fetchall())
+        fills = []
+        nearby_rate = None
         for curdate in iterdaterange(date_start, date_end):
-            cur = self._execute(sql, [date2str(curdate), currency_code])
-            if cur.fetchone() is None:
-                nearby_rate = self._seek_value_in_CAD(date2str(curdate), currency_code)
-                self.set_CAD_value(curdate, currency_code, nearby_rate)
-                logging.debug("Filled currency void for %s at %s (value: %2.2f)", currency_code, curdate, nearby_rate)
+            str_date = date2str(curdate)
+            if str_date in existing:
+                nearby_rate = existing[str_date]
+                continue
+            if nearby_rate is None:
+                # We only have to seek for the first void of a run. Following voids get the same
+                # rate as the day before them.
+                nearby_rate = self._seek_value_in_CAD(curdate, currency_code)
+            fills.append((curdate, currency_code, nearby_rate))
+            logging.debug("Filled currency void for %s at %s (value: %2.2f)", currency_code, curdate, nearby_rate)
+        self.set_CAD_values(fills)
 
     def _save_fetched_rates(self):
         while True:
             try:
                 rates, currency, fetch_start, fetch_end = self._fetched_values.get_nowait()
                 logging.debug("Saving %d rates for the currency %s", len(rates), currency)
+                rows = []
                 for rate_date, rate in rates:
                     if not rate:
                         logging.debug("Empty rate for %s. Skipping", rate_date)
                         continue
                     logging.debug("Saving rate %2.2f for %s", rate, rate_date)
-                    self.set_CAD_value(rate_date, currency, rate)
+                    rows.append((rate_date, currency, rate))
+                self.set_CAD_values(rows)
                 self._ensure_filled(fetch_start, fetch_end, currency)
                 logging.debug("Finished saving rates for currency %s", currency)
             except Empty:
                 break
 
     def clear_cache(self):
-        self._cache = {}
+        self._currency2rates = {}
 
     def date_range(self, currency_code):
         """Returns (start, end) of the cached rates for currency.
@@ -283,35 +318,38 @@ class RatesDB:
         # We want to check self._fetched_values for rates to add.
         if not self._fetched_values.empty():
             self._save_fetched_rates()
-        # This method is a bottleneck and has been optimized for speed.
-        value1 = None
-        value2 = None
-        if currency1_code == 'CAD':
-            value1 = 1
-        else:
-            value1 = self._cache.get((date, currency1_code))
-        if currency2_code == 'CAD':
-            value2 = 1
-        else:
-            value2 = self._cache.get((date, currency2_code))
-        if value1 is None or value2 is None:
-            str_date = date2str(date)
-            if value1 is None:
-                value1 = self._seek_value_in_CAD(str_date, currency1_code)
-                self._cache[(date, currency1_code)] = value1
-            if value2 is None:
-                value2 = self._seek_value_in_CAD(str_date, currency2_code)
-                self._cache[(date, currency2_code)] = value2
+        # This method is a bottleneck. Rates are looked up in in-memory arrays.
+        value1 = self._seek_value_in_CAD(date, currency1_code)
+        value2 = self._seek_value_in_CAD(date, currency2_code)
         return value1 / value2
 
     def set_CAD_value(self, date, currency_code, value):
         """Sets the daily value in CAD for currency at date"""
-        # we must clear the whole cache because there might be other dates affected by this change
-        # (dates when the currency server has no rates).
-        self.clear_cache()
-        str_date = date2str(date)
+        self.set_CAD_values([(date, currency_code, value)])
+
+    def set_CAD_values(self, rows):
+        """Sets many daily values in CAD at once.
+
+        ``rows`` is a list of ``(date, currency_code, value)``. All values are written in a single
+        transaction.
+        """
+        if not rows:
+            return
+        for rate_date, currency_code, value in rows:
+            rates = self._currency2rates.get(currency_code)
+            if rates is None:
+                continue # not loaded yet, it will be read from the DB when needed.
+            ordinals, values = rates
+            ordinal = rate_date.toordinal()
+            index = bisect.bisect_left(ordinals, ordinal)
+            if index < len(ordinals) and ordinals[index] == ordinal:
+                values[index] = value
+            else:
+                ordinals.insert(index, ordinal)
+                values.insert(index, value)
         sql = "replace into rates(date, currency, rate) values(?, ?, ?)"
-        self._execute(sql, [str_date, currency_code, value])
+        params = [(date2str(d), currency_code, value) for d, currency_code, value in rows]
+        self._execute(sql, params, many=True)
         self.con.commit()
 
     def register_rate_provider(self, rate_provider):
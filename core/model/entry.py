@@ -8,11 +8,24 @@
 
 import bisect
 import datetime
+import os
+from array import array
 from collections import defaultdict, Sequence
 from itertools import takewhile
 
-from hscommon.util import flatten
-from .amount import convert_amount, same_currency
+from .amount import Amount, convert_amount, same_currency
+
+# When this environment variable is set, accounts store their entries in a ColumnarEntryList.
+USE_COLUMNAR_ENTRIES = bool(os.environ.get('USE_COLUMNAR_ENTRIES'))
+BALANCE_ATTRS = ('balance', 'reconciled_balance', 'balance_with_budget')
+
+def reconciliation_key(split, index):
+    """Returns the :attr:`Entry.reconciliation_key` of an entry for ``split`` at ``index``."""
+    recdate = split.reconciliation_date
+    if recdate is None:
+        recdate = datetime.date.min
+    txn = split.transaction
+    return (recdate, txn.date, txn.position, index)
 
 class Entry:
     """Wrapper around a :class:`.Split` to show in an :class:`.Account` ledger.
@@ -142,10 +155,7 @@ class Entry:
     @property
     def reconciliation_key(self):
         """*readonly*. Sort key to use to know which entry was the last to be reconciled."""
-        recdate = self.reconciliation_date
-        if recdate is None:
-            recdate = datetime.date.min
-        return (recdate, self.date, self.transaction.position, self.index)
+        return reconciliation_key(self.split, self.index)
 
     @property
     def reference(self):
@@ -167,8 +177,9 @@ class EntryList(Sequence):
         self._entries = []
         self._date2entries = defaultdict(list)
         self._sorted_entry_dates = []
-        # the key for this dict is (date_range, currency)
-        self._daterange2cashflow = {}
+        # currency -> cumulative non-budget cash flow, converted in that currency, at each entry.
+        # These lists are extended as cash flows are asked for and truncated when we're cleared.
+        self._currency2cashflows = {}
         self._last_reconciled = None
 
     def __getitem__(self, key):
@@ -189,12 +200,35 @@ class EntryList(Sequence):
         else:
             return 0
 
-    def _cash_flow(self, date_range, currency):
-        cache = self._date2entries
-        entries = flatten(cache[date] for date in date_range if date in cache)
-        entries = (e for e in entries if not getattr(e.transaction, 'is_budget', False))
-        amounts = (convert_amount(e.amount, currency, e.date) for e in entries)
-        return sum(amounts)
+    def _cash_flows(self, currency, upto):
+        # Returns cumulative cash flows in ``currency``, computed at least up to index ``upto``.
+        cash_flows = self._currency2cashflows.setdefault(currency, [])
+        if len(cash_flows) < upto:
+            total = cash_flows[-1] if cash_flows else 0
+            for amount, txn in self._cash_flow_sources(len(cash_flows), upto):
+                if not getattr(txn, 'is_budget', False):
+                    total += convert_amount(amount, currency, txn.date)
+                cash_flows.append(total)
+        return cash_flows
+
+    def _cash_flow_sources(self, start, stop):
+        # Yields (amount, transaction) pairs for entries from index ``start`` to ``stop``.
+        return ((e.amount, e.transaction) for e in self._entries[start:stop])
+
+    def _index_range(self, date_range):
+        # Returns the (start, stop) range of indexes of entries occurring in ``date_range``.
+        dates = self._sorted_entry_dates
+        start = bisect.bisect_left(dates, date_range.start)
+        stop = bisect.bisect_right(dates, date_range.end)
+        if start >= stop:
+            return 0, 0
+        first = self._date2entries[dates[start]][0]
+        last = self._date2entries[dates[stop - 1]][-1]
+        return first.index, last.index + 1
+
+    def _truncate_cash_flows(self):
+        for cash_flows in self._currency2cashflows.values():
+            del cash_flows[len(self):]
 
     # --- Public
     def add_entry(self, entry):
@@ -212,6 +246,13 @@ class EntryList(Sequence):
         if (self._last_reconciled is None) or (entry.reconciliation_key >= self._last_reconciled.reconciliation_key):
             self._last_reconciled = entry
 
+    def add_split(self, split, amount, balance, reconciled_balance, balance_with_budget):
+        """Add an entry for ``split`` with the running totals computed by the :class:`.Oven`.
+
+        Arguments are the same as :class:`Entry`'s. Same ordering rules as with :meth:`add_entry`.
+        """
+        self.add_entry(Entry(split, amount, balance, reconciled_balance, balance_with_budget))
+
     def balance(self, date=None, currency=None):
         """Returns running balance for :attr:`account` at ``date``.
 
@@ -243,11 +284,14 @@ class EntryList(Sequence):
         :param currency: :class:`.Currency`
         """
         currency = currency or self.account.currency
-        cache_key = (date_range, currency)
-        if cache_key not in self._daterange2cashflow:
-            cash_flow = self._cash_flow(date_range, currency)
-            self._daterange2cashflow[cache_key] = cash_flow
-        return self._daterange2cashflow[cache_key]
+        start, stop = self._index_range(date_range)
+        if start >= stop:
+            return 0
+        cash_flows = self._cash_flows(currency, stop)
+        result = cash_flows[stop - 1]
+        if start > 0:
+            result -= cash_flows[start - 1]
+        return result if result else 0
 
     def clear(self, from_date):
         """Remove all entries from ``from_date``."""
@@ -259,17 +303,23 @@ class EntryList(Sequence):
             index = bisect.bisect_left(self._sorted_entry_dates, from_date)
             for date in self._sorted_entry_dates[index:]:
                 del self._date2entries[date]
-            for date_range, currency in list(self._daterange2cashflow.keys()):
-                if date_range.end >= from_date:
-                    del self._daterange2cashflow[(date_range, currency)]
             del self._sorted_entry_dates[index:]
+            self._truncate_cash_flows()
             self._last_reconciled = max(self._entries, key=lambda e: e.reconciliation_key)
         else:
             self._date2entries = defaultdict(list)
-            self._daterange2cashflow = {}
+            self._currency2cashflows = {}
             self._sorted_entry_dates = []
             self._last_reconciled = None
 
+    def entries_in_range(self, date_range):
+        """Returns the list of entries occurring in ``date_range``, in order.
+
+        :param date_range: :class:`.DateRange`
+        """
+        start, stop = self._index_range(date_range)
+        return self[start:stop]
+
     def last_entry(self, date=None):
         """Return the last entry with a date that isn't after ``date``.
 
@@ -303,3 +353,154 @@ class EntryList(Sequence):
         cash_flow = self.cash_flow(date_range, currency)
         return self.account.normalize_amount(cash_flow)
 
+
+
+class ColumnarEntryList(EntryList):
+    """:class:`EntryList` storing its entries in columns rather than as :class:`Entry` instances.
+
+    Entry dates are stored as ordinals and running totals as integers (shifted by their currency's
+    exponent) in ``array`` columns. This makes balance lookups and clearing a matter of bisecting
+    and slicing, and it saves a lot of memory for accounts with a large number of entries.
+    :class:`Entry` instances are only created when they're asked for (when a GUI row needs one,
+    for example).
+
+    Used instead of :class:`EntryList` when the ``USE_COLUMNAR_ENTRIES`` environment variable is
+    set.
+    """
+    def __init__(self, account):
+        EntryList.__init__(self, account)
+        self._clear_columns()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._entry_at(index) for index in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("entry index out of range")
+        return self._entry_at(key)
+
+    def __len__(self):
+        return len(self._splits)
+
+    # --- Private
+    def _clear_columns(self):
+        self._splits = []
+        self._amounts = []
+        self._dates = array('l')
+        # balance attr -> (values, currency indexes). A currency index of 0 means a plain 0.
+        self._balances = {attr: (array('q'), array('B')) for attr in BALANCE_ATTRS}
+        self._currencies = [None]
+        # index -> Entry, for entries that have been materialized.
+        self._index2entry = {}
+        self._last_reconciled_index = None
+
+    def _decode(self, attr, index):
+        values, currency_indexes = self._balances[attr]
+        currency = self._currencies[currency_indexes[index]]
+        if currency is None:
+            return 0
+        return Amount(values[index] / 10 ** currency.exponent, currency)
+
+    def _encode(self, amount):
+        if not isinstance(amount, Amount):
+            assert not amount
+            return 0, 0
+        currency = amount.currency
+        try:
+            currency_index = self._currencies.index(currency)
+        except ValueError:
+            currency_index = len(self._currencies)
+            self._currencies.append(currency)
+        return int(round(amount.value * 10 ** currency.exponent)), currency_index
+
+    def _entry_at(self, index):
+        entry = self._index2entry.get(index)
+        if entry is None:
+            balances = [self._decode(attr, index) for attr in BALANCE_ATTRS]
+            entry = Entry(self._splits[index], self._amounts[index], *balances)
+            entry.index = index
+            self._index2entry[index] = entry
+        return entry
+
+    def _last_index(self, date=None):
+        # Index of the last entry with a date that isn't after ``date``. -1 if there's none.
+        if date is None:
+            return len(self) - 1
+        return bisect.bisect_right(self._dates, date.toordinal()) - 1
+
+    def _balance(self, balance_attr, date=None, currency=None):
+        index = self._last_index(date)
+        if index < 0:
+            return 0
+        balance = self._decode(balance_attr, index)
+        if currency:
+            return convert_amount(balance, currency, date)
+        else:
+            return balance
+
+    def _cash_flow_sources(self, start, stop):
+        transactions = (split.transaction for split in self._splits[start:stop])
+        return zip(self._amounts[start:stop], transactions)
+
+    def _index_range(self, date_range):
+        start = bisect.bisect_left(self._dates, date_range.start.toordinal())
+        stop = bisect.bisect_right(self._dates, date_range.end.toordinal())
+        return start, stop
+
+    # --- Public
+    def add_entry(self, entry):
+        """Add ``entry`` to the list.
+
+        Only the values of ``entry`` are kept, not the instance itself.
+        """
+        self.add_split(
+            entry.split, entry.amount, entry.balance, entry.reconciled_balance,
+            entry.balance_with_budget
+        )
+
+    def add_split(self, split, amount, balance, reconciled_balance, balance_with_budget):
+        index = len(self)
+        self._splits.append(split)
+        self._amounts.append(amount)
+        self._dates.append(split.transaction.date.toordinal())
+        for attr, value in zip(BALANCE_ATTRS, (balance, reconciled_balance, balance_with_budget)):
+            values, currency_indexes = self._balances[attr]
+            shifted_value, currency_index = self._encode(value)
+            values.append(shifted_value)
+            currency_indexes.append(currency_index)
+        last_index = self._last_reconciled_index
+        if last_index is None or \
+                reconciliation_key(split, index) >= reconciliation_key(self._splits[last_index], last_index):
+            self._last_reconciled_index = index
+
+    def balance_of_reconciled(self):
+        if self._last_reconciled_index is None:
+            return 0
+        return self._decode('reconciled_balance', self._last_reconciled_index)
+
+    def clear(self, from_date):
+        if from_date is None:
+            index = 0
+        else:
+            index = bisect.bisect_left(self._dates, from_date.toordinal())
+        if index == 0:
+            self._currency2cashflows = {}
+            self._clear_columns()
+            return
+        del self._splits[index:]
+        del self._amounts[index:]
+        del self._dates[index:]
+        for values, currency_indexes in self._balances.values():
+            del values[index:]
+            del currency_indexes[index:]
+        for i in [i for i in self._index2entry if i >= index]:
+            del self._index2entry[i]
+        self._truncate_cash_flows()
+        if self._last_reconciled_index >= index:
+            keys = (reconciliation_key(split, i) for i, split in enumerate(self._splits))
+            self._last_reconciled_index = max(keys)[-1]
+
+    def last_entry(self, date=None):
+        index = self._last_index(date)
+        return self._entry_at(index) if index >= 0 else None
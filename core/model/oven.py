@@ -6,16 +6,59 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
+import heapq
 from collections import defaultdict
 from datetime import date
-from itertools import dropwhile
 from operator import attrgetter
 
 from hscommon.util import flatten
 
 from .amount import convert_amount
-from .entry import Entry
 from .budget import BudgetSpawn
+from .recurrence import Spawn
+from .search import SearchIndex
+
+def first_index_at(transactions, target_date):
+    """Returns the index of the first transaction in ``transactions`` occurring on or after
+    ``target_date``.
+
+    ``transactions`` have to be sorted by date.
+    """
+    lo, hi = 0, len(transactions)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if transactions[mid].date < target_date:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def first_index_after(transactions, target_date):
+    """Returns the index of the first transaction in ``transactions`` occurring after
+    ``target_date``.
+
+    ``transactions`` have to be sorted by date.
+    """
+    lo, hi = 0, len(transactions)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if transactions[mid].date <= target_date:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def _decorated_by_date(transactions, order):
+    for index, transaction in enumerate(transactions):
+        yield (transaction.date, order, index, transaction)
+
+def merge_by_date(sequences):
+    """Merges ``sequences`` of transactions, each sorted by date, into a single sorted list.
+
+    Transactions having the same date come out in the order of the sequences they come from.
+    """
+    decorated = [_decorated_by_date(seq, order) for order, seq in enumerate(sequences)]
+    return [item[-1] for item in heapq.merge(*decorated)]
 
 class Oven:
     """Computes raw data from transactions, schedules, budgets.
@@ -37,13 +80,15 @@ class Oven:
         #: List of cooked transactions, containing :class:`.Transaction` instances mixed with
         #: schedule and budget :class:`.Spawn` instances (in date/position order).
         self.transactions = []
+        #: :class:`.SearchIndex` of our cooked :attr:`transactions`.
+        self.search_index = SearchIndex()
 
     def _budget_spawns(self, until_date, schedule_spawns):
         if not self._budgets:
             return []
         result = []
         ref_date = min(b.start_date for b in self._budgets)
-        relevant_txns = list(dropwhile(lambda t: t.date < ref_date, self._transactions)) + schedule_spawns
+        relevant_txns = self._transactions[self._transactions.first_index_at(ref_date):] + schedule_spawns
         # It's possible to have 2 budgets overlapping in date range and having the same account
         # When it happens, we need to keep track of which budget "consume" which txns
         account2consumedtxns = defaultdict(set)
@@ -56,6 +101,37 @@ class Oven:
             result += spawns
         return result
 
+    def _indirectly_dirty_accounts(self, from_date, spawns, dirty_accounts):
+        # Returns the accounts that have to be recooked from ``from_date`` along with
+        # ``dirty_accounts``, including them.
+        result = set(dirty_accounts)
+        # Spawns are cached by their recurrence. When that cache is purged, we end up with new
+        # spawn instances and the entries referring to the old ones have to go.
+        index = first_index_at(self.transactions, from_date)
+        previous_spawns = {t for t in self.transactions[index:] if isinstance(t, Spawn)}
+        current_spawns = {t for t in spawns if t.date >= from_date}
+        for spawn in previous_spawns ^ current_spawns:
+            result |= spawn.affected_accounts()
+        # Budget spawns amounts depend on their account's transactions and affect their target.
+        for budget in self._budgets:
+            if budget.account in result and budget.target is not None:
+                result.add(budget.target)
+        return result
+
+    def _reconciliation_from_date(self, from_date, accounts):
+        # it's possible that we have to reduce from_date a bit. If a split from before as a
+        # reconciled date >= from_date, we have to set from_date to that split's normal date
+        # We reverse the transactions to correctly detect chained overlappings in date/recdate.
+        # When ``accounts`` isn't None, only the splits of these accounts are considered.
+        splits = flatten(t.splits for t in reversed(self.transactions)) # splits from *cooked* txns
+        for split in splits:
+            if accounts is not None and split.account not in accounts:
+                continue
+            rdate = split.reconciliation_date
+            if rdate is not None and rdate >= from_date:
+                from_date = min(from_date, split.transaction.date)
+        return from_date
+
     def _cook_reconciliation_balances(self, splits, start_balance):
         balance = start_balance
         result = {} # split: reconciliation balance
@@ -85,7 +161,13 @@ class Oven:
             if not isinstance(split.transaction, BudgetSpawn):
                 balance += converted_amount
             reconciled_balance = split2reconciledbal[split]
-            entries.add_entry(Entry(split, amount, balance, reconciled_balance, balance_with_budget))
+            entries.add_split(split, amount, balance, reconciled_balance, balance_with_budget)
+
+    def transactions_in_range(self, date_range):
+        """Returns the cooked :attr:`transactions` occurring in ``date_range``, in order."""
+        start = first_index_at(self.transactions, date_range.start)
+        stop = first_index_after(self.transactions, date_range.end)
+        return self.transactions[start:stop]
 
     def continue_cooking(self, until_date):
         """Cooks from where we stop last time until ``until_date``.
@@ -98,7 +180,7 @@ class Oven:
         if until_date > self._cooked_until:
             self.cook(self._cooked_until, until_date)
 
-    def cook(self, from_date=None, until_date=None):
+    def cook(self, from_date=None, until_date=None, dirty_accounts=None):
         """Cooks raw data into :attr:`transactions`.
 
         :param from_date: when set, saves calculation time by re-using existing cooked transactions.
@@ -107,50 +189,77 @@ class Oven:
                            cooking. If we don't, we might end up in an infinite loop. If not set,
                            will be the date of the transaction with the highest date.
         :type until_date: ``datetime.date``
+        :param dirty_accounts: when set (along with ``from_date``), only the entries of these
+                               accounts are recooked. The entries of all other accounts are kept as
+                               they are. Accounts affected by spawns that appeared or disappeared
+                               since the last cooking, as well as the targets of the budgets of
+                               dirty accounts, are automatically added to the set.
+        :type dirty_accounts: set of :class:`.Account`
         """
+        if from_date is None:
+            dirty_accounts = None
+        elif dirty_accounts is not None:
+            dirty_accounts = set(dirty_accounts)
         # Determine from/until dates
         if from_date is None:
             from_date = date.min
         else:
-            # it's possible that we have to reduce from_date a bit. If a split from before as a
-            # reconciled date >= from_date, we have to set from_date to that split's normal date
-            # We reverse the transactions to correctly detect chained overlappings in date/recdate
-            splits = flatten(t.splits for t in reversed(self.transactions)) # splits from *cooked* txns
-            for split in splits:
-                rdate = split.reconciliation_date
-                if rdate is not None and rdate >= from_date:
-                    from_date = min(from_date, split.transaction.date)
-        self._transactions.sort(key=attrgetter('date', 'position')) # needed in case until_date is None
+            from_date = self._reconciliation_from_date(from_date, dirty_accounts)
         if until_date is None:
             until_date = self._transactions[-1].date if self._transactions else from_date
-        # Clear old cooked data
-        for account in self._accounts:
-            account.entries.clear(from_date)
-        if from_date == date.min:
-            self.transactions = []
-        else:
-            self.transactions = [t for t in self.transactions if t.date < from_date]
+        if dirty_accounts is not None:
+            # Entries of the accounts we don't touch contain spawns up to where we cooked last time.
+            until_date = max(until_date, self._cooked_until)
+        schedule_spawns = [recurrence.get_spawns(until_date) for recurrence in self._scheduled]
+        spawns = flatten(schedule_spawns)
+        budget_spawns = self._budget_spawns(until_date, spawns)
+        spawns += budget_spawns
+        if dirty_accounts is not None:
+            # Accounts we add to the dirty ones can have reconciled splits that make us cook from an
+            # earlier date, which can in turn add dirty accounts.
+            while True:
+                added_accounts = self._indirectly_dirty_accounts(
+                    from_date, spawns, dirty_accounts
+                ) - dirty_accounts
+                if not added_accounts:
+                    break
+                dirty_accounts |= added_accounts
+                new_from_date = self._reconciliation_from_date(from_date, added_accounts)
+                if new_from_date < from_date:
+                    from_date = self._reconciliation_from_date(new_from_date, dirty_accounts)
+        # Clear old cooked transactions
+        index = first_index_at(self.transactions, from_date)
+        previous = self.transactions[index:]
+        del self.transactions[index:]
+        self.search_index.remove(previous)
         # Cook
-        spawns = flatten(recurrence.get_spawns(until_date) for recurrence in self._scheduled)
-        spawns += self._budget_spawns(until_date, spawns)
         # To ensure that our sort order stay correct and consistent, we assign position values
         # to our spawns. To ensure that there's no overlap, we start our position counter at
         # len(transactions)
         for counter, spawn in enumerate(spawns, start=len(self._transactions)):
             spawn.position = counter
-        txns = self._transactions + spawns
+        # Our transactions are always sorted and spawns of a recurrence are mostly sorted (which
+        # makes sorting them cheap), so we merge them rather than sorting everything.
         # we don't filter out txns > until_date because they might be budgets affecting current data
         # XXX now that budget's base date is the start date, isn't this untrue?
-        tocook = [t for t in txns if from_date <= t.date]
-        tocook.sort(key=attrgetter('date'))
+        sources = [self._transactions[self._transactions.first_index_at(from_date):]]
+        for source in schedule_spawns + [budget_spawns]:
+            source = [t for t in source if from_date <= t.date]
+            source.sort(key=attrgetter('date'))
+            sources.append(source)
+        tocook = merge_by_date(sources)
+        accounts = self._accounts if dirty_accounts is None else dirty_accounts
+        # Clear old cooked entries
+        for account in accounts:
+            account.entries.clear(from_date)
         splits = flatten(t.splits for t in tocook)
         account2splits = defaultdict(list)
         for split in splits:
             account = split.account
-            if account is not None:
+            if account is not None and (dirty_accounts is None or account in dirty_accounts):
                 account2splits[account].append(split)
         for account, splits in account2splits.items():
             self._cook_splits(account, splits)
         self.transactions += tocook
+        self.search_index.add(tocook)
         self._cooked_until = until_date
-
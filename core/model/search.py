@@ -0,0 +1,200 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from collections import defaultdict
+
+# Length of the n-grams we index text with. Substring queries shorter than that can't be answered
+# by the index.
+NGRAM_LENGTH = 3
+TEXT_QUERY_TYPES = {'description', 'payee', 'memo'}
+
+def ngrams(s):
+    """Returns the set of :const:`NGRAM_LENGTH` long substrings of ``s``."""
+    return {s[i:i+NGRAM_LENGTH] for i in range(len(s) - NGRAM_LENGTH + 1)}
+
+def split_value(split):
+    return abs(split.amount.value) if split.amount else 0
+
+def is_refinement(query, previous_query):
+    """Returns whether all transactions matching the text criteria of ``query`` also match
+    ``previous_query``.
+
+    That's the case when ``query`` only makes the text criteria of ``previous_query`` longer, which
+    is what happens when the user types in the search field. Other criteria (check number, amount,
+    account and group) match exact values, so a longer query can match transactions the previous
+    one didn't. They aren't considered here and have to be looked up separately.
+    """
+    if previous_query is None:
+        return False
+    for qtype in TEXT_QUERY_TYPES & query.keys():
+        previous_value = previous_query.get(qtype)
+        if previous_value is None or previous_value not in query[qtype]:
+            return False
+    return True
+
+class SearchIndex:
+    """Index of cooked transactions for search queries, as returned by
+    :meth:`.Application.parse_search_query`.
+
+    Text fields (description, payee, memos) are indexed by n-grams. Check numbers, split amounts
+    and split accounts are indexed by value. The index only gives us candidates: they're always
+    confirmed with :meth:`.Transaction.matches`, so that results are the same as if we had called
+    it on all transactions.
+
+    Indexing is lazy. :meth:`add` and :meth:`remove` are called by the :class:`.Oven` on every
+    cooking and only record the change. The actual indexing happens at the next search. Because we
+    remember under which keys a transaction was indexed, transactions can change after having been
+    indexed, as long as they're removed and added back, which is what recooking does.
+
+    The result of the last query is kept until the index changes. When the text criteria of the
+    next query refine it, we only have to check that smaller set of transactions, plus those the
+    other criteria of the query point to.
+    """
+    def __init__(self):
+        self.clear()
+
+    # --- Private
+    def _index(self, txn):
+        text_keys = set()
+        for s in [txn.description, txn.payee] + [split.memo for split in txn.splits]:
+            text_keys |= ngrams(s.lower())
+        value_keys = {split_value(split) for split in txn.splits}
+        account_keys = {split.account for split in txn.splits if split.account is not None}
+        checkno_key = txn.checkno.lower()
+        for key in text_keys:
+            self._ngram2txns[key].add(txn)
+        for key in value_keys:
+            self._value2txns[key].add(txn)
+        for key in account_keys:
+            self._account2txns[key].add(txn)
+        self._checkno2txns[checkno_key].add(txn)
+        self._txn2keys[txn] = (text_keys, value_keys, account_keys, checkno_key)
+
+    def _unindex(self, txn):
+        text_keys, value_keys, account_keys, checkno_key = self._txn2keys.pop(txn)
+        for index, keys in [
+                (self._ngram2txns, text_keys), (self._value2txns, value_keys),
+                (self._account2txns, account_keys), (self._checkno2txns, [checkno_key])]:
+            for key in keys:
+                txns = index[key]
+                txns.discard(txn)
+                if not txns:
+                    del index[key]
+
+    def _flush_pending(self):
+        for txn in self._pending:
+            if txn in self._txn2keys:
+                self._unindex(txn)
+            self._index(txn)
+        self._pending = set()
+
+    def _text_candidates(self, s):
+        # Returns transactions that could contain ``s`` in their text fields, or None if we can't
+        # tell.
+        keys = ngrams(s)
+        if not keys:
+            return None
+        keys = sorted(keys, key=lambda key: len(self._ngram2txns.get(key, ())))
+        result = set(self._ngram2txns.get(keys[0], ()))
+        for key in keys[1:]:
+            if not result:
+                break
+            result &= self._ngram2txns.get(key, set())
+        return result
+
+    def _account_candidates(self, names, with_group):
+        result = set()
+        for account, txns in self._account2txns.items():
+            if with_group:
+                if account.group is None or account.group.name.lower() not in names:
+                    continue
+            elif account.name.lower() not in names:
+                continue
+            result |= txns
+        return result
+
+    def _exact_candidates(self, query):
+        # Returns transactions that could match the criteria of ``query`` that aren't text.
+        candidates = set()
+        if 'checkno' in query:
+            candidates |= self._checkno2txns.get(query['checkno'], set())
+        if 'amount' in query:
+            query_amount = query['amount']
+            query_value = query_amount.value if query_amount else 0
+            candidates |= self._value2txns.get(query_value, set())
+        if 'account' in query:
+            candidates |= self._account_candidates(query['account'], with_group=False)
+        if 'group' in query:
+            candidates |= self._account_candidates(query['group'], with_group=True)
+        return candidates
+
+    def _matching(self, query):
+        self._flush_pending()
+        candidates = set()
+        for qtype in TEXT_QUERY_TYPES:
+            if qtype in query:
+                txns = self._text_candidates(query[qtype])
+                if txns is None:
+                    return None
+                candidates |= txns
+        candidates |= self._exact_candidates(query)
+        return {txn for txn in candidates if txn.matches(query)}
+
+    # --- Public
+    def add(self, transactions):
+        """Adds ``transactions`` to the index."""
+        self._pending.update(transactions)
+        self._last_query = self._last_result = None
+
+    def remove(self, transactions):
+        """Removes ``transactions`` from the index."""
+        self._last_query = self._last_result = None
+        for txn in transactions:
+            if txn in self._pending:
+                self._pending.discard(txn)
+            elif txn in self._txn2keys:
+                self._unindex(txn)
+
+    def clear(self):
+        """Removes all transactions from the index."""
+        self._pending = set()
+        self._txn2keys = {}
+        self._ngram2txns = defaultdict(set)
+        self._value2txns = defaultdict(set)
+        self._account2txns = defaultdict(set)
+        self._checkno2txns = defaultdict(set)
+        self._last_query = self._last_result = None
+
+    def matching(self, query):
+        """Returns the set of indexed transactions matching ``query``.
+
+        Returns ``None`` if the index can't answer ``query``, which happens with text queries that
+        are shorter than :const:`NGRAM_LENGTH`.
+        """
+        if is_refinement(query, self._last_query):
+            candidates = self._last_result | self._exact_candidates(query)
+            result = {txn for txn in candidates if txn.matches(query)}
+        else:
+            result = self._matching(query)
+            if result is None:
+                return None
+        self._last_query = query
+        self._last_result = result
+        return result
+
+    def filter(self, items, query, key=None):
+        """Returns the items of ``items`` whose transaction matches ``query``, in order.
+
+        If ``key`` is given, it's a function returning the transaction of an item. Otherwise, items
+        are transactions. When the index can't answer ``query``, we call
+        :meth:`.Transaction.matches` on every item.
+        """
+        if key is None:
+            key = lambda item: item
+        matching = self.matching(query)
+        if matching is None:
+            return [item for item in items if key(item).matches(query)]
+        return [item for item in items if key(item) in matching]
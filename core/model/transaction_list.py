@@ -4,59 +4,156 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
-from operator import itemgetter
+import bisect
+from collections import defaultdict
+from operator import attrgetter
+
+from .completion import CompletionIndex
 
 class TransactionList(list):
     """Manages the :class:`.Transaction` instances of a document.
 
     This class is mostly about managing transactions sorting order, moving them around and keeping
-    a cache of values to use for completion. There's only one of those in a document, in
+    an index of values to use for completion. There's only one of those in a document, in
     :attr:`.Document.transactions`.
 
+    The list is always sorted by ``(date, position)``: transactions are inserted at their proper
+    place rather than being appended. To avoid scanning the whole list whenever we need
+    transactions at a specific date, we also keep a date index of our transactions. Whenever the
+    date or position of a transaction in the list is changed, :meth:`reindex` has to be called.
+    That index also makes membership tests cheap.
+
+    Completion indexes are updated incrementally. We remember the values under which each
+    transaction was indexed, and when the cache is cleared, only transactions whose values changed
+    are indexed again.
+
     Subclasses ``list``.
     """
     def __init__(self, *args, **kwargs):
         list.__init__(self, *args, **kwargs)
-        self._descriptions = None
-        self._payees = None
-        self._account_names = None
+        self.reindex()
+        self._clear_completion()
 
     # --- Overrides
+    def __contains__(self, transaction):
+        return transaction in self._transaction2key
+
     def remove(self, transaction):
         """Removes ``transaction`` from the list."""
-        list.remove(self, transaction)
-        self.clear_cache()
+        if transaction not in self._transaction2key:
+            raise ValueError("transaction not in list")
+        self._pop(transaction)
+        self.clear_cache([transaction])
 
     # --- Private
-    def _compute_completion_list(self, data_and_mtime):
-        """Returns a list of unique data sorted in mtime order.
+    def _clear_index(self):
+        # (date, position) sort keys, as they were when transactions were inserted. Parallel to
+        # the list itself.
+        self._keys = []
+        # date -> set of transactions at that date
+        self._date2transactions = defaultdict(set)
+        # date -> highest position of the transactions at that date
+        self._date2maxposition = {}
+        # transaction -> sort key under which it is indexed
+        self._transaction2key = {}
 
-        ``data_and_mtime`` is an iterable containing ``(data, mtime)`` pairs.
-        """
-        data2mtime = {}
-        for data, mtime in data_and_mtime:
-            maxmtime = max(mtime, data2mtime.get(data, 0))
-            data2mtime[data] = maxmtime
-        data_and_mtime = sorted(data2mtime.items(), key=itemgetter(1), reverse=True)
-        return [data for data, mtime in data_and_mtime]
-
-    def _compute_account_names(self):
-        def data_and_mtime_gen():
-            for txn in self:
-                mtime = txn.mtime
-                for account in txn.affected_accounts():
-                    if not account.inactive:
-                        yield (account.name, mtime)
-
-        self._account_names = self._compute_completion_list(data_and_mtime_gen())
-
-    def _compute_descriptions(self):
-        data_and_mtime = ((t.description, t.mtime) for t in self)
-        self._descriptions = self._compute_completion_list(data_and_mtime)
-
-    def _compute_payees(self):
-        data_and_mtime = ((t.payee, t.mtime) for t in self)
-        self._payees = self._compute_completion_list(data_and_mtime)
+    def _index(self, transaction, key):
+        date = key[0]
+        self._transaction2key[transaction] = key
+        self._date2transactions[date].add(transaction)
+        maxposition = self._date2maxposition.get(date)
+        if maxposition is None or transaction.position > maxposition:
+            self._date2maxposition[date] = transaction.position
+
+    def _unindex(self, transaction):
+        date = self._transaction2key.pop(transaction)[0]
+        transactions = self._date2transactions[date]
+        transactions.discard(transaction)
+        if transactions:
+            self._update_max_position(date)
+        else:
+            del self._date2transactions[date]
+            del self._date2maxposition[date]
+
+    def _insert(self, transaction):
+        key = (transaction.date, transaction.position)
+        index = bisect.bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        list.insert(self, index, transaction)
+        self._index(transaction, key)
+
+    def _pop(self, transaction):
+        # We use the key under which the transaction was inserted rather than its current
+        # attributes, which might have changed since.
+        key = self._transaction2key[transaction]
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key)
+        index = next(i for i in range(lo, hi) if self[i] is transaction)
+        del self._keys[index]
+        list.__delitem__(self, index)
+        self._unindex(transaction)
+
+    def _update_max_position(self, date):
+        self._date2maxposition[date] = max(t.position for t in self._date2transactions[date])
+
+    def _clear_completion(self):
+        self._description_index = CompletionIndex()
+        self._payee_index = CompletionIndex()
+        self._account_name_index = CompletionIndex()
+        # transaction -> (description, payee, account names, mtime) it was indexed with
+        self._transaction2completion = {}
+        # transactions to index again, in addition to all of them if _completion_dirty is set.
+        self._completion_pending = set()
+        self._completion_dirty = True
+
+    def _completion_values(self, transaction):
+        account_names = frozenset(
+            a.name for a in transaction.affected_accounts() if not a.inactive
+        )
+        return (transaction.description, transaction.payee, account_names, transaction.mtime)
+
+    def _index_completion(self, transaction, values):
+        description, payee, account_names, mtime = values
+        self._description_index.add(description, mtime)
+        self._payee_index.add(payee, mtime)
+        for name in account_names:
+            self._account_name_index.add(name, mtime)
+        self._transaction2completion[transaction] = values
+
+    def _unindex_completion(self, transaction):
+        description, payee, account_names, mtime = self._transaction2completion.pop(transaction)
+        self._description_index.remove(description, mtime)
+        self._payee_index.remove(payee, mtime)
+        for name in account_names:
+            self._account_name_index.remove(name, mtime)
+
+    def _update_completion(self):
+        if self._completion_dirty:
+            # We go through transactions in order so that ranking ties are resolved the same way
+            # no matter how we got there.
+            removed = set(self._transaction2completion) - set(self._transaction2key)
+            transactions = list(removed) + list(self)
+        elif self._completion_pending:
+            transactions = sorted(
+                self._completion_pending,
+                key=lambda t: self._transaction2key.get(t, (t.date, t.position))
+            )
+        else:
+            return
+        for transaction in transactions:
+            old = self._transaction2completion.get(transaction)
+            if transaction in self._transaction2key:
+                new = self._completion_values(transaction)
+            else:
+                new = None
+            if new == old:
+                continue
+            if old is not None:
+                self._unindex_completion(transaction)
+            if new is not None:
+                self._index_completion(transaction, new)
+        self._completion_pending = set()
+        self._completion_dirty = False
 
     # --- Public
     def add(self, transaction, keep_position=False, position=None):
@@ -68,26 +165,29 @@ class TransactionList(list):
         if position is not None:
             transaction.position = position
         elif not keep_position:
-            transactions = self.transactions_at_date(transaction.date)
-            if transactions:
-                transaction.position = max(t.position for t in transactions) + 1
-        self.append(transaction)
-        self.clear_cache()
+            maxposition = self._date2maxposition.get(transaction.date)
+            if maxposition is not None:
+                transaction.position = maxposition + 1
+        self._insert(transaction)
+        self.clear_cache([transaction])
 
     def clear(self):
         """Clears the list of all transactions."""
         del self[:]
-        self.clear_cache()
+        self._clear_index()
+        self._clear_completion()
 
-    def clear_cache(self):
+    def clear_cache(self, transactions=None):
         """Clears cached data.
 
         For now cache date is auto-completion data (payee, transaction, account). Call this when
-        a transaction has been changed.
+        a transaction has been changed. If we know which ``transactions`` changed, only those are
+        looked at when the cache is needed again.
         """
-        self._descriptions = None
-        self._payees = None
-        self._account_names = None
+        if transactions is None:
+            self._completion_dirty = True
+        else:
+            self._completion_pending.update(transactions)
 
     def reassign_account(self, account, reassign_to=None):
         """Calls :meth:`.Transaction.reassign_account` on all transactions.
@@ -95,12 +195,32 @@ class TransactionList(list):
         If, after such an operation, a transaction ends up referencing no account at all, it is
         removed.
         """
-        for transaction in self[:]:
+        orphans = []
+        for transaction in self:
             transaction.reassign_account(account, reassign_to)
             if not transaction.affected_accounts():
-                self.remove(transaction)
+                orphans.append(transaction)
+        self.remove_many(orphans)
         self.clear_cache()
 
+    def remove_many(self, transactions):
+        """Removes ``transactions`` from the list.
+
+        Equivalent to calling :meth:`remove` for each transaction, but the list is only rebuilt
+        once.
+        """
+        transactions = set(transactions)
+        if not transactions:
+            return
+        if any(t not in self._transaction2key for t in transactions):
+            raise ValueError("transaction not in list")
+        kept = [(key, t) for key, t in zip(self._keys, self) if t not in transactions]
+        self._keys = [key for key, t in kept]
+        list.__setitem__(self, slice(None), [t for key, t in kept])
+        for transaction in transactions:
+            self._unindex(transaction)
+        self.clear_cache(transactions)
+
     def move_before(self, from_transaction, to_transaction):
         """Moves ``from_transaction`` just before ``to_transaction``.
 
@@ -111,6 +231,7 @@ class TransactionList(list):
             return
         if to_transaction is not None and to_transaction.date != from_transaction.date:
             to_transaction = None
+        self.reindex([from_transaction])
         transactions = self.transactions_at_date(from_transaction.date)
         transactions.remove(from_transaction)
         if not transactions:
@@ -123,34 +244,71 @@ class TransactionList(list):
         for transaction in transactions:
             if transaction.position >= target_position:
                 transaction.position += 1
+        transactions.add(from_transaction)
+        self.reindex(transactions)
 
     def move_last(self, transaction):
         """Equivalent to :meth:`move_before` with ``to_transaction`` to ``None``."""
         self.move_before(transaction, None)
 
+    def first_index_at(self, target_date):
+        """Returns the index of the first transaction occurring on or after ``target_date``."""
+        return bisect.bisect_left(self._keys, (target_date, ))
+
+    def reindex(self, transactions=None):
+        """Updates the sort order and the date index for ``transactions``.
+
+        Call this after having changed the date or the position of transactions in the list. If
+        ``transactions`` is ``None``, the whole list is re-sorted and its index rebuilt.
+        """
+        if transactions is None:
+            self.sort(key=attrgetter('date', 'position'))
+            self._clear_index()
+            for transaction in self:
+                key = (transaction.date, transaction.position)
+                self._keys.append(key)
+                self._index(transaction, key)
+            return
+        transactions = [t for t in transactions if t in self._transaction2key]
+        for transaction in transactions:
+            self._pop(transaction)
+        for transaction in transactions:
+            self._insert(transaction)
+
     def transactions_at_date(self, target_date):
         """Returns a set of all transactions occurring on ``target_date``."""
-        return set(t for t in self if t.date == target_date)
+        return set(self._date2transactions.get(target_date, ()))
 
     # --- Properties
     @property
     def account_names(self):
         """A list of active account names used in the transactions, in reverse mtime order."""
-        if self._account_names is None:
-            self._compute_account_names()
-        return self._account_names
+        return self.account_name_index.values()
+
+    @property
+    def account_name_index(self):
+        """:class:`.CompletionIndex` of :attr:`account_names`."""
+        self._update_completion()
+        return self._account_name_index
 
     @property
     def descriptions(self):
         """A list of descriptions used in the transactions, in reverse mtime order."""
-        if self._descriptions is None:
-            self._compute_descriptions()
-        return self._descriptions
+        return self.description_index.values()
+
+    @property
+    def description_index(self):
+        """:class:`.CompletionIndex` of :attr:`descriptions`."""
+        self._update_completion()
+        return self._description_index
 
     @property
     def payees(self):
         """A list of payees used in the transactions, in reverse mtime order."""
-        if self._payees is None:
-            self._compute_payees()
-        return self._payees
+        return self.payee_index.values()
 
+    @property
+    def payee_index(self):
+        """:class:`.CompletionIndex` of :attr:`payees`."""
+        self._update_completion()
+        return self._payee_index
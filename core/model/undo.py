@@ -7,6 +7,7 @@
 # http://www.gnu.org/licenses/gpl-3.0.html
 
 import copy
+import threading
 
 from hscommon.util import extract, flatten
 
@@ -19,13 +20,76 @@ SPLIT_SWAP_ATTRS = ['account', 'amount', 'reconciliation_date']
 SCHEDULE_SWAP_ATTRS = ['repeat_type', 'repeat_every', 'stop_date', 'date2exception',
                        'date2globalchange', 'date2instances']
 BUDGET_SWAP_ATTRS = SCHEDULE_SWAP_ATTRS + ['account', 'target', 'amount']
+# Setting these attributes resets the attributes they map to, which then have to be swapped too.
+DEPENDENT_ATTRS = {
+    'account': ['reconciliation_date'],
+    'amount': ['reconciliation_date'],
+    'repeat_type': ['date2exception', 'date2globalchange'],
+    'repeat_every': ['date2exception', 'date2globalchange'],
+}
+# Default limits of the undo history. See Undoer.
+MAX_UNDO_DEPTH = 100
+MAX_UNDO_SIZE = 100000
+
+def split_values(split):
+    return {k: v for k, v in vars(split).items() if k != 'transaction'}
+
+def same_value(attr, value, other):
+    if attr == 'splits':
+        return len(value) == len(other) and all(
+            split_values(s1) == split_values(s2) for s1, s2 in zip(value, other)
+        )
+    return value == other
+
+def backup_value(instance, backup, attr):
+    # The value of ``attr`` on the other side of a change, whether ``backup`` is a Delta or not.
+    if isinstance(backup, Delta) and attr not in backup.attrs:
+        return getattr(instance, attr)
+    return getattr(backup, attr)
 
 def swapvalues(first, second, attrs):
+    if isinstance(second, Delta):
+        attrs = second.attrs
     for attr in attrs:
         tmp = getattr(first, attr)
         setattr(first, attr, getattr(second, attr))
         setattr(second, attr, tmp)
 
+class Delta:
+    """Values of ``backup`` that differ from those of ``instance``, for ``attrs``.
+
+    Takes the place of a full backup in :class:`Action` once the change is done. We can swap values
+    with it just like we would with the full backup, but only changed attributes are kept (and
+    swapped). :attr:`attrs` is the list of those attributes.
+    """
+    def __init__(self, backup, instance, attrs):
+        changed = set()
+        for attr in attrs:
+            if not same_value(attr, getattr(backup, attr), getattr(instance, attr)):
+                changed.add(attr)
+                changed.update(DEPENDENT_ATTRS.get(attr, []))
+        self.attrs = [attr for attr in attrs if attr in changed]
+        for attr in self.attrs:
+            setattr(self, attr, getattr(backup, attr))
+
+
+def compacted(changes, attrs):
+    # Returns a set of (instance, backup) ``changes`` where full backups are replaced by deltas.
+    return {
+        (instance, backup if isinstance(backup, Delta) else Delta(backup, instance, attrs))
+        for instance, backup in changes
+    }
+
+def compacted_recurrences(changes, attrs):
+    result = set()
+    for recurrence, backup in changes:
+        if not isinstance(backup, Delta):
+            delta = Delta(backup, recurrence, attrs)
+            delta.ref = Delta(backup.ref, recurrence.ref, TRANSACTION_SWAP_ATTRS)
+            backup = delta
+        result.add((recurrence, backup))
+    return result
+
 class Action:
     """A unit of change that can be undone and redone.
 
@@ -64,6 +128,91 @@ class Action:
         self.changed_budgets = set()
         self.deleted_budgets = set()
 
+    def compact(self):
+        """Replaces the backups of changed transactions, splits, schedules and budgets by
+        :class:`Delta` instances.
+
+        Only call this when the changes recorded in the action are done.
+        """
+        self.changed_transactions = compacted(self.changed_transactions, TRANSACTION_SWAP_ATTRS)
+        self.changed_splits = compacted(self.changed_splits, SPLIT_SWAP_ATTRS)
+        self.changed_schedules = compacted_recurrences(self.changed_schedules, SCHEDULE_SWAP_ATTRS)
+        self.changed_budgets = compacted_recurrences(self.changed_budgets, BUDGET_SWAP_ATTRS)
+
+    def size(self):
+        """Returns the number of instances recorded in the action."""
+        return sum(len(getattr(self, attr)) for attr in vars(self) if attr != 'description')
+
+    def changed_transactions_only(self):
+        """Returns the set of transactions added, changed or deleted by the action.
+
+        Returns ``None`` if the action also changes something else than transactions.
+        """
+        others = [
+            self.added_accounts, self.changed_accounts, self.deleted_accounts, self.added_groups,
+            self.changed_groups, self.deleted_groups, self.added_schedules, self.changed_schedules,
+            self.deleted_schedules, self.added_budgets, self.changed_budgets, self.deleted_budgets,
+        ]
+        if any(others):
+            return None
+        result = self.added_transactions | self.deleted_transactions
+        result |= {txn for txn, old in self.changed_transactions}
+        result |= {split.transaction for split, old in self.changed_splits}
+        return result
+
+    def changed_instances(self):
+        """Returns the set of transactions, schedules and budgets changed by the action.
+
+        Transactions whose splits changed are part of it. Added and deleted instances aren't.
+        """
+        result = {txn for txn, old in self.changed_transactions}
+        result |= {split.transaction for split, old in self.changed_splits}
+        result |= {schedule for schedule, old in self.changed_schedules}
+        result |= {budget for budget, old in self.changed_budgets}
+        return result
+
+    def cooking_scope(self):
+        """Returns the ``(from_date, dirty_accounts)`` :ref:`cooking <cooking>` needed after the
+        action is undone or redone.
+
+        We look at both sides of changes, so this can be called before or after the replay. When
+        accounts are involved, currencies and types might have changed, so we ask for a full
+        cooking with ``(None, None)``. Schedules and budgets spawn in many accounts, so with them,
+        ``dirty_accounts`` is ``None``. Reconciled balances are cooked in reconciliation date order,
+        so reconciliation dates count as well.
+        """
+        if self.added_accounts or self.changed_accounts or self.deleted_accounts:
+            return None, None
+        dates = []
+        accounts = set()
+        for txn in self.added_transactions | self.deleted_transactions:
+            dates.append(txn.date)
+            accounts |= txn.affected_accounts()
+        for txn, old in self.changed_transactions:
+            dates += [txn.date, backup_value(txn, old, 'date')]
+            for split in txn.splits + backup_value(txn, old, 'splits'):
+                accounts.add(split.account)
+                dates.append(split.reconciliation_date)
+        for split, old in self.changed_splits:
+            dates += [
+                split.transaction.date, split.reconciliation_date,
+                backup_value(split, old, 'reconciliation_date')
+            ]
+            accounts |= {split.account, backup_value(split, old, 'account')}
+        recurrences = self.added_schedules | self.deleted_schedules | self.added_budgets \
+            | self.deleted_budgets
+        dates += [r.start_date for r in recurrences]
+        for recurrence, old in self.changed_schedules | self.changed_budgets:
+            dates += [recurrence.start_date, backup_value(recurrence.ref, old.ref, 'date')]
+        dates = [d for d in dates if d is not None] # unreconciled splits
+        if not dates:
+            return None, None
+        if recurrences or self.changed_schedules or self.changed_budgets:
+            dirty_accounts = None
+        else:
+            dirty_accounts = accounts - {None}
+        return min(dates), dirty_accounts
+
     def change_accounts(self, accounts):
         """Record imminent changes to ``accounts``."""
         self.changed_accounts |= set((a, copy.copy(a)) for a in accounts)
@@ -125,9 +274,25 @@ class Undoer:
     How it works is that it holds a list of :class:`.Action` and a pointer to our current action
     (most of the time, it's the last action). When we undo or redo an action, we use the information
     we has stored in our action and make proper modifications, then move our action index.
+
+    Once an action is done (when the next one is recorded or when it's undone), its backups are
+    :meth:`compacted <Action.compact>`. We keep at most ``max_depth`` actions, for a total
+    :meth:`Action.size` of at most ``max_size``, the oldest actions being dropped first. The last
+    action is always kept.
     """
-    def __init__(self, accounts, groups, transactions, scheduled, budgets):
+    def __init__(
+            self, accounts, groups, transactions, scheduled, budgets, max_depth=MAX_UNDO_DEPTH,
+            max_size=MAX_UNDO_SIZE):
         self._actions = []
+        self._max_depth = max_depth
+        self._max_size = max_size
+        # Actions recorded, undone or redone since the last pop_played_actions() call. None if
+        # there were too many of them to keep track of. It's popped from the autosave thread, hence
+        # the lock.
+        self._played_actions = []
+        self._played_lock = threading.Lock()
+        # Recorded actions whose changes aren't done yet. See applied().
+        self._unapplied_actions = []
         self._accounts = accounts
         self._groups = groups
         self._transactions = transactions
@@ -135,6 +300,8 @@ class Undoer:
         self._budgets = budgets
         self._index = -1
         self._save_point = None
+        # Whether actions were dropped from the history while not being part of the saved state.
+        self._save_point_dropped = False
 
     # --- Private
     def _add_auto_created_accounts(self, transaction):
@@ -159,6 +326,7 @@ class Undoer:
     def _do_changes(self, action):
         for account, old in action.changed_accounts:
             swapvalues(account, old, ACCOUNT_SWAP_ATTRS)
+        self._accounts.reindex([account for account, old in action.changed_accounts])
         for group, old in action.changed_groups:
             swapvalues(group, old, GROUP_SWAP_ATTRS)
         for txn, old in action.changed_transactions:
@@ -167,6 +335,7 @@ class Undoer:
             for split in txn.splits:
                 split.transaction = txn
             self._add_auto_created_accounts(txn)
+            self._transactions.reindex([txn])
         for split, old in action.changed_splits:
             swapvalues(split, old, SPLIT_SWAP_ATTRS)
         for schedule, old in action.changed_schedules:
@@ -185,12 +354,33 @@ class Undoer:
             self._groups.remove(group)
         for txn in transactions:
             self._remove_auto_created_account(txn)
-            self._transactions.remove(txn)
+        self._transactions.remove_many(transactions)
         for schedule in schedules:
             self._scheduled.remove(schedule)
         for budget in budgets:
             self._budgets.remove(budget)
 
+    def _drop_oldest_actions(self):
+        sizes = [action.size() for action in self._actions]
+        total_size = sum(sizes)
+        dropped = 0
+        while len(self._actions) - dropped > 1 and (
+                len(self._actions) - dropped > self._max_depth or total_size > self._max_size):
+            total_size -= sizes[dropped]
+            dropped += 1
+        if dropped and (self._save_point is None or self._save_point in self._actions[:dropped]):
+            # Undoing everything we have left won't bring us back to the saved state anymore.
+            self._save_point_dropped = True
+        del self._actions[:dropped]
+
+    def _played(self, actions):
+        with self._played_lock:
+            if self._played_actions is None:
+                return
+            self._played_actions += actions
+            if len(self._played_actions) > self._max_depth:
+                self._played_actions = None
+
     def _remove_auto_created_account(self, transaction):
         for split in transaction.splits:
             account = split.account
@@ -199,6 +389,17 @@ class Undoer:
                 self._accounts.remove(account)
 
     # --- Public
+    def applied(self):
+        """Tells that the changes of the actions recorded so far are done.
+
+        Actions are recorded before their changes are made. Until this is called, recorded actions
+        aren't returned by :meth:`pop_played_actions`, so that whoever consumes them doesn't look at
+        instances before they're changed.
+        """
+        actions = self._unapplied_actions
+        self._unapplied_actions = []
+        self._played(actions)
+
     def can_redo(self):
         """Whether we can redo.
 
@@ -217,6 +418,21 @@ class Undoer:
     def clear(self):
         """Clear our action list."""
         self._actions = []
+        self._save_point_dropped = False
+        self._unapplied_actions = []
+        with self._played_lock:
+            self._played_actions = []
+
+    def pop_played_actions(self):
+        """Returns the list of actions that were recorded, undone or redone since the last call.
+
+        Recorded actions are only returned once they're :meth:`applied`. Returns ``None`` if there
+        were more than ``max_depth`` of them.
+        """
+        with self._played_lock:
+            result = self._played_actions
+            self._played_actions = []
+        return result
 
     def undo_description(self):
         """Textual description of the action to be undone next."""
@@ -236,6 +452,7 @@ class Undoer:
         Call this method whenever the document is saved.
         """
         self._save_point = self._actions[-1] if self._actions else None
+        self._save_point_dropped = False
 
     def record(self, action):
         """Record an action and add it to the list.
@@ -247,10 +464,14 @@ class Undoer:
         :param action: Action to be recorded.
         :type action: :class:`Action`
         """
+        if self.can_undo():
+            self._actions[self._index].compact()
         if self._index < -1:
             self._actions = self._actions[:self._index + 1]
         self._actions.append(action)
         self._index = -1
+        self._drop_oldest_actions()
+        self._unapplied_actions.append(action)
 
     def undo(self):
         """Undo the next action to be undone.
@@ -260,9 +481,12 @@ class Undoer:
         action and decrease our pointer to the previous action.
 
         Make sure you can call this with :meth:`can_undo` first.
+
+        Returns the :meth:`Action.cooking_scope` of the undone action.
         """
         assert self.can_undo()
         action = self._actions[self._index]
+        action.compact()
         self._do_adds(
             action.deleted_accounts, action.deleted_groups, action.deleted_transactions,
             action.deleted_schedules, action.deleted_budgets
@@ -273,6 +497,8 @@ class Undoer:
         )
         self._do_changes(action)
         self._index -= 1
+        self._played([action])
+        return action.cooking_scope()
 
     def redo(self):
         """Redo the next action to be redone.
@@ -281,6 +507,8 @@ class Undoer:
         increase our pointer to the next action.
 
         Make sure you can call this with :meth:`can_redo` first.
+
+        Returns the :meth:`Action.cooking_scope` of the redone action.
         """
         assert self.can_redo()
         action = self._actions[self._index + 1]
@@ -294,6 +522,8 @@ class Undoer:
         )
         self._do_changes(action)
         self._index += 1
+        self._played([action])
+        return action.cooking_scope()
 
     # --- Properties
     @property
@@ -301,7 +531,10 @@ class Undoer:
         """Whether we can consider our document modified.
 
         A document is modified if the current action pointer doesn't point to the same action as
-        when :meth:`set_save_point` was last called.
+        when :meth:`set_save_point` was last called. If the saved state was dropped from our
+        history, undoing all we have left doesn't bring us back to it.
         """
-        return self._save_point is not self._actions[self._index] if self.can_undo() else self._save_point is not None
+        if self.can_undo():
+            return self._save_point is not self._actions[self._index]
+        return self._save_point is not None or self._save_point_dropped
 
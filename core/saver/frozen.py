@@ -0,0 +1,125 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import copy
+
+from ..model.budget import Budget
+
+class FrozenDocument:
+    """Copies of a document's instances that we can save while the document keeps changing.
+
+    Autosaves run in their own thread while the user keeps working on the document. If we saved
+    live instances, we could save them in the middle of a change. Instead, we :meth:`freeze` the
+    document and save the copies we get, which nobody else touches.
+
+    Copies are kept from one freeze to the other. We only copy again the instances that were
+    :meth:`invalidated <invalidate>` (because an action changed them) and the new ones, which keeps
+    freezing cheap. Accounts and groups are few and can change outside of actions (auto-created
+    accounts), so their copies are refreshed at every freeze. They're refreshed in place so that
+    copies of splits and budgets can keep referring to them.
+    """
+    def __init__(self):
+        self._account_copies = {}
+        self._group_copies = {}
+        # instance -> copy, for transactions, schedules and budgets.
+        self._copies = {}
+
+    # --- Private
+    def _frozen_group(self, group):
+        if group is None:
+            return None
+        result = self._group_copies.get(group)
+        if result is None:
+            result = self._group_copies[group] = copy.copy(group)
+        return result
+
+    def _frozen_account(self, account):
+        if account is None:
+            return None
+        result = self._account_copies.get(account)
+        if result is None:
+            result = self._account_copies[account] = copy.copy(account)
+            result.group = self._frozen_group(account.group)
+        return result
+
+    def _copy_transaction(self, txn):
+        result = txn.replicate()
+        for split in result.splits:
+            # Setting the account resets the reconciliation date.
+            reconciliation_date = split.reconciliation_date
+            split.account = self._frozen_account(split.account)
+            split.reconciliation_date = reconciliation_date
+        return result
+
+    def _copy_recurrence(self, recurrence):
+        result = copy.copy(recurrence)
+        result.ref = self._copy_transaction(recurrence.ref)
+        result.date2instances = {}
+        for attr in ['date2exception', 'date2globalchange']:
+            date2txn = getattr(recurrence, attr)
+            setattr(result, attr, {
+                date: self._copy_transaction(txn) if txn is not None else None
+                for date, txn in list(date2txn.items())
+            })
+        if isinstance(recurrence, Budget):
+            result.account = self._frozen_account(recurrence.account)
+            result.target = self._frozen_account(recurrence.target)
+        return result
+
+    def _frozen(self, instances, copy_func, copies):
+        result = []
+        for instance in instances:
+            frozen = self._copies.get(instance)
+            if frozen is None:
+                frozen = copy_func(instance)
+            copies[instance] = frozen
+            result.append(frozen)
+        return result
+
+    # --- Public
+    def invalidate(self, instances=None):
+        """Discards the copies of ``instances``, or all copies if ``None``.
+
+        Call this with the transactions, schedules and budgets that changed since the last
+        :meth:`freeze` so that they're copied again.
+        """
+        if instances is None:
+            self._copies = {}
+            return
+        for instance in instances:
+            self._copies.pop(instance, None)
+
+    def transaction(self, txn):
+        """Returns the frozen copy of ``txn``, copying it if needed."""
+        result = self._copies.get(txn)
+        if result is None:
+            result = self._copies[txn] = self._copy_transaction(txn)
+        return result
+
+    def freeze(self, accounts, groups, transactions, schedules, budgets):
+        """Returns frozen copies of ``(accounts, groups, transactions, schedules, budgets)``.
+
+        Each of them is a list of copies in the same order as the instances it comes from. Copies
+        of instances that aren't part of the document anymore are dropped.
+        """
+        accounts, groups = list(accounts), list(groups)
+        transactions, schedules, budgets = list(transactions), list(schedules), list(budgets)
+        for group in groups:
+            vars(self._frozen_group(group)).update(vars(group))
+        for account in accounts:
+            frozen_account = self._frozen_account(account)
+            vars(frozen_account).update(vars(account))
+            frozen_account.group = self._frozen_group(account.group)
+        frozen_groups = [self._group_copies[group] for group in groups]
+        frozen_accounts = [self._account_copies[account] for account in accounts]
+        copies = {}
+        frozen_transactions = self._frozen(transactions, self._copy_transaction, copies)
+        frozen_schedules = self._frozen(schedules, self._copy_recurrence, copies)
+        frozen_budgets = self._frozen(budgets, self._copy_recurrence, copies)
+        self._copies = copies
+        self._account_copies = {a: self._account_copies[a] for a in accounts}
+        self._group_copies = {g: self._group_copies[g] for g in groups}
+        return frozen_accounts, frozen_groups, frozen_transactions, frozen_schedules, frozen_budgets
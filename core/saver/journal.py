@@ -0,0 +1,109 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import os
+import os.path as op
+from operator import attrgetter
+
+from .native import start_tag, write_transaction_element
+
+def journal_filename(snapshot_filename):
+    """Returns the name of the journal going with ``snapshot_filename``."""
+    return op.splitext(snapshot_filename)[0] + '.journal'
+
+class Journal:
+    """Append-only record of transaction changes made since a native snapshot was saved.
+
+    Transactions are identified by their index in the snapshot, which is the order in which they're
+    saved (and loaded back). Transactions added afterwards get the next ids. Each :meth:`append`
+    adds a record with the current state of the changed transactions (or their deletion) at the end
+    of :attr:`filename`. Records are self-contained XML elements, so if a record happens to be
+    half-written, the records before it are still good.
+
+    The journal file is only created when the first record is appended, and an existing journal for
+    the snapshot is discarded. Only transactions are journaled: other changes have to go through a
+    new snapshot.
+
+    Positions aren't journaled. When replayed, transactions at the same date end up in the order of
+    their ids, so changes that would give them another order (see :meth:`keeps_order`) also have to
+    go through a new snapshot.
+
+    :param snapshot_filename: The native file the journal goes with.
+    :param transactions: The transactions in the snapshot, in the order they were saved.
+    """
+    def __init__(self, snapshot_filename, transactions):
+        #: Path of the journal file.
+        self.filename = journal_filename(snapshot_filename)
+        #: Number of records appended so far.
+        self.record_count = 0
+        self._transaction2id = {txn: index for index, txn in enumerate(transactions)}
+        self._next_id = len(self._transaction2id)
+        if op.exists(self.filename):
+            os.remove(self.filename)
+
+    def _new_ids(self, transactions, current_transactions):
+        # Returns the ids that append() would give to the new transactions in ``transactions``.
+        new = [t for t in transactions if t in current_transactions and t not in self._transaction2id]
+        new.sort(key=lambda t: (t.date, t.position))
+        return {txn: txn_id for txn_id, txn in enumerate(new, start=self._next_id)}
+
+    def keeps_order(self, transactions, current_transactions):
+        """Returns whether a record for ``transactions`` is replayed in the right order.
+
+        When replayed, transactions at the same date are in the order of their ids. If
+        ``current_transactions`` (a :class:`.TransactionList`) has them in another order at any of
+        the dates of ``transactions``, the record would restore a different document.
+        """
+        new_ids = self._new_ids(transactions, current_transactions)
+        dates = {t.date for t in transactions if t in current_transactions}
+        for date in dates:
+            at_date = sorted(
+                current_transactions.transactions_at_date(date), key=attrgetter('position')
+            )
+            ids = []
+            for txn in at_date:
+                txn_id = self._transaction2id.get(txn, new_ids.get(txn))
+                if txn_id is None:
+                    return False
+                ids.append((txn.position, txn_id))
+            # Positions have to be distinct and ids have to follow them.
+            if any(a[0] >= b[0] or a[1] >= b[1] for a, b in zip(ids, ids[1:])):
+                return False
+        return True
+
+    def append(self, transactions, current_transactions, freeze=None):
+        """Appends a record for the changes made to ``transactions``.
+
+        Transactions that are in ``current_transactions`` are written with their current values.
+        Those that aren't are recorded as deleted. Returns whether a record was appended.
+
+        If ``freeze`` is given, it's called with each changed transaction and returns the copy we
+        write in its place (see :meth:`.FrozenDocument.transaction`).
+        """
+        deleted = []
+        changed = []
+        for txn in sorted(transactions, key=lambda t: (t.date, t.position)):
+            if txn in current_transactions:
+                txn_id = self._transaction2id.get(txn)
+                if txn_id is None:
+                    txn_id = self._transaction2id[txn] = self._next_id
+                    self._next_id += 1
+                changed.append((txn_id, freeze(txn) if freeze is not None else txn))
+            elif txn in self._transaction2id:
+                deleted.append(self._transaction2id.pop(txn))
+        if not (deleted or changed):
+            return False
+        with open(self.filename, 'at', encoding='utf-8') as fp:
+            fp.write('<record>\n')
+            for txn_id in deleted:
+                fp.write(start_tag('delete', [('id', str(txn_id))], empty=True) + '\n')
+            for txn_id, txn in changed:
+                fp.write(start_tag('change', [('id', str(txn_id))]) + '\n')
+                write_transaction_element(fp, txn)
+                fp.write('</change>\n')
+            fp.write('</record>\n')
+        self.record_count += 1
+        return True
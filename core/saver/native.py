@@ -4,124 +4,137 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
-import sys
+import os
 import os.path as op
-import xml.etree.cElementTree as ET
+from xml.sax.saxutils import escape
 
 from ..model.amount import format_amount
 from hscommon.util import remove_invalid_xml, ensure_folder
 
-def save(filename, document_id, properties, accounts, groups, transactions, schedules, budgets):
-    def date2str(date):
-        return date.strftime('%Y-%m-%d')
+# Characters that have to be escaped in a double-quoted attribute value (on top of &, < and >),
+# the same way ElementTree does it.
+ATTRIB_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'}
+
+def date2str(date):
+    return date.strftime('%Y-%m-%d')
 
-    def handle_newlines(s):
-        # etree doesn't correctly save newlines. In fields that allow it, we have to escape them so
-        # that we can restore them during load.
-        # XXX It seems like newer version of etree do escape newlines. When we use Python 3.2, we
-        # can probably remove this.
-        if not s:
-            return s
-        return s.replace('\n', '\\n')
+def handle_newlines(s):
+    # etree doesn't correctly save newlines. In fields that allow it, we have to escape them so
+    # that we can restore them during load.
+    # XXX It seems like newer version of etree do escape newlines. When we use Python 3.2, we
+    # can probably remove this.
+    if not s:
+        return s
+    return s.replace('\n', '\\n')
 
-    def setattrib(attribs, attribname, value):
-        if value:
-            attribs[attribname] = value
+def start_tag(tag, attribs, empty=False):
+    """Returns the start tag of a ``tag`` element with ``attribs``.
 
-    def write_transaction_element(parent_element, transaction):
-        transaction_element = ET.SubElement(parent_element, 'transaction')
-        attrib = transaction_element.attrib
-        attrib['date'] = date2str(transaction.date)
-        setattrib(attrib, 'description', transaction.description)
-        setattrib(attrib, 'payee', transaction.payee)
-        setattrib(attrib, 'checkno', transaction.checkno)
-        setattrib(attrib, 'notes', handle_newlines(transaction.notes))
-        attrib['mtime'] = str(int(transaction.mtime))
-        for split in transaction.splits:
-            split_element = ET.SubElement(transaction_element, 'split')
-            attrib = split_element.attrib
-            attrib['account'] = split.account_name
-            attrib['amount'] = format_amount(split.amount)
-            setattrib(attrib, 'memo', split.memo)
-            setattrib(attrib, 'reference', split.reference)
-            if split.reconciliation_date is not None:
-                attrib['reconciliation_date'] = date2str(split.reconciliation_date)
+    ``attribs`` is a list of ``(name, value)`` pairs. Pairs with a ``None`` value are skipped and
+    values are cleaned from invalid XML characters. If ``empty`` is true, the tag is self-closed.
+    """
+    attribs = ''.join(
+        ' {}="{}"'.format(name, escape(remove_invalid_xml(value), ATTRIB_ENTITIES))
+        for name, value in attribs if value is not None
+    )
+    return '<{}{}{}>'.format(tag, attribs, ' /' if empty else '')
 
-    root = ET.Element('moneyguru-file')
-    root.attrib['document_id'] = document_id
-    props_element = ET.SubElement(root, 'properties')
+def write_transaction_element(fp, transaction):
+    fp.write(start_tag('transaction', [
+        ('date', date2str(transaction.date)),
+        ('description', transaction.description or None),
+        ('payee', transaction.payee or None),
+        ('checkno', transaction.checkno or None),
+        ('notes', handle_newlines(transaction.notes) or None),
+        ('mtime', str(int(transaction.mtime))),
+    ]))
+    for split in transaction.splits:
+        reconciliation_date = split.reconciliation_date
+        fp.write(start_tag('split', [
+            ('account', split.account_name),
+            ('amount', format_amount(split.amount)),
+            ('memo', split.memo or None),
+            ('reference', split.reference or None),
+            ('reconciliation_date', date2str(reconciliation_date) if reconciliation_date is not None else None),
+        ], empty=True))
+    fp.write('</transaction>\n')
+
+def write_document(fp, document_id, properties, accounts, groups, transactions, schedules, budgets):
+    """Writes the document as moneyGuru XML in ``fp``, element by element."""
+    fp.write('<?xml version="1.0" encoding="utf-8"?>\n')
+    fp.write(start_tag('moneyguru-file', [('document_id', document_id)]) + '\n')
+    props = []
     for name, value in properties.items():
         if name == 'default_currency':
             value = value.code
         else:
             value = str(value)
-        props_element.attrib[name] = value
+        props.append((name, value))
+    fp.write(start_tag('properties', props, empty=True) + '\n')
     for group in groups:
-        group_element = ET.SubElement(root, 'group')
-        attrib = group_element.attrib
-        attrib['name'] = group.name
-        attrib['type'] = group.type
+        fp.write(start_tag('group', [('name', group.name), ('type', group.type)], empty=True) + '\n')
     for account in accounts:
-        account_element = ET.SubElement(root, 'account')
-        attrib = account_element.attrib
-        attrib['name'] = account.name
-        attrib['currency'] = account.currency.code
-        attrib['type'] = account.type
-        if account.group:
-            attrib['group'] = account.group.name
-        if account.reference is not None:
-            attrib['reference'] = account.reference
-        if account.account_number:
-            attrib['account_number'] = account.account_number
-        if account.inactive:
-            attrib['inactive'] = 'y'
-        if account.notes:
-            attrib['notes'] = handle_newlines(account.notes)
+        fp.write(start_tag('account', [
+            ('name', account.name),
+            ('currency', account.currency.code),
+            ('type', account.type),
+            ('group', account.group.name if account.group else None),
+            ('reference', account.reference),
+            ('account_number', account.account_number or None),
+            ('inactive', 'y' if account.inactive else None),
+            ('notes', handle_newlines(account.notes) or None),
+        ], empty=True) + '\n')
     for transaction in transactions:
-        write_transaction_element(root, transaction)
+        write_transaction_element(fp, transaction)
     # the functionality of the line below is untested because it's an optimisation
     scheduled = [s for s in schedules if s.is_alive]
     for recurrence in scheduled:
-        recurrence_element = ET.SubElement(root, 'recurrence')
-        attrib = recurrence_element.attrib
-        attrib['type'] = recurrence.repeat_type
-        attrib['every'] = str(recurrence.repeat_every)
-        if recurrence.stop_date is not None:
-            attrib['stop_date'] = date2str(recurrence.stop_date)
-        for date, change in recurrence.date2globalchange.items():
-            change_element = ET.SubElement(recurrence_element, 'change')
-            change_element.attrib['date'] = date2str(date)
-            if change is not None:
-                write_transaction_element(change_element, change)
-        for date, exception in recurrence.date2exception.items():
-            exception_element = ET.SubElement(recurrence_element, 'exception')
-            exception_element.attrib['date'] = date2str(date)
-            if exception is not None:
-                write_transaction_element(exception_element, exception)
-        write_transaction_element(recurrence_element, recurrence.ref)
+        fp.write(start_tag('recurrence', [
+            ('type', recurrence.repeat_type),
+            ('every', str(recurrence.repeat_every)),
+            ('stop_date', date2str(recurrence.stop_date) if recurrence.stop_date is not None else None),
+        ]) + '\n')
+        for tag, date2txn in [
+                ('change', recurrence.date2globalchange),
+                ('exception', recurrence.date2exception)]:
+            for date, txn in date2txn.items():
+                if txn is None:
+                    fp.write(start_tag(tag, [('date', date2str(date))], empty=True))
+                else:
+                    fp.write(start_tag(tag, [('date', date2str(date))]))
+                    write_transaction_element(fp, txn)
+                    fp.write('</{}>\n'.format(tag))
+        write_transaction_element(fp, recurrence.ref)
+        fp.write('</recurrence>\n')
     for budget in budgets:
-        budget_element = ET.SubElement(root, 'budget')
-        attrib = budget_element.attrib
-        attrib['account'] = budget.account.name
-        attrib['type'] = budget.repeat_type
-        attrib['every'] = str(budget.repeat_every)
-        attrib['amount'] = format_amount(budget.amount)
-        attrib['notes'] = budget.notes
-        if budget.target is not None:
-            attrib['target'] = budget.target.name
-        attrib['start_date'] = date2str(budget.start_date)
-        if budget.stop_date is not None:
-            attrib['stop_date'] = date2str(budget.stop_date)
-    for elem in root.getiterator():
-        attrib = elem.attrib
-        for key, value in attrib.items():
-            attrib[key] = remove_invalid_xml(value)
-    tree = ET.ElementTree(root)
+        fp.write(start_tag('budget', [
+            ('account', budget.account.name),
+            ('type', budget.repeat_type),
+            ('every', str(budget.repeat_every)),
+            ('amount', format_amount(budget.amount)),
+            ('notes', budget.notes),
+            ('target', budget.target.name if budget.target is not None else None),
+            ('start_date', date2str(budget.start_date)),
+            ('stop_date', date2str(budget.stop_date) if budget.stop_date is not None else None),
+        ], empty=True) + '\n')
+    fp.write('</moneyguru-file>\n')
+
+def save(filename, document_id, properties, accounts, groups, transactions, schedules, budgets):
+    """Saves the document as moneyGuru XML in ``filename``.
+
+    Elements are written as we go rather than being built in memory first. We write in a temporary
+    file next to ``filename`` which then replaces it, so that ``filename`` is never left half
+    written.
+    """
     ensure_folder(op.dirname(filename))
-    fp = open(filename, 'wt', encoding='utf-8')
-    fp.write('<?xml version="1.0" encoding="utf-8"?>\n')
-    # This 'unicode' encoding thing is only available (and necessary) from Python 3.2
-    if sys.version_info[1] >= 2:
-        tree.write(fp, encoding='unicode')
-    else:
-        tree.write(fp)
+    tmp_filename = filename + '.tmp'
+    try:
+        with open(tmp_filename, 'wt', encoding='utf-8') as fp:
+            write_document(
+                fp, document_id, properties, accounts, groups, transactions, schedules, budgets
+            )
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if op.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
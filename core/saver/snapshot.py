@@ -0,0 +1,145 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import os
+import os.path as op
+import sqlite3 as sqlite
+
+from hscommon.util import ensure_folder
+
+from ..model.amount import Amount
+
+FORMAT_NAME = 'moneyguru-snapshot'
+FORMAT_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE properties (name TEXT, value TEXT);
+CREATE TABLE groups (name TEXT, type TEXT);
+CREATE TABLE accounts (
+    name TEXT, currency TEXT, type TEXT, group_name TEXT, reference TEXT, account_number TEXT,
+    inactive INTEGER, notes TEXT
+);
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY, root INTEGER, date INTEGER, description TEXT, payee TEXT,
+    checkno TEXT, notes TEXT, mtime INTEGER
+);
+CREATE TABLE splits (
+    transaction_id INTEGER, account TEXT, amount INTEGER, currency TEXT, memo TEXT,
+    reference TEXT, reconciliation_date INTEGER
+);
+CREATE TABLE recurrences (
+    id INTEGER PRIMARY KEY, type TEXT, every INTEGER, stop_date INTEGER, ref_id INTEGER
+);
+CREATE TABLE recurrence_dates (
+    recurrence_id INTEGER, kind TEXT, date INTEGER, transaction_id INTEGER
+);
+CREATE TABLE budgets (
+    account TEXT, type TEXT, every INTEGER, amount INTEGER, currency TEXT, notes TEXT,
+    target TEXT, start_date INTEGER, stop_date INTEGER
+);
+"""
+
+def amount2row(amount):
+    """Returns ``(value, currency_code)`` for ``amount``.
+
+    ``value`` is an integer, shifted by the currency's exponent. A plain 0 gives ``(0, None)``.
+    """
+    if isinstance(amount, Amount):
+        currency = amount.currency
+        return int(round(amount.value * 10 ** currency.exponent)), currency.code
+    return 0, None
+
+def date2ordinal(date):
+    return date.toordinal() if date is not None else None
+
+def save(filename, document_id, properties, accounts, groups, transactions, schedules, budgets):
+    """Saves the document as a moneyGuru snapshot, a SQLite database, in ``filename``.
+
+    Snapshots are a compact alternative to the XML format: amounts are stored as integers and dates
+    as ordinals, which makes them much faster to load. As with the XML saver, we write in a
+    temporary file which then replaces ``filename``.
+    """
+    def add_transaction(txn, root):
+        cur = con.execute(
+            "insert into transactions(root, date, description, payee, checkno, notes, mtime) "
+            "values(?, ?, ?, ?, ?, ?, ?)",
+            (root, txn.date.toordinal(), txn.description, txn.payee, txn.checkno, txn.notes,
+             int(txn.mtime))
+        )
+        txn_id = cur.lastrowid
+        splits.extend(
+            (txn_id, split.account_name) + amount2row(split.amount) +
+            (split.memo, split.reference, date2ordinal(split.reconciliation_date))
+            for split in txn.splits
+        )
+        return txn_id
+
+    ensure_folder(op.dirname(filename))
+    tmp_filename = filename + '.tmp'
+    if op.exists(tmp_filename):
+        os.remove(tmp_filename)
+    con = sqlite.connect(tmp_filename)
+    try:
+        with con:
+            con.executescript(SCHEMA)
+            con.executemany("insert into meta(name, value) values(?, ?)", [
+                ('format', FORMAT_NAME),
+                ('version', str(FORMAT_VERSION)),
+                ('document_id', document_id),
+            ])
+            props = []
+            for name, value in properties.items():
+                value = value.code if name == 'default_currency' else str(value)
+                props.append((name, value))
+            con.executemany("insert into properties(name, value) values(?, ?)", props)
+            con.executemany(
+                "insert into groups(name, type) values(?, ?)",
+                ((group.name, group.type) for group in groups)
+            )
+            con.executemany(
+                "insert into accounts values(?, ?, ?, ?, ?, ?, ?, ?)",
+                ((
+                    account.name, account.currency.code, account.type,
+                    account.group.name if account.group else None, account.reference,
+                    account.account_number, int(account.inactive), account.notes
+                ) for account in accounts)
+            )
+            splits = []
+            for txn in transactions:
+                add_transaction(txn, 1)
+            recurrence_dates = []
+            for recurrence in (s for s in schedules if s.is_alive):
+                ref_id = add_transaction(recurrence.ref, 0)
+                recurrence_id = con.execute(
+                    "insert into recurrences(type, every, stop_date, ref_id) values(?, ?, ?, ?)",
+                    (recurrence.repeat_type, recurrence.repeat_every,
+                     date2ordinal(recurrence.stop_date), ref_id)
+                ).lastrowid
+                for kind, date2txn in [
+                        ('change', recurrence.date2globalchange),
+                        ('exception', recurrence.date2exception)]:
+                    for date, txn in date2txn.items():
+                        txn_id = add_transaction(txn, 0) if txn is not None else None
+                        recurrence_dates.append((recurrence_id, kind, date.toordinal(), txn_id))
+            con.executemany("insert into splits values(?, ?, ?, ?, ?, ?, ?)", splits)
+            con.executemany("insert into recurrence_dates values(?, ?, ?, ?)", recurrence_dates)
+            con.executemany(
+                "insert into budgets values(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (budget.account.name, budget.repeat_type, budget.repeat_every) +
+                    amount2row(budget.amount) +
+                    (budget.notes, budget.target.name if budget.target is not None else None,
+                     date2ordinal(budget.start_date), date2ordinal(budget.stop_date))
+                    for budget in budgets
+                )
+            )
+    except BaseException:
+        con.close()
+        os.remove(tmp_filename)
+        raise
+    con.close()
+    os.replace(tmp_filename, filename)
@@ -8,6 +8,7 @@ from hscommon.testutil import eq_
 
 from .base import TestApp, with_app
 from ..model.account import AccountType
+from ..model.transaction_list import TransactionList
 
 # a little helper that creates a completable edit, sets the text and returns the completion
 def complete_table(target_table, value, attrname):
@@ -184,6 +185,24 @@ def test_complete_latest_modified(app):
     app.etable.delete()
     eq_(complete_etable(app, 'De', 'description'), 'posit')
 
+@with_app(app_one_entry)
+def test_edit_only_indexes_edited_entry(app, monkeypatch):
+    # When an entry is edited, only that entry is indexed again for completion, not all of them.
+    app.add_entry('11/10/2007', 'Other')
+    complete_etable(app, 'De', 'description') # completion is up to date
+    indexed = []
+    completion_values = TransactionList._completion_values
+    def record_completion_values(tlist, transaction):
+        indexed.append(transaction)
+        return completion_values(tlist, transaction)
+
+    monkeypatch.setattr(TransactionList, '_completion_values', record_completion_values)
+    app.etable.select([0])
+    app.etable.selected_row.description = 'Changed'
+    app.etable.save_edits()
+    eq_(complete_etable(app, 'Ch', 'description'), 'anged')
+    eq_([t.description for t in indexed], ['Changed'])
+
 @with_app(app_one_entry)
 def test_complete_partial(app):
     # Partial match returns the attribute of the matched entry.
@@ -122,6 +122,34 @@ def test_dont_parse_amount_with_expression(app):
     app.sfield.text = '100+40' # The txn with the '140' amount shouldn't show up.
     eq_(app.ttable.row_count, 0)
 
+@with_app(app_two_transactions)
+def test_query_after_edition(app):
+    # The search index follows changes made to transactions.
+    app.sfield.text = 'groceries'
+    eq_(app.ttable.row_count, 0)
+    app.sfield.text = ''
+    app.ttable.select([1])
+    app.ttable[1].description = 'Groceries'
+    app.ttable.save_edits()
+    app.sfield.text = 'groceries'
+    eq_(app.ttable.row_count, 1)
+    app.sfield.text = 'withdrawal'
+    eq_(app.ttable.row_count, 0)
+    app.sfield.text = ''
+    app.doc.undo()
+    app.sfield.text = 'withdrawal'
+    eq_(app.ttable.row_count, 1)
+
+@with_app(app_two_transactions)
+def test_query_renamed_account(app):
+    # Account searches use account names as they are at search time.
+    app.select_account('Income')
+    app.change_selected_account(name='Salary')
+    app.show_tview()
+    app.sfield.text = 'account:salary'
+    eq_(app.ttable.row_count, 1)
+    eq_(app.ttable[0].description, 'a Deposit')
+
 # ---
 def app_ambiguity_in_txn_values():
     # Transactions have similar values in different fields
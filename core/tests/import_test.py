@@ -110,6 +110,44 @@ def test_import_updates_undo_description(app):
     importall(app, testdata.filepath('qif', 'checkbook.qif'))
     app.mw.view.check_gui_calls_partial(['refresh_undo_actions'])
 
+@with_app(TestApp)
+def test_import_many_files(app):
+    # parse_files_for_import() shows the accounts of all files in the Import window, in order.
+    app.mw.parse_files_for_import([
+        testdata.filepath('qif', 'checkbook.qif'), testdata.filepath('ofx', 'desjardins.ofx'),
+    ])
+    eq_(
+        [pane.name for pane in app.iwin.panes],
+        ['Account 1', 'Account 2', '815-30219-12345-EOP', '815-30219-11111-EOP']
+    )
+
+@with_app(TestApp)
+def test_import_many_files_with_invalid_ones(app):
+    # Files that can't be imported are reported at the end, but don't prevent the other files
+    # from being imported.
+    filenames = [
+        testdata.filepath('qif', 'invalid.qif'), testdata.filepath('qif', 'checkbook.qif'),
+        testdata.filepath('qif', 'only_accounts.qif'),
+    ]
+    with raises(FileFormatError) as excinfo:
+        app.mw.parse_files_for_import(filenames)
+    assert 'invalid.qif' in str(excinfo.value)
+    assert 'only_accounts.qif' in str(excinfo.value)
+    eq_([pane.name for pane in app.iwin.panes], ['Account 1', 'Account 2'])
+
+@with_app(TestApp)
+def test_import_many_csv_files(app):
+    # CSV files are shown in the CSV options window one after the other.
+    app.mw.parse_files_for_import([
+        testdata.filepath('csv', 'simple.csv'), testdata.filepath('csv', 'fortis.csv'),
+    ])
+    app.csvopt.view.check_gui_calls_partial(['show'])
+    app.csvopt.set_column_field(0, CsvField.Date)
+    app.csvopt.set_column_field(5, CsvField.Amount)
+    app.csvopt.continue_import()
+    app.csvopt.view.check_gui_calls_partial(['hide', 'show'])
+    eq_(app.csvopt.lines[0][0], 'ANNEE + REFERENCE')
+
 # ---
 def app_qif_import():
     # One account named 'Account 1' and then an parse_file_for_import() call for the 'checkbook.qif' test file.
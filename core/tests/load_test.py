@@ -4,12 +4,16 @@
 # which should be included with this package. The terms are also available at
 # http://www.gnu.org/licenses/gpl-3.0.html
 
+import sqlite3
 from datetime import date
 
+from pytest import raises
 from hscommon.testutil import eq_
 
 from ..document import ScheduleScope
+from ..loader import snapshot
 from ..model.account import AccountType
+from ..model.amount import Amount
 from ..model.currency import Currency, CAD
 from ..model.date import MonthRange
 from .base import compare_apps, TestApp, with_app, testdata
@@ -36,6 +40,28 @@ def test_saved_file_starts_with_xml_header(tmpdir):
     contents = fp.read()
     assert contents.startswith('<?xml version="1.0" encoding="utf-8"?>\n')
 
+def test_special_characters_are_escaped(tmpdir):
+    # Characters that have a meaning in XML attributes survive a save/load roundtrip.
+    app = TestApp()
+    app.add_txn(description='<"foo" & \'bar\'>\tbaz', payee='a\rb')
+    filepath = str(tmpdir.join('foo.xml'))
+    app.doc.save_to_xml(filepath)
+    app.doc.load_from_xml(filepath)
+    eq_(app.ttable[0].description, '<"foo" & \'bar\'>\tbaz')
+    eq_(app.ttable[0].payee, 'a\rb')
+
+def test_save_replaces_existing_file(tmpdir):
+    # Saving over an existing file replaces it and leaves no temporary file behind.
+    app = TestApp()
+    app.add_txn(description='foo')
+    filepath = str(tmpdir.join('foo.xml'))
+    app.doc.save_to_xml(filepath)
+    app.add_txn(description='bar')
+    app.doc.save_to_xml(filepath)
+    eq_(tmpdir.listdir(), [tmpdir.join('foo.xml')])
+    app.doc.load_from_xml(filepath)
+    eq_(app.ttable.row_count, 2)
+
 # ---
 class TestLoadFile:
     # Loads 'simple.moneyguru', a file with 2 accounts and 2 entries in each. Select the first entry.
@@ -482,6 +508,72 @@ def test_save_load(tmpdir, monkeypatch):
     app = app_account_and_group()
     check(app)
 
+def test_save_load_snapshot(tmpdir, monkeypatch):
+    # Snapshots hold the same data as XML documents and are loaded through load_from_xml().
+    def check(app):
+        filepath = str(tmpdir.join('foo.mgsnapshot'))
+        app.doc.save_to_snapshot(filepath)
+        app.doc.close()
+        newapp = TestApp()
+        newapp.doc.load_from_xml(filepath)
+        newapp.doc.date_range = app.doc.date_range
+        newapp.doc._cook()
+        compare_apps(app.doc, newapp.doc)
+
+    check(app_account_with_budget())
+    check(app_transaction_with_payee_and_checkno())
+    check(app_account_in_group())
+    check(app_transaction_with_memos())
+    check(app_split_with_null_amount())
+    check(app_one_account_and_one_group())
+    check(app_budget_with_all_fields_set())
+    check(app_account_with_apanel_attrs())
+    check(app_one_schedule_and_one_normal_txn())
+    check(app_schedule_with_global_change(monkeypatch))
+    check(app_schedule_with_local_deletion(monkeypatch))
+
+def test_snapshot_zero_budget(tmpdir):
+    # Like in XML documents, a budget with a zero amount is kept.
+    app = TestApp()
+    app.add_account('asset')
+    app.add_account('income', account_type=AccountType.Income)
+    app.add_budget('income', 'asset', '0')
+    filepath = str(tmpdir.join('foo.mgsnapshot'))
+    app.doc.save_to_snapshot(filepath)
+    newapp = TestApp()
+    newapp.doc.load_from_xml(filepath)
+    eq_(len(newapp.doc.budgets), 1)
+
+def test_snapshot_parse_closes_connection(tmpdir, monkeypatch):
+    # The database connection doesn't outlive parsing, even if the loader isn't used to load.
+    app = TestApp()
+    app.add_account('foo')
+    filepath = str(tmpdir.join('foo.mgsnapshot'))
+    app.doc.save_to_snapshot(filepath)
+    connections = []
+    connect = sqlite3.connect
+    def connect_and_keep(*args, **kwargs):
+        con = connect(*args, **kwargs)
+        connections.append(con)
+        return con
+
+    monkeypatch.setattr(sqlite3, 'connect', connect_and_keep)
+    snapshot.Loader(CAD).parse(filepath)
+    eq_(len(connections), 1)
+    with raises(sqlite3.ProgrammingError):
+        connections[0].execute("select 1")
+
+def test_snapshot_keeps_foreign_amounts(tmpdir):
+    app = TestApp()
+    app.add_account('foo')
+    app.show_account()
+    app.add_entry('1/1/2008', increase='12.34 cad')
+    filepath = str(tmpdir.join('foo.mgsnapshot'))
+    app.doc.save_to_snapshot(filepath)
+    newapp = TestApp()
+    newapp.doc.load_from_xml(filepath)
+    eq_(newapp.doc.transactions[0].splits[0].amount, Amount(12.34, CAD))
+
 def test_save_load_qif(tmpdir):
     def check(app):
         filepath = str(tmpdir.join('foo.qif'))
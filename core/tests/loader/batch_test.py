@@ -0,0 +1,77 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+import os
+
+from hscommon.testutil import eq_
+
+from ..base import testdata
+from ...loader import batch, csv, native, ofx, qif
+from ...model.currency import USD
+
+def test_sniff_loader_class():
+    eq_(batch.sniff_loader_class(testdata.filepath('moneyguru', 'simple.moneyguru')), native.Loader)
+    eq_(batch.sniff_loader_class(testdata.filepath('ofx', 'blank_first_line.ofx')), ofx.Loader)
+    eq_(batch.sniff_loader_class(testdata.filepath('ofx', 'xml.ofx')), ofx.Loader)
+    eq_(batch.sniff_loader_class(testdata.filepath('qif', 'autoswitch.qif')), qif.Loader)
+    eq_(batch.sniff_loader_class(testdata.filepath('qif', 'chr13_line_sep.qif')), qif.Loader)
+    eq_(batch.sniff_loader_class(testdata.filepath('csv', 'simple.csv')), None)
+    eq_(batch.sniff_loader_class(testdata.filepath('qif', 'invalid.qif')), None)
+
+def test_parse_files_same_as_sequential_loading():
+    # Loading infos read by worker processes gives the same result as loading a file the usual way.
+    filenames = [
+        testdata.filepath('qif', 'transfer.qif'), testdata.filepath('ofx', 'desjardins.ofx'),
+        testdata.filepath('moneyguru', 'simple.moneyguru'),
+    ]
+    parsed, failed = batch.parse_files(filenames, USD)
+    eq_(failed, [])
+    eq_([filename for filename, loader, infos in parsed], filenames)
+    for filename, loader, infos in parsed:
+        assert infos is not None
+        loader.load(infos)
+        expected = batch.parse_file(filename, USD)
+        expected.load()
+        eq_([a.name for a in loader.accounts], [a.name for a in expected.accounts])
+        eq_(
+            [(t.date, t.description, t.amount) for t in loader.transactions],
+            [(t.date, t.description, t.amount) for t in expected.transactions]
+        )
+
+def test_parse_files_falls_back_on_trying_all_loaders():
+    # A file that doesn't match any sniffed format is parsed here, with all loaders. A file that
+    # can't be parsed at all is reported.
+    filenames = [
+        testdata.filepath('csv', 'simple.csv'), testdata.filepath('qif', 'invalid.qif'),
+        testdata.filepath('qif', 'checkbook.qif'),
+    ]
+    parsed, failed = batch.parse_files(filenames, USD)
+    eq_(failed, [testdata.filepath('qif', 'invalid.qif')])
+    eq_(len(parsed), 2)
+    filename, loader, infos = parsed[0]
+    assert isinstance(loader, csv.Loader)
+    assert infos is None
+
+def read_file_infos_and_fail(loaderclass, filename, default_currency_code, default_date_format):
+    raise ValueError()
+
+def read_file_infos_and_die(loaderclass, filename, default_currency_code, default_date_format):
+    os._exit(1)
+
+def check_parsed_here_when_workers_fail(monkeypatch, read_func):
+    monkeypatch.setattr(batch, 'read_file_infos', read_func)
+    filenames = [testdata.filepath('qif', 'transfer.qif'), testdata.filepath('ofx', 'desjardins.ofx')]
+    parsed, failed = batch.parse_files(filenames, USD)
+    eq_(failed, [])
+    eq_([filename for filename, loader, infos in parsed], filenames)
+    eq_([infos for filename, loader, infos in parsed], [None, None])
+
+def test_parse_files_falls_back_on_parsing_here_when_worker_fails(monkeypatch):
+    # When something else than a format error happens in a worker, the file is parsed here.
+    check_parsed_here_when_workers_fail(monkeypatch, read_file_infos_and_fail)
+
+def test_parse_files_falls_back_on_parsing_here_when_pool_breaks(monkeypatch):
+    check_parsed_here_when_workers_fail(monkeypatch, read_file_infos_and_die)
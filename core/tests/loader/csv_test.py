@@ -12,6 +12,7 @@ from pytest import raises
 from hscommon.testutil import eq_
 
 from ...exception import FileFormatError
+from ...loader import csv
 from ...loader.csv import Loader, CsvField
 from ...model.amount import Amount
 from ...model.currency import USD, EUR
@@ -97,3 +98,23 @@ def test_quoted_sep():
     loader = Loader(USD)
     loader.parse(testdata.filepath('csv/quoted_sep.csv'))
     eq_(len(loader.lines), 4)
+
+def test_longer_than_sniffed_lines(tmpdir):
+    # We only sniff the beginning of a file, but all of its lines are loaded. The date format is
+    # guessed from all dates, not only those at the beginning.
+    filename = str(tmpdir.join('foo.csv'))
+    line_count = csv.SNIFF_LINE_COUNT * 2
+    with open(filename, 'wt') as fp:
+        for index in range(line_count - 1):
+            fp.write('01/02/2015;Line {};{}.00\n'.format(index, index))
+        fp.write('13/02/2015;Last line;42.00\n')
+    loader = Loader(USD)
+    loader.parse(filename)
+    eq_(len(loader.lines), line_count)
+    loader.columns = [CsvField.Date, CsvField.Description, CsvField.Amount]
+    loader.load()
+    transactions = loader.transactions
+    eq_(len(transactions), line_count)
+    eq_(transactions[0].date, date(2015, 2, 1))
+    eq_(transactions[-1].date, date(2015, 2, 13))
+    eq_(transactions[-1].amount, Amount(42, USD))
@@ -40,6 +40,24 @@ def test_parse_minimal(loader):
     except FileFormatError:
         assert False
 
+def test_parse_truncated_file(loader):
+    # The file is streamed, but a malformed document is still rejected as a whole.
+    content = b'<moneyguru-file><account name="foo" /><transaction date="2008-01-01">'
+    with raises(FileFormatError):
+        loader._parse(BytesIO(content))
+
+def test_only_root_transactions_are_loaded(loader):
+    # Transactions nested in other elements (such as recurrences) aren't read as root transactions.
+    content = b"""<moneyguru-file>
+    <transaction date="2008-01-01" description="foo"><split account="bar" amount="42" /></transaction>
+    <recurrence type="daily" every="1">
+        <transaction date="2008-01-02" description="baz"><split account="bar" amount="42" /></transaction>
+    </recurrence>
+</moneyguru-file>"""
+    loader._parse(BytesIO(content))
+    eq_([t.description for t in loader.transaction_infos], ['foo'])
+    eq_(loader.recurrence_infos[0].transaction_info.description, 'baz')
+
 def test_wrong_date(loader):
     # these used to raise FileFormatError, but now, we just want to make sure that there is no
     # crash.
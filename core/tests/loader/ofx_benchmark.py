@@ -0,0 +1,118 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+"""Compares the speed of our OFX tokenizer with feeding lines to ``sgmllib``.
+
+Run with ``python -m core.tests.loader.ofx_benchmark [filename ...]``. Without filenames, a
+statement with many transactions is generated.
+"""
+
+import os.path as op
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from ...loader import ofx
+from ...loader.sgmllib import SGMLParser
+from ...model.currency import USD
+
+class SGMLLoader(ofx.Loader, SGMLParser):
+    """The OFX loader as it was before it had its own tokenizer: lines are fed to sgmllib."""
+    def __init__(self, default_currency, default_date_format=None):
+        SGMLParser.__init__(self)
+        ofx.Loader.__init__(self, default_currency, default_date_format)
+
+    def _load(self):
+        for line in self.body.splitlines(True):
+            self.feed(line)
+        self.close()
+        del self.body
+
+STATEMENT_HEADER = """OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+SECURITY:NONE
+ENCODING:USASCII
+CHARSET:1252
+COMPRESSION:NONE
+OLDFILEUID:NONE
+NEWFILEUID:NONE
+
+<OFX>
+<BANKMSGSRSV1>
+<STMTTRNRS>
+<STMTRS>
+<CURDEF>USD
+<BANKACCTFROM>
+<BANKID>123456789
+<ACCTID>987654321
+<ACCTTYPE>CHECKING
+</BANKACCTFROM>
+<BANKTRANLIST>
+"""
+
+STATEMENT_TRANSACTION = """<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>{date:%Y%m%d}120000
+<TRNAMT>-{amount}.42
+<FITID>{index}
+<NAME>Transaction &amp; stuff #{index}
+</STMTTRN>
+"""
+
+STATEMENT_FOOTER = """</BANKTRANLIST>
+</STMTRS>
+</STMTTRNRS>
+</BANKMSGSRSV1>
+</OFX>
+"""
+
+def write_statement(fp, txn_count):
+    fp.write(STATEMENT_HEADER)
+    start = date(2000, 1, 1)
+    for index in range(txn_count):
+        day = start + timedelta(days=index // 10)
+        fp.write(STATEMENT_TRANSACTION.format(date=day, amount=index % 1000, index=index))
+    fp.write(STATEMENT_FOOTER)
+
+def time_read(loaderclass, filename):
+    # We only time parsing and reading infos. Building model instances out of those infos is the
+    # same for both loaders.
+    loader = loaderclass(USD)
+    start = time.perf_counter()
+    loader.parse(filename)
+    infos = loader.read_infos()
+    return time.perf_counter() - start, infos
+
+def summarize(infos):
+    return [
+        (info.date, info.description, info.amount, info.reference)
+        for info in infos['transaction_infos']
+    ]
+
+def compare(filename):
+    sgml_time, sgml_infos = time_read(SGMLLoader, filename)
+    new_time, new_infos = time_read(ofx.Loader, filename)
+    same = summarize(new_infos) == summarize(sgml_infos)
+    print("{}: {} transactions. sgmllib: {:.3f}s tokenizer: {:.3f}s ({:.1f}x){}".format(
+        op.basename(filename), len(new_infos['transaction_infos']), sgml_time, new_time,
+        sgml_time / new_time, '' if same else " RESULTS DIFFER"
+    ))
+
+def main(filenames):
+    if filenames:
+        for filename in filenames:
+            compare(filename)
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = op.join(tmpdir, 'statement.ofx')
+        with open(filename, 'wt', encoding='cp1252') as fp:
+            write_statement(fp, 50000)
+        compare(filename)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
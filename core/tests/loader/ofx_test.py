@@ -12,6 +12,7 @@ from pytest import raises
 from hscommon.testutil import eq_
 
 from ..base import testdata
+from .ofx_benchmark import SGMLLoader, summarize
 from ...exception import FileFormatError
 from ...loader import ofx
 from ...model.amount import Amount
@@ -140,3 +141,43 @@ def test_ccstmtrs():
     account = loader.accounts[1]
     eq_(account.name, '4XXXXXXXXXXXXXX9')
     eq_(len(account.entries), 3)
+
+# ---
+def test_xml_ofx():
+    # OFX 2.x files are XML. Their encoding comes from their XML declaration.
+    loader = ofx.Loader(USD)
+    loader.parse(testdata.filepath('ofx', 'xml.ofx'))
+    loader.load()
+    eq_(len(loader.accounts), 1)
+    account = loader.accounts[0]
+    eq_(account.name, '0000123456F')
+    eq_(account.currency, EUR)
+    eq_(account.reference, '30002|00550|0000123456F')
+    eq_(len(account.entries), 2)
+    entry = account.entries[0]
+    eq_(entry.date, date(2016, 2, 15))
+    eq_(entry.description, 'Café & Crème')
+    eq_(entry.amount, Amount(-12.34, EUR))
+    eq_(entry.reference, 'FIT001')
+    eq_(account.entries[1].description, 'Salaire')
+
+def test_same_infos_as_sgmllib():
+    # Our tokenizer reads the same infos as the sgmllib based loader we used to have.
+    filenames = [
+        testdata.filepath('ofx', name) for name in [
+            'blank_first_line.ofx', 'ccstmtrs.ofx', 'desjardins.ofx', 'desjardins2.ofx',
+            'desjardins3.ofx', 'fortis.ofx', 'ing.qfx', 'xml.ofx',
+        ]
+    ]
+    for filename in filenames:
+        loader = ofx.Loader(USD)
+        loader.parse(filename)
+        infos = loader.read_infos()
+        sgml_loader = SGMLLoader(USD)
+        sgml_loader.parse(filename)
+        sgml_infos = sgml_loader.read_infos()
+        eq_(summarize(infos), summarize(sgml_infos))
+        eq_(
+            [(a.name, a.currency, a.reference) for a in infos['account_infos']],
+            [(a.name, a.currency, a.reference) for a in sgml_infos['account_infos']]
+        )
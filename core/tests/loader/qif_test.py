@@ -9,8 +9,11 @@
 from datetime import date
 
 from hscommon.testutil import eq_
+from pytest import raises
 
 from ..base import TestApp, testdata
+from ...exception import FileFormatError
+from ...loader import qif
 from ...loader.qif import Loader
 from ...model.account import AccountType
 from ...model.amount import Amount
@@ -389,3 +392,30 @@ def test_same_date_same_amount_transfer():
     actual_descs = {txn.description for txn in loader.transactions}
     eq_(actual_descs, expected_descs)
 
+
+def test_date_format_guessed_again_after_sample(tmpdir, monkeypatch):
+    # The date format is guessed from a sample of dates. When a date further in the file doesn't
+    # fit that format, we guess again and the dates we've already read are parsed again.
+    monkeypatch.setattr(qif, 'DATE_SAMPLE_SIZE', 2)
+    filename = str(tmpdir.join('foo.qif'))
+    with open(filename, 'wt') as fp:
+        fp.write('!Type:Bank\n')
+        for index, str_date in enumerate(['01/02/03', '02/02/03', '03/02/03', '13/02/03']):
+            fp.write('D{}\nT{}\nMEntry {}\n^\n'.format(str_date, index + 1, index + 1))
+    loader = Loader(USD)
+    loader.parse(filename)
+    loader.load()
+    eq_(loader.parsing_date_format, '%d/%m/%y')
+    eq_([t.date for t in loader.transactions], [date(2003, 2, d) for d in (1, 2, 3, 13)])
+
+def test_date_format_guessed_again_with_dates_after_sample(tmpdir, monkeypatch):
+    # When we guess again, dates read after the sample count too. Here, no format fits all dates.
+    monkeypatch.setattr(qif, 'DATE_SAMPLE_SIZE', 2)
+    filename = str(tmpdir.join('foo.qif'))
+    with open(filename, 'wt') as fp:
+        fp.write('!Type:Bank\n')
+        for index, str_date in enumerate(['01/02/03', '02/02/03', '05/13/03', '13/05/03']):
+            fp.write('D{}\nT{}\nMEntry {}\n^\n'.format(str_date, index + 1, index + 1))
+    loader = Loader(USD)
+    with raises(FileFormatError):
+        loader.parse(filename)
@@ -8,12 +8,14 @@
 
 import sys
 import os
+import os.path as op
 from datetime import date
 
 from pytest import raises
 from hscommon.testutil import eq_
 
 from .base import ApplicationGUI, TestApp, with_app, testdata
+from .. import document
 from ..app import Application
 from ..document import Document, AUTOSAVE_BUFFER_COUNT
 from ..exception import FileFormatError
@@ -22,6 +24,8 @@ from ..loader import base
 from ..model.account import AccountType
 from ..model.currency import EUR
 from ..model.date import MonthRange, QuarterRange, YearRange
+from ..model.transaction import Transaction
+from ..model.undo import Undoer
 
 # --- No Setup
 def test_can_use_another_amount_format():
@@ -183,12 +187,251 @@ def test_autosave(app, tmpdir):
     eq_(len(os.listdir(cache_path)), 1)
     app.check_gui_calls_partial(app.etable_gui, not_expected=['stop_edition'])
     assert app.doc.is_dirty
-    # test that the autosave file rotation works
+    # Without changes, there's nothing to autosave.
+    app.doc.must_autosave()
+    eq_(len(os.listdir(cache_path)), 1)
+    # test that the autosave file rotation works. Account changes can't be journaled, so they make
+    # us save a new autosave file.
     for i in range(AUTOSAVE_BUFFER_COUNT):
+        app.add_account('account {}'.format(i))
         app.doc.must_autosave()
     # The extra autosave file has been deleted
     eq_(len(os.listdir(cache_path)), AUTOSAVE_BUFFER_COUNT)
 
+def autosave_snapshots(cache_path):
+    return sorted(name for name in os.listdir(cache_path) if name.endswith('.moneyguru'))
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_journal(app, tmpdir):
+    # Transaction changes are appended to the journal of the last autosave, which is replayed when
+    # the autosave is loaded.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.add_entry('1/10/2007', description='first', increase='1')
+    app.doc.must_autosave()
+    [snapshot_name] = autosave_snapshots(cache_path)
+    app.add_entry('2/10/2007', description='second', increase='2')
+    app.add_entry('3/10/2007', description='third', increase='3')
+    app.doc.must_autosave()
+    app.etable.select([0])
+    app.etable[0].description = 'changed'
+    app.etable.save_edits()
+    app.etable.select([1])
+    app.etable.delete()
+    app.doc.must_autosave()
+    eq_(autosave_snapshots(cache_path), [snapshot_name])
+    eq_(len(os.listdir(cache_path)), 2) # the snapshot and its journal
+    newapp = TestApp()
+    newapp.doc.load_from_xml(op.join(cache_path, snapshot_name))
+    newapp.doc.date_range = MonthRange(date(2007, 10, 1))
+    newapp.show_account('Checking')
+    eq_(newapp.etable_count(), 2)
+    eq_(newapp.etable[0].description, 'changed')
+    eq_(newapp.etable[1].description, 'third')
+    eq_(newapp.etable[1].balance, 'EUR 4.00')
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_half_written_journal_record(app, tmpdir):
+    # If we crashed in the middle of writing a record, the records before it are still replayed.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.doc.must_autosave()
+    [snapshot_name] = autosave_snapshots(cache_path)
+    app.add_entry('1/10/2007', description='first', increase='1')
+    app.doc.must_autosave()
+    journal_path = op.join(cache_path, op.splitext(snapshot_name)[0] + '.journal')
+    with open(journal_path, 'at', encoding='utf-8') as fp:
+        fp.write('<record>\n<delete id="0" />\n<chan')
+    newapp = TestApp()
+    newapp.doc.load_from_xml(op.join(cache_path, snapshot_name))
+    newapp.doc.date_range = MonthRange(date(2007, 10, 1))
+    newapp.show_account('Checking')
+    eq_(newapp.etable_count(), 1)
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_journal_compaction(app, tmpdir, monkeypatch):
+    # After a number of journal records, we save a new autosave file.
+    monkeypatch.setattr(document, 'JOURNAL_MAX_RECORDS', 2)
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.doc.must_autosave()
+    for i in range(3):
+        app.add_entry('1/10/2007', description='entry {}'.format(i))
+        app.doc.must_autosave()
+    eq_(len(autosave_snapshots(cache_path)), 2)
+
+def load_last_autosave(cache_path):
+    newapp = TestApp()
+    newapp.doc.load_from_xml(op.join(cache_path, autosave_snapshots(cache_path)[-1]))
+    newapp.doc.date_range = MonthRange(date(2007, 10, 1))
+    newapp.show_account('Checking')
+    return newapp
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_move_entry(app, tmpdir):
+    # The journal doesn't hold positions. Moving an entry makes us save a new autosave file so
+    # that entries are loaded back in the same order.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    for description in 'abcd':
+        app.add_entry('1/10/2007', description=description)
+    app.doc.must_autosave()
+    app.etable.move([3], 0)
+    app.doc.must_autosave()
+    eq_(len(autosave_snapshots(cache_path)), 2)
+    newapp = load_last_autosave(cache_path)
+    eq_([newapp.etable[i].description for i in range(4)], list('dabc'))
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_undo_delete(app, tmpdir):
+    # An undone delete puts the entry back at its old position, which a journal record can't do.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    for description in 'abc':
+        app.add_entry('1/10/2007', description=description)
+    app.doc.must_autosave()
+    app.etable.select([1])
+    app.etable.delete()
+    app.doc.must_autosave()
+    app.doc.undo()
+    app.doc.must_autosave()
+    newapp = load_last_autosave(cache_path)
+    eq_([newapp.etable[i].description for i in range(3)], list('abc'))
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_between_record_and_change(app, tmpdir, monkeypatch):
+    # Actions are recorded before their changes are made. An autosave happening in between doesn't
+    # consider the action, which is journaled by the next autosave, once changes are done.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.add_entry('1/10/2007', description='first')
+    app.add_entry('2/10/2007', description='second')
+    app.doc.must_autosave()
+    [snapshot_name] = autosave_snapshots(cache_path)
+    record = Undoer.record
+    def record_and_autosave(undoer, action):
+        record(undoer, action)
+        app.doc.must_autosave()
+
+    monkeypatch.setattr(Undoer, 'record', record_and_autosave)
+    app.etable.select([0])
+    app.etable[0].description = 'changed'
+    app.etable.save_edits()
+    app.etable.select([1])
+    app.etable.delete()
+    monkeypatch.undo()
+    app.doc.must_autosave()
+    newapp = TestApp()
+    newapp.doc.load_from_xml(op.join(cache_path, snapshot_name))
+    newapp.doc.date_range = MonthRange(date(2007, 10, 1))
+    newapp.show_account('Checking')
+    eq_(newapp.etable_count(), 1)
+    eq_(newapp.etable[0].description, 'changed')
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_changes_during_save(app, tmpdir, monkeypatch):
+    # The user keeps working while we autosave. We save the document as it was when the autosave
+    # started and changes made in the meantime go in the next autosave.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.add_entry('1/10/2007', description='first', increase='1')
+    save_native = document.save_native
+    def save_while_changing(*args):
+        app.etable[0].description = 'changed'
+        app.etable.save_edits()
+        app.doc.change_accounts([app.doc.accounts.find('Checking')], name='Renamed')
+        save_native(*args)
+
+    monkeypatch.setattr(document, 'save_native', save_while_changing)
+    app.doc.must_autosave()
+    monkeypatch.undo()
+    [first_name] = autosave_snapshots(cache_path)
+    newapp = TestApp()
+    newapp.doc.load_from_xml(op.join(cache_path, first_name))
+    newapp.doc.date_range = MonthRange(date(2007, 10, 1))
+    newapp.show_account('Checking')
+    eq_(newapp.etable[0].description, 'first')
+    app.doc.must_autosave()
+    [second_name] = set(autosave_snapshots(cache_path)) - {first_name}
+    newapp = TestApp()
+    newapp.doc.load_from_xml(op.join(cache_path, second_name))
+    newapp.doc.date_range = MonthRange(date(2007, 10, 1))
+    newapp.show_account('Renamed')
+    eq_(newapp.etable[0].description, 'changed')
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_copy_between_record_and_change(app, tmpdir, monkeypatch):
+    # When an autosave copies a transaction after its action is recorded but before it's changed,
+    # that copy isn't kept for later autosaves.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.add_entry('1/10/2007', description='first')
+    app.doc.must_autosave()
+    app.add_account('other') # can't be journaled
+    app.show_account('Checking')
+    record = Undoer.record
+    def record_and_autosave(undoer, action):
+        record(undoer, action)
+        app.doc.must_autosave()
+
+    monkeypatch.setattr(Undoer, 'record', record_and_autosave)
+    app.etable.select([0])
+    app.etable[0].description = 'changed'
+    app.etable.save_edits()
+    monkeypatch.undo()
+    app.doc.must_autosave()
+    app.add_account('another')
+    app.doc.must_autosave()
+    snapshot_names = autosave_snapshots(cache_path)
+    eq_(len(snapshot_names), 3)
+    newapp = TestApp()
+    newapp.doc.load_from_xml(op.join(cache_path, snapshot_names[-1]))
+    newapp.doc.date_range = MonthRange(date(2007, 10, 1))
+    newapp.show_account('Checking')
+    eq_(newapp.etable[0].description, 'changed')
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_account_created_during_save(app, tmpdir, monkeypatch):
+    # An account auto-created while we save isn't in the autosave file. It can't be journaled, so
+    # the next autosave saves a new file.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    save_native = document.save_native
+    def save_while_changing(*args):
+        app.add_entry('1/10/2007', transfer='auto', increase='1')
+        save_native(*args)
+
+    monkeypatch.setattr(document, 'save_native', save_while_changing)
+    app.doc.must_autosave()
+    monkeypatch.undo()
+    app.doc.must_autosave()
+    eq_(len(autosave_snapshots(cache_path)), 2)
+
+@with_app(app_one_empty_account_range_on_october_2007)
+def test_autosave_copies_changed_transactions_only(app, tmpdir, monkeypatch):
+    # The copies we save are kept from one autosave to the other. Only changed transactions are
+    # copied again.
+    cache_path = str(tmpdir)
+    app.app.cache_path = cache_path
+    app.add_entry('1/10/2007', description='first')
+    app.add_entry('2/10/2007', description='second')
+    app.doc.must_autosave()
+    app.add_account('other') # can't be journaled
+    app.show_account('Checking')
+    app.etable.select([1])
+    app.etable[1].description = 'changed'
+    app.etable.save_edits()
+    replicated = []
+    replicate = Transaction.replicate
+    def replicate_and_count(txn):
+        replicated.append(txn)
+        return replicate(txn)
+
+    monkeypatch.setattr(Transaction, 'replicate', replicate_and_count)
+    app.doc.must_autosave()
+    eq_(len(autosave_snapshots(cache_path)), 2)
+    eq_([txn.description for txn in replicated], ['changed'])
+
 @with_app(app_one_empty_account_range_on_october_2007)
 def test_balance_recursion_limit(app):
     # Balance calculation don't cause recursion errors when there's a lot of them.
@@ -86,3 +86,67 @@ class TestOneAccount:
         # Each entry is converted using the entry's day rate.
         eq_(self.account.entries.cash_flow(range, CAD), Amount(201.40, CAD))
 
+
+
+class TestAccountListWithNumbers:
+    def setup_method(self, method):
+        self.accounts = AccountList(USD)
+        self.checking = Account('Checking', USD, AccountType.Asset)
+        self.checking.account_number = '1000'
+        self.savings = Account('Savings', USD, AccountType.Asset)
+        self.savings.reference = 'ref'
+        self.accounts.add(self.checking)
+        self.accounts.add(self.savings)
+
+    def test_find_by_name(self):
+        assert self.accounts.find(' sAVings ') is self.savings
+        assert self.accounts.find('foo') is None
+
+    def test_find_by_number_prefix(self):
+        assert self.accounts.find('1000 whatever') is self.checking
+
+    def test_first_match_in_list_order_wins(self):
+        # When an account matches by number and another by name, the first in the list wins.
+        self.savings.account_number = '1000'
+        self.accounts.reindex([self.savings])
+        assert self.accounts.find('1000') is self.checking
+        other = Account('1000 bar', USD, AccountType.Asset)
+        self.accounts.add(other)
+        assert self.accounts.find('1000 bar') is self.checking
+
+    def test_readded_account_comes_last(self):
+        # An account removed and added back is at the end of the list, and loses to earlier matches.
+        self.savings.account_number = '1000'
+        self.accounts.reindex([self.savings])
+        self.accounts.remove(self.checking)
+        self.accounts.add(self.checking)
+        assert self.accounts.find('1000') is self.savings
+
+    def test_set_account_name(self):
+        self.accounts.set_account_name(self.savings, 'Foo')
+        assert self.accounts.find('savings') is None
+        assert self.accounts.find('foo') is self.savings
+
+    def test_remove(self):
+        self.accounts.remove(self.checking)
+        assert self.accounts.find('checking') is None
+        assert self.accounts.find('1000') is None
+
+    def test_find_reference(self):
+        assert self.accounts.find_reference('ref') is self.savings
+        self.savings.reference = 'other'
+        self.accounts.reindex([self.savings])
+        assert self.accounts.find_reference('ref') is None
+        assert self.accounts.find_reference('other') is self.savings
+
+    def test_add_with_existing_reference(self):
+        # An account with a reference already in the list isn't added.
+        other = Account('Other', USD, AccountType.Asset)
+        other.reference = 'ref'
+        self.accounts.add(other)
+        assert self.accounts.find('other') is None
+
+    def test_clear(self):
+        self.accounts.clear()
+        assert self.accounts.find('checking') is None
+        assert self.accounts.find_reference('ref') is None
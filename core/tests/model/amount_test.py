@@ -10,7 +10,9 @@ from pytest import raises
 from hscommon.testutil import eq_
 
 from ...model.currency import Currency, CAD, EUR, USD
-from ...model.amount import format_amount, parse_amount, Amount, UnsupportedCurrencyError
+from ...model.amount import (
+    format_amount, parse_amount, parse_normalized_amount, Amount, UnsupportedCurrencyError
+)
 
 
 # --- Amount
@@ -252,6 +254,21 @@ def test_parse_10000():
     # it wasn't directly tested.
     eq_(parse_amount('10000', USD) , Amount(10000, USD))
 
+def test_parse_normalized():
+    # Amounts as we write them are parsed without going through the whole parse_amount() process.
+    eq_(parse_normalized_amount('CAD 42.54'), Amount(42.54, CAD))
+    eq_(parse_normalized_amount('-42.5', USD), Amount(-42.5, USD))
+    eq_(parse_normalized_amount('42', USD), Amount(42, USD))
+    eq_(parse_normalized_amount('0.00', USD), 0)
+
+def test_parse_normalized_fallback():
+    # Strings that aren't normalized, or that parse_amount() would parse differently, give None.
+    assert parse_normalized_amount('42.54 cad') is None
+    assert parse_normalized_amount('1.234', USD) is None
+    assert parse_normalized_amount('42') is None
+    assert parse_normalized_amount('XYZ 42') is None
+    eq_(parse_amount('1.234', USD), Amount(1234, USD))
+
 def test_parse_zero():
     eq_(parse_amount('0'), 0)
 
@@ -0,0 +1,64 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from hscommon.testutil import eq_
+
+from ...model.completion import CompletionIndex, CompletionList
+
+class TestCompletionIndex:
+    def setup_method(self, method):
+        self.index = CompletionIndex()
+        self.index.add('Foobar', 1)
+        self.index.add('foobaz', 3)
+        self.index.add('  Élan  ', 2)
+        self.index.add('Bar', 4)
+
+    def test_completions(self):
+        # Completions come most recent first, stripped, ignoring case and diacritics.
+        eq_(self.index.completions('foo'), ['foobaz', 'Foobar'])
+        eq_(self.index.completions('FOOBAR'), ['Foobar'])
+        eq_(self.index.completions('el'), ['Élan'])
+        eq_(self.index.completions('x'), [])
+        eq_(self.index.completions(''), [])
+
+    def test_values(self):
+        eq_(self.index.values(), ['Bar', 'foobaz', '  Élan  ', 'Foobar'])
+        # values() returns a copy
+        self.index.values().clear()
+        eq_(len(self.index.values()), 4)
+
+    def test_rank_is_highest_mtime(self):
+        self.index.add('Foobar', 5)
+        eq_(self.index.completions('foo'), ['Foobar', 'foobaz'])
+        self.index.remove('Foobar', 5)
+        eq_(self.index.completions('foo'), ['foobaz', 'Foobar'])
+
+    def test_remove_all_occurrences(self):
+        self.index.add('Foobar', 1)
+        self.index.remove('Foobar', 1)
+        eq_(self.index.completions('foobar'), ['Foobar'])
+        self.index.remove('Foobar', 1)
+        eq_(self.index.completions('foobar'), [])
+        eq_(len(self.index), 3)
+
+    def test_ties_go_to_first_added(self):
+        index = CompletionIndex()
+        index.add('foo', 1)
+        index.add('far', 1)
+        eq_(index.completions('f'), ['foo', 'far'])
+
+def test_index_from_candidates():
+    # Candidates given at init are ranked in the order they're given, and stripped duplicates
+    # come up only once.
+    index = CompletionIndex(['foo', 'bar', 'far', ' foo '])
+    eq_(index.completions('f'), ['foo', 'far'])
+
+def test_completion_list_cycles():
+    completions = CompletionList('f', CompletionIndex(['foo', 'far']))
+    eq_(completions.current(), 'foo')
+    eq_(completions.next(), 'far')
+    eq_(completions.next(), 'foo')
+    eq_(completions.prev(), 'far')
@@ -116,6 +116,35 @@ def test_set_rate_after_get_the_day_after():
     USD.set_CAD_value(1/42, date(2008, 4, 20))
     assert_almost_equal(CAD.value_in(USD, date(2008, 4, 21)), 42)
 
+def test_set_CAD_values():
+    # Many rates, of many currencies, can be set at once.
+    db = RatesDB()
+    db.set_CAD_values([(date(2008, 4, 20), 'USD', 1.5), (date(2008, 4, 21), 'EUR', 2.0)])
+    eq_(db.get_rate(date(2008, 4, 20), 'USD', 'CAD'), 1.5)
+    eq_(db.get_rate(date(2008, 4, 21), 'EUR', 'CAD'), 2.0)
+
+def test_set_CAD_values_after_get():
+    # Cached values that depend on new rates, including those before the first rate, are updated.
+    db = RatesDB()
+    db.set_CAD_value(date(2008, 4, 20), 'USD', 1.5)
+    db.get_rate(date(2008, 4, 19), 'USD', 'CAD') # value will be cached
+    db.get_rate(date(2008, 4, 23), 'USD', 'CAD') # value will be cached
+    db.set_CAD_values([(date(2008, 4, 18), 'USD', 1.2), (date(2008, 4, 22), 'USD', 1.3)])
+    eq_(db.get_rate(date(2008, 4, 19), 'USD', 'CAD'), 1.2)
+    eq_(db.get_rate(date(2008, 4, 23), 'USD', 'CAD'), 1.3)
+
+def test_rates_are_read_from_db_once(tmpdir):
+    # A currency's rates are loaded from the DB on first use. Rates set afterwards are merged in.
+    dbpath = str(tmpdir.join('foo.db'))
+    db = RatesDB(dbpath)
+    db.set_CAD_values([(date(2008, 4, 20), 'USD', 1.5), (date(2008, 4, 25), 'USD', 1.6)])
+    db = RatesDB(dbpath)
+    eq_(db.get_rate(date(2008, 4, 22), 'USD', 'CAD'), 1.5)
+    db.set_CAD_values([(date(2008, 4, 22), 'USD', 1.7), (date(2008, 4, 25), 'USD', 1.8)])
+    eq_(db.get_rate(date(2008, 4, 23), 'USD', 'CAD'), 1.7)
+    eq_(db.get_rate(date(2008, 4, 26), 'USD', 'CAD'), 1.8)
+    eq_(db.get_rate(date(2008, 4, 1), 'USD', 'CAD'), 1.5)
+
 # --- Two daily rates
 def setup_two_daily_rate():
     # Don't change the set order, it's important for the tests
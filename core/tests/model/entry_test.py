@@ -0,0 +1,111 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from datetime import date
+
+from hscommon.testutil import eq_
+
+from ...model.account import Account, AccountType
+from ...model.amount import Amount
+from ...model.currency import USD, CAD
+from ...model.date import DateRange
+from ...model.entry import Entry, EntryList, ColumnarEntryList
+from ...model.transaction import Transaction
+
+class TestColumnarEntryList:
+    def setup_method(self, method):
+        self.account = Account('Checking', USD, AccountType.Asset)
+        self.entries = ColumnarEntryList(self.account)
+        self.plain_entries = EntryList(self.account)
+        self.txns = [
+            Transaction(date(2008, 1, 1), account=self.account, amount=Amount(10, USD)),
+            Transaction(date(2008, 1, 2), account=self.account, amount=Amount(-3, USD)),
+            Transaction(date(2008, 1, 4), account=self.account, amount=Amount(5, CAD)),
+        ]
+        self.txns[0].splits[0].reconciliation_date = date(2008, 1, 5)
+        balances = [Amount(10, USD), Amount(7, USD), Amount(12, USD)]
+        reconciled = [Amount(10, USD), Amount(10, USD), Amount(10, USD)]
+        for txn, balance, reconciled_balance in zip(self.txns, balances, reconciled):
+            split = txn.splits[0]
+            for entries in (self.entries, self.plain_entries):
+                entries.add_split(split, split.amount, balance, reconciled_balance, balance)
+
+    def test_behaves_like_entry_list(self):
+        # Columnar storage gives the same results as the plain entry list.
+        for d in [date(2007, 12, 31), date(2008, 1, 1), date(2008, 1, 3), date(2008, 1, 4), None]:
+            eq_(self.entries.balance(d), self.plain_entries.balance(d))
+            eq_(self.entries.balance_with_budget(d), self.plain_entries.balance_with_budget(d))
+        eq_(self.entries.balance_of_reconciled(), self.plain_entries.balance_of_reconciled())
+        date_range = DateRange(date(2008, 1, 2), date(2008, 1, 4))
+        eq_(self.entries.cash_flow(date_range, USD), self.plain_entries.cash_flow(date_range, USD))
+        eq_(self.entries.last_entry(date(2008, 1, 3)).transaction, self.txns[1])
+
+    def test_entries_are_materialized_on_access(self):
+        entry = self.entries[-1]
+        assert isinstance(entry, Entry)
+        eq_(entry.index, 2)
+        eq_(entry.balance, Amount(12, USD))
+        eq_(entry.amount, Amount(5, CAD))
+        assert self.entries[2] is entry
+        eq_([e.index for e in self.entries[:2]], [0, 1])
+
+    def test_index_out_of_range(self):
+        try:
+            self.entries[3]
+        except IndexError:
+            pass
+        else:
+            assert False
+
+    def test_clear_from_date(self):
+        self.entries.clear(date(2008, 1, 2))
+        eq_(len(self.entries), 1)
+        eq_(self.entries.balance(), Amount(10, USD))
+        eq_(self.entries.last_entry().transaction, self.txns[0])
+
+    def test_clear_keeps_last_reconciled_when_before_date(self):
+        self.entries.clear(date(2008, 1, 4))
+        eq_(self.entries.balance_of_reconciled(), Amount(10, USD))
+        self.entries.clear(None)
+        eq_(len(self.entries), 0)
+        eq_(self.entries.balance_of_reconciled(), 0)
+        eq_(self.entries.balance(), 0)
+
+    def test_add_entry(self):
+        # Entries added as instances are broken down in columns.
+        entries = ColumnarEntryList(self.account)
+        for entry in self.plain_entries:
+            entries.add_entry(entry)
+        eq_(list(entries), list(self.plain_entries))
+        eq_(entries.balance(), Amount(12, USD))
+
+    def test_cash_flow(self):
+        date_range = DateRange(date(2008, 1, 1), date(2008, 1, 3))
+        for entries in (self.entries, self.plain_entries):
+            eq_(entries.cash_flow(date_range), Amount(7, USD))
+            eq_(entries.cash_flow(DateRange(date(2008, 1, 2), date(2008, 1, 3))), Amount(-3, USD))
+            eq_(entries.cash_flow(DateRange(date(2008, 1, 3), date(2008, 1, 3))), 0)
+
+    def test_cash_flow_follows_clear(self):
+        # Cumulative cash flows computed before a clear() aren't used for entries added after it.
+        date_range = DateRange(date(2008, 1, 1), date(2008, 1, 3))
+        for entries in (self.entries, self.plain_entries):
+            entries.cash_flow(date_range)
+            entries.clear(date(2008, 1, 2))
+            split = self.txns[1].splits[0]
+            split.amount = Amount(-4, USD)
+            entries.add_split(split, split.amount, Amount(6, USD), Amount(10, USD), Amount(6, USD))
+            eq_(entries.cash_flow(date_range), Amount(6, USD))
+            eq_(entries.cash_flow(DateRange(date(2008, 1, 1), date(2008, 1, 1))), Amount(10, USD))
+
+    def test_entries_in_range(self):
+        for entries in (self.entries, self.plain_entries):
+            date_range = DateRange(date(2008, 1, 2), date(2008, 1, 4))
+            eq_([e.transaction for e in entries.entries_in_range(date_range)], self.txns[1:])
+            date_range = DateRange(date(2008, 1, 3), date(2008, 1, 3))
+            eq_(entries.entries_in_range(date_range), [])
+            date_range = DateRange(date.min, date.max)
+            eq_([e.transaction for e in entries.entries_in_range(date_range)], self.txns)
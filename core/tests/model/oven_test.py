@@ -0,0 +1,100 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from datetime import date
+
+from hscommon.testutil import eq_
+
+from ...model.account import Account, AccountList, AccountType
+from ...model.amount import Amount
+from ...model.budget import Budget
+from ...model.currency import USD
+from ...model.date import DateRange
+from ...model.oven import Oven, merge_by_date
+from ...model.recurrence import Recurrence, RepeatType
+from ...model.transaction import Transaction
+from ...model.transaction_list import TransactionList
+
+class TestTwoAccountsAndASchedule:
+    def setup_method(self, method):
+        self.checking = Account('Checking', USD, AccountType.Asset)
+        self.savings = Account('Savings', USD, AccountType.Asset)
+        self.accounts = AccountList(USD)
+        self.accounts.add(self.checking)
+        self.accounts.add(self.savings)
+        self.transactions = TransactionList()
+        self.transactions.add(Transaction(date(2008, 1, 1), account=self.checking, amount=Amount(10, USD)))
+        self.transactions.add(Transaction(date(2008, 1, 2), account=self.savings, amount=Amount(20, USD)))
+        ref = Transaction(date(2008, 1, 3), account=self.savings, amount=Amount(1, USD))
+        self.schedule = Recurrence(ref, RepeatType.Daily, 1)
+        self.oven = Oven(self.accounts, self.transactions, [self.schedule], [])
+        self.oven.cook(date.min, date(2008, 1, 5))
+
+    def test_only_dirty_accounts_are_recooked(self):
+        # When specifying dirty accounts, entries of other accounts are left untouched.
+        savings_entries = list(self.savings.entries)
+        txn = self.transactions[0]
+        txn.splits[0].amount = Amount(12, USD)
+        self.oven.cook(txn.date, date(2008, 1, 5), dirty_accounts={self.checking})
+        eq_(self.checking.entries.balance(), Amount(12, USD))
+        eq_(list(self.savings.entries), savings_entries)
+        assert all(e1 is e2 for e1, e2 in zip(self.savings.entries, savings_entries))
+        eq_(len(self.oven.transactions), 5)
+
+    def test_purged_spawns_make_their_accounts_dirty(self):
+        # When a recurrence's spawn cache is purged, the accounts it affects are recooked even if
+        # they weren't specified as dirty.
+        self.schedule.reset_spawn_cache()
+        self.oven.cook(date(2008, 1, 1), date(2008, 1, 5), dirty_accounts={self.checking})
+        cooked = set(self.oven.transactions)
+        assert all(e.transaction in cooked for e in self.savings.entries)
+        eq_(self.savings.entries.balance(), Amount(23, USD))
+
+    def test_transactions_are_patched_in_place(self):
+        # The cooked transaction list stays the same instance throughout partial cookings.
+        cooked = self.oven.transactions
+        self.oven.cook(date(2008, 1, 2), date(2008, 1, 5), dirty_accounts={self.savings})
+        assert self.oven.transactions is cooked
+        eq_([t.date.day for t in cooked], [1, 2, 3, 4, 5])
+
+    def test_transactions_in_range(self):
+        txns = self.oven.transactions_in_range(DateRange(date(2008, 1, 2), date(2008, 1, 4)))
+        eq_([t.date.day for t in txns], [2, 3, 4])
+        eq_(self.oven.transactions_in_range(DateRange(date(2008, 2, 1), date(2008, 2, 29))), [])
+        eq_(len(self.oven.transactions_in_range(DateRange(date.min, date.max))), 5)
+
+def test_budget_target_reconciliation_dates():
+    # A budget target made dirty by its budget's account is recooked from early enough to cover its
+    # splits reconciled after the cooking date.
+    checking = Account('Checking', USD, AccountType.Asset)
+    cash = Account('Cash', USD, AccountType.Asset)
+    food = Account('Food', USD, AccountType.Expense)
+    accounts = AccountList(USD)
+    for account in [checking, cash, food]:
+        accounts.add(account)
+    transactions = TransactionList()
+    txn = Transaction(date(2008, 1, 1), account=checking, amount=Amount(10, USD))
+    txn.splits[0].reconciliation_date = date(2008, 1, 20)
+    transactions.add(txn)
+    transactions.add(Transaction(date(2008, 1, 15), account=checking, amount=Amount(20, USD)))
+    transactions.add(Transaction(date(2008, 1, 20), account=checking, amount=Amount(30, USD)))
+    budget = Budget(food, checking, Amount(100, USD), date(2008, 1, 1))
+    oven = Oven(accounts, transactions, [], [budget])
+    oven.cook(date.min, date(2008, 1, 31))
+    txn = Transaction(date(2008, 1, 10), account=food, amount=Amount(5, USD))
+    txn.splits[1].account = cash
+    transactions.add(txn)
+    oven.cook(txn.date, date(2008, 1, 31), dirty_accounts={food, cash})
+    eq_(checking.entries[1].reconciled_balance, 0)
+    eq_(checking.entries[2].reconciled_balance, Amount(10, USD))
+
+def test_merge_by_date():
+    # Transactions of the same date come in the order of the sequence they're from.
+    t1 = Transaction(date(2008, 1, 1), 'first')
+    t2 = Transaction(date(2008, 1, 2), 'second')
+    t3 = Transaction(date(2008, 1, 2), 'third')
+    t4 = Transaction(date(2008, 1, 3), 'fourth')
+    eq_(merge_by_date([[t1, t3], [t2, t4], []]), [t1, t3, t2, t4])
@@ -0,0 +1,121 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from datetime import date
+
+from hscommon.testutil import eq_
+
+from ...model.account import Account, AccountType
+from ...model.amount import Amount
+from ...model.currency import USD
+from ...model.search import SearchIndex, is_refinement
+from ...model.transaction import Transaction
+
+class TestThreeTransactions:
+    def setup_method(self, method):
+        self.checking = Account('Checking', USD, AccountType.Asset)
+        self.t1 = Transaction(date(2008, 1, 1), 'Groceries', 'Corner store', '42',
+            account=self.checking, amount=Amount(12, USD))
+        self.t2 = Transaction(date(2008, 1, 2), 'Gas', 'Gas station', account=self.checking,
+            amount=Amount(42, USD))
+        self.t3 = Transaction(date(2008, 1, 3), 'More groceries', 'Supermarket')
+        self.index = SearchIndex()
+        self.index.add([self.t1, self.t2, self.t3])
+
+    def test_text(self):
+        eq_(self.index.matching({'description': 'grocer'}), {self.t1, self.t3})
+        eq_(self.index.matching({'payee': 'station'}), {self.t2})
+        # n-grams in different fields don't make a match
+        eq_(self.index.matching({'description': 'gas station'}), set())
+
+    def test_short_text_query(self):
+        # The index can't answer text queries shorter than our n-grams.
+        eq_(self.index.matching({'description': 'ga'}), None)
+        txns = [self.t1, self.t2, self.t3]
+        eq_(self.index.filter(txns, {'description': 'ga'}), [self.t2])
+
+    def test_amount_checkno_and_account(self):
+        eq_(self.index.matching({'amount': Amount(42, USD)}), {self.t2})
+        eq_(self.index.matching({'checkno': '42'}), {self.t1})
+        eq_(self.index.matching({'account': {'checking'}}), {self.t1, self.t2})
+
+    def test_any_criteria(self):
+        # Like with Transaction.matches(), any criteria matching is enough.
+        query = {'description': 'more', 'amount': Amount(12, USD)}
+        eq_(self.index.matching(query), {self.t1, self.t3})
+
+    def test_remove(self):
+        self.index.remove([self.t1])
+        eq_(self.index.matching({'description': 'grocer'}), {self.t3})
+
+    def test_changed_transaction(self):
+        # A changed transaction never matches on stale keys and is found with its new values once
+        # added back.
+        self.index.matching({'description': 'grocer'}) # index everything
+        self.t1.description = 'Restaurant'
+        eq_(self.index.matching({'description': 'grocer'}), {self.t3})
+        self.index.remove([self.t1])
+        self.index.add([self.t1])
+        eq_(self.index.matching({'description': 'restau'}), {self.t1})
+
+    def test_filter_keeps_order(self):
+        txns = [self.t3, self.t2, self.t1]
+        eq_(self.index.filter(txns, {'description': 'grocer'}), [self.t3, self.t1])
+
+    def test_refined_query(self):
+        # A query extending the previous one is answered from the previous result.
+        eq_(self.index.matching({'description': 'gro'}), {self.t1, self.t3})
+        self.t3.description = 'Nothing' # not recooked, the index doesn't know
+        eq_(self.index.matching({'description': 'groc'}), {self.t1})
+
+    def test_refined_query_after_index_change(self):
+        # Changes to the index invalidate the previous result.
+        self.index.matching({'description': 'gro'})
+        t4 = Transaction(date(2008, 1, 4), 'Groceries again')
+        self.index.add([t4])
+        eq_(self.index.matching({'description': 'groc'}), {self.t1, self.t3, t4})
+
+    def test_widened_query(self):
+        # A query that isn't a refinement of the previous one goes through the index.
+        self.index.matching({'description': 'more'})
+        eq_(self.index.matching({'description': 'gro'}), {self.t1, self.t3})
+        eq_(self.index.matching({'payee': 'gro'}), set())
+
+    def test_refined_untargeted_query(self):
+        # Untargeted queries, as typed in the search field, are refined as well even though their
+        # account and group criteria change with every character.
+        self.index.matching({'description': 'zzz'}) # index everything
+        self.t1.description = 'Gas' # not recooked, the index doesn't know
+        eq_(self.index.matching(untargeted_query('g')), None)
+        eq_(self.index.matching(untargeted_query('gro')), {self.t3})
+        self.t1.description = 'Groceries'
+        # t1 would be found if we didn't answer from the previous result.
+        eq_(self.index.matching(untargeted_query('groc')), {self.t3})
+        eq_(self.index.matching(untargeted_query('groce')), {self.t3})
+
+    def test_refined_query_with_exact_criteria(self):
+        # Exact criteria can match transactions that the previous query didn't.
+        self.index.matching({'description': 'gas', 'checkno': '4'})
+        eq_(self.index.matching({'description': 'gas', 'checkno': '42'}), {self.t1, self.t2})
+
+def untargeted_query(s):
+    # Like Application.parse_search_query() would parse ``s``.
+    return {
+        'account': {s}, 'group': {s}, 'description': s, 'checkno': s, 'payee': s, 'memo': s,
+    }
+
+def test_is_refinement():
+    eq_(is_refinement({'description': 'groc'}, {'description': 'gro'}), True)
+    eq_(is_refinement({'description': 'agro'}, {'description': 'gro'}), True)
+    eq_(is_refinement({'description': 'gro'}, {'description': 'groc'}), False)
+    eq_(is_refinement({'payee': 'groc'}, {'description': 'gro'}), False)
+    eq_(is_refinement({'description': 'groc'}, None), False)
+    # Only text criteria are considered.
+    eq_(is_refinement({'checkno': '42'}, {'checkno': '4'}), True)
+    q1 = {'description': '12', 'amount': Amount(12, USD)}
+    q2 = {'description': '123', 'amount': Amount(123, USD)}
+    eq_(is_refinement(q2, q1), True)
+    eq_(is_refinement({'description': '123'}, {'payee': '12'}), False)
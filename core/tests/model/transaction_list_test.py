@@ -0,0 +1,160 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from datetime import date
+
+from pytest import raises
+from hscommon.testutil import eq_
+
+from ...model.transaction import Transaction
+from ...model.transaction_list import TransactionList
+
+class TestThreeTransactionsOnTwoDates:
+    def setup_method(self, method):
+        self.tlist = TransactionList()
+        self.t1 = Transaction(date(2008, 1, 1), 'first')
+        self.t2 = Transaction(date(2008, 1, 1), 'second')
+        self.t3 = Transaction(date(2008, 1, 2), 'third')
+        for txn in [self.t1, self.t2, self.t3]:
+            self.tlist.add(txn)
+
+    def test_add_assigns_position_after_last_at_date(self):
+        eq_(self.t1.position, 0)
+        eq_(self.t2.position, 1)
+        eq_(self.t3.position, 0)
+        t4 = Transaction(date(2008, 1, 1), 'fourth')
+        self.tlist.add(t4)
+        eq_(t4.position, 2)
+
+    def test_add_after_removal_of_last(self):
+        # Removing the transaction with the highest position at a date makes the next added
+        # transaction take its place.
+        self.tlist.remove(self.t2)
+        t4 = Transaction(date(2008, 1, 1), 'fourth')
+        self.tlist.add(t4)
+        eq_(t4.position, 1)
+
+    def test_init_with_transactions(self):
+        # Transactions passed at init are indexed.
+        tlist = TransactionList([self.t1, self.t2, self.t3])
+        eq_(tlist.transactions_at_date(date(2008, 1, 1)), {self.t1, self.t2})
+
+    def test_move_before(self):
+        self.tlist.move_before(self.t2, self.t1)
+        eq_(self.t2.position, 0)
+        eq_(self.t1.position, 1)
+        t4 = Transaction(date(2008, 1, 1), 'fourth')
+        self.tlist.add(t4)
+        eq_(t4.position, 2)
+
+    def test_move_last_after_date_change(self):
+        # move_last() follows date changes made to the transaction.
+        self.t1.date = date(2008, 1, 2)
+        self.tlist.move_last(self.t1)
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 1)), {self.t2})
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 2)), {self.t1, self.t3})
+        eq_(self.t1.position, 1)
+
+    def test_reindex(self):
+        self.t3.date = date(2008, 1, 1)
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 1)), {self.t1, self.t2})
+        self.tlist.reindex([self.t3])
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 1)), {self.t1, self.t2, self.t3})
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 2)), set())
+
+    def test_reindex_everything(self):
+        self.t1.date = date(2008, 1, 3)
+        self.t2.date = date(2008, 1, 3)
+        self.tlist.reindex()
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 3)), {self.t1, self.t2})
+
+    def test_reindex_ignores_foreign_transactions(self):
+        other = Transaction(date(2008, 1, 1), 'other')
+        self.tlist.reindex([other])
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 1)), {self.t1, self.t2})
+
+    def test_transactions_at_date_returns_a_copy(self):
+        self.tlist.transactions_at_date(date(2008, 1, 1)).clear()
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 1)), {self.t1, self.t2})
+
+    def test_clear(self):
+        self.tlist.clear()
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 1)), set())
+
+    def test_sorted_by_construction(self):
+        # Transactions are inserted at their (date, position) place.
+        t0 = Transaction(date(2007, 12, 31), 'zeroth')
+        self.tlist.add(t0)
+        t4 = Transaction(date(2008, 1, 1), 'fourth')
+        self.tlist.add(t4)
+        eq_(list(self.tlist), [t0, self.t1, self.t2, t4, self.t3])
+
+    def test_init_sorts_transactions(self):
+        tlist = TransactionList([self.t3, self.t2, self.t1])
+        eq_(list(tlist), [self.t1, self.t2, self.t3])
+
+    def test_first_index_at(self):
+        eq_(self.tlist.first_index_at(date(2007, 12, 31)), 0)
+        eq_(self.tlist.first_index_at(date(2008, 1, 1)), 0)
+        eq_(self.tlist.first_index_at(date(2008, 1, 2)), 2)
+        eq_(self.tlist.first_index_at(date(2008, 1, 3)), 3)
+
+    def test_reindex_moves_transaction(self):
+        self.t3.date = date(2007, 12, 31)
+        self.tlist.reindex([self.t3])
+        eq_(list(self.tlist), [self.t3, self.t1, self.t2])
+        eq_(self.tlist.first_index_at(date(2008, 1, 1)), 1)
+
+    def test_remove_after_unindexed_date_change(self):
+        # We can remove a transaction even if its date changed since it was indexed.
+        self.t1.date = date(2008, 1, 2)
+        self.tlist.remove(self.t1)
+        eq_(list(self.tlist), [self.t2, self.t3])
+
+    def test_completion_follows_changes(self):
+        # Completion values are only indexed again for transactions we say have changed.
+        self.t1.mtime = 1
+        self.t2.mtime = 2
+        self.t3.mtime = 3
+        self.tlist.clear_cache()
+        eq_(self.tlist.descriptions, ['third', 'second', 'first'])
+        self.t1.description = 'changed'
+        self.t1.mtime = 4
+        self.t2.description = 'unnoticed'
+        self.tlist.clear_cache([self.t1])
+        eq_(self.tlist.description_index.completions('ch'), ['changed'])
+        eq_(self.tlist.descriptions, ['changed', 'third', 'second'])
+        self.tlist.clear_cache()
+        eq_(self.tlist.descriptions, ['changed', 'third', 'unnoticed'])
+
+    def test_completion_after_remove(self):
+        t4 = Transaction(date(2008, 1, 3), 'first')
+        self.tlist.add(t4)
+        self.tlist.remove(self.t1)
+        eq_(self.tlist.description_index.completions('f'), ['first'])
+        self.tlist.remove(t4)
+        eq_(self.tlist.description_index.completions('f'), [])
+
+    def test_contains(self):
+        assert self.t1 in self.tlist
+        assert Transaction(date(2008, 1, 1), 'first') not in self.tlist
+        self.tlist.remove(self.t1)
+        assert self.t1 not in self.tlist
+
+    def test_remove_many(self):
+        self.tlist.remove_many([self.t1, self.t3])
+        eq_(list(self.tlist), [self.t2])
+        assert self.t3 not in self.tlist
+        eq_(self.tlist.transactions_at_date(date(2008, 1, 2)), set())
+        eq_(self.tlist.first_index_at(date(2008, 1, 2)), 1)
+        eq_(self.tlist.descriptions, ['second'])
+
+    def test_remove_many_with_foreign_transaction(self):
+        # Nothing is removed if one of the transactions isn't in the list.
+        other = Transaction(date(2008, 1, 1), 'other')
+        with raises(ValueError):
+            self.tlist.remove_many([self.t1, other])
+        eq_(list(self.tlist), [self.t1, self.t2, self.t3])
@@ -0,0 +1,120 @@
+# Copyright 2016 Virgil Dupras
+#
+# This software is licensed under the "GPLv3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.gnu.org/licenses/gpl-3.0.html
+
+from datetime import date
+
+from hscommon.testutil import eq_
+
+from ...model.account import Account, AccountList, AccountType, GroupList
+from ...model.amount import Amount
+from ...model.currency import USD
+from ...model.transaction import Transaction
+from ...model.transaction_list import TransactionList
+from ...model.undo import (
+    Action, Delta, Undoer, swapvalues, TRANSACTION_SWAP_ATTRS, SPLIT_SWAP_ATTRS
+)
+
+class TestChangedTransaction:
+    def setup_method(self, method):
+        self.checking = Account('Checking', USD, AccountType.Asset)
+        self.savings = Account('Savings', USD, AccountType.Asset)
+        self.txn = Transaction(date(2008, 1, 1), 'first', account=self.checking, amount=Amount(10, USD))
+        self.backup = self.txn.replicate()
+
+    def test_delta_keeps_changed_attrs(self):
+        self.txn.description = 'changed'
+        self.txn.payee = 'payee'
+        delta = Delta(self.backup, self.txn, TRANSACTION_SWAP_ATTRS)
+        eq_(delta.attrs, ['description', 'payee'])
+        swapvalues(self.txn, delta, TRANSACTION_SWAP_ATTRS)
+        eq_(self.txn.description, 'first')
+        eq_(self.txn.payee, '')
+        eq_(delta.description, 'changed')
+
+    def test_unchanged_splits_are_left_out(self):
+        # Splits that are copies with the same values aren't a change.
+        self.txn.set_splits(self.backup.splits)
+        delta = Delta(self.backup, self.txn, TRANSACTION_SWAP_ATTRS)
+        eq_(delta.attrs, [])
+        self.txn.splits[0].amount = Amount(12, USD)
+        delta = Delta(self.backup, self.txn, TRANSACTION_SWAP_ATTRS)
+        eq_(delta.attrs, ['splits'])
+
+    def test_dependent_attrs_are_kept(self):
+        # Setting a split's account resets its reconciliation date, so when the account changed,
+        # the reconciliation date is part of the delta.
+        split = self.txn.splits[0]
+        split.reconciliation_date = date(2008, 1, 2)
+        action = Action('')
+        action.change_splits([split])
+        split.account = self.savings
+        action.compact()
+        [(_, delta)] = action.changed_splits
+        eq_(delta.attrs, ['account', 'reconciliation_date'])
+        swapvalues(split, delta, SPLIT_SWAP_ATTRS)
+        assert split.account is self.checking
+        eq_(split.reconciliation_date, date(2008, 1, 2))
+
+def test_cooking_scope_includes_reconciliation_dates():
+    # Reconciled balances are cooked in reconciliation date order, so both the old and new
+    # reconciliation dates of changed splits count.
+    checking = Account('Checking', USD, AccountType.Asset)
+    txn = Transaction(date(2008, 1, 10), account=checking, amount=Amount(10, USD))
+    split = txn.splits[0]
+    split.reconciliation_date = date(2008, 1, 3)
+    action = Action('')
+    action.change_splits([split])
+    split.reconciliation_date = date(2008, 1, 5)
+    eq_(action.cooking_scope()[0], date(2008, 1, 3))
+    action = Action('')
+    action.change_splits([split])
+    split.reconciliation_date = date(2008, 1, 1)
+    eq_(action.cooking_scope()[0], date(2008, 1, 1))
+
+def new_undoer(**kwargs):
+    accounts = AccountList(USD)
+    return Undoer(accounts, GroupList(), TransactionList(), [], [], **kwargs)
+
+def undo_count(undoer):
+    result = 0
+    while undoer.can_undo():
+        undoer.undo()
+        result += 1
+    return result
+
+def action_of_size(size):
+    action = Action('')
+    action.deleted_transactions = {Transaction(date(2008, 1, 1)) for i in range(size)}
+    return action
+
+def test_max_depth():
+    undoer = new_undoer(max_depth=2)
+    for i in range(3):
+        undoer.record(Action(''))
+    eq_(undo_count(undoer), 2)
+
+def test_max_size():
+    # The oldest actions are dropped first when their total size goes over the limit.
+    undoer = new_undoer(max_size=5)
+    undoer.record(action_of_size(2))
+    undoer.record(action_of_size(3))
+    undoer.record(action_of_size(1))
+    eq_(undo_count(undoer), 2)
+
+def test_last_action_is_always_kept():
+    undoer = new_undoer(max_size=5)
+    undoer.record(action_of_size(1))
+    undoer.record(action_of_size(6))
+    eq_(undo_count(undoer), 1)
+
+def test_modified_after_dropping_actions():
+    # When actions that aren't saved were dropped, undoing all we have left still leaves us with a
+    # modified document.
+    undoer = new_undoer(max_depth=3)
+    for i in range(5):
+        undoer.record(Action(''))
+    eq_(undo_count(undoer), 3)
+    assert undoer.modified
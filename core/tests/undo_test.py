@@ -787,3 +787,81 @@ def test_delete_account_with_budget(app, checkstate):
 def test_delete_budget(app, checkstate):
     app.btable.delete()
     checkstate()
+
+# --- Transactions in three accounts
+def app_transactions_in_three_accounts():
+    app = TestApp()
+    app.drsel.select_year_range()
+    app.add_accounts('checking', 'savings', 'visa')
+    app.add_txn('01/01/2008', from_='checking', to='savings', amount='10')
+    app.add_txn('02/01/2008', from_='visa', to='checking', amount='20')
+    app.add_txn('03/01/2008', from_='checking', to='savings', amount='30')
+    return app
+
+def entry_balances(app):
+    return {a.name: [e.balance for e in a.entries] for a in app.doc.accounts}
+
+@with_app(app_transactions_in_three_accounts)
+def test_undo_recooks_from_changed_date(app):
+    # Undo and redo only recook the accounts affected by the action, from its earliest date, and
+    # end up with the same balances as a full cooking.
+    before = entry_balances(app)
+    visa_entries = list(app.doc.accounts.find('visa').entries)
+    app.show_tview()
+    app.ttable.select([2])
+    app.ttable[2].date = '02/01/2008'
+    app.ttable[2].amount = '35'
+    app.ttable.save_edits()
+    after = entry_balances(app)
+    app.doc.undo()
+    eq_(entry_balances(app), before)
+    new_visa_entries = list(app.doc.accounts.find('visa').entries)
+    assert all(e1 is e2 for e1, e2 in zip(new_visa_entries, visa_entries))
+    app.doc.redo()
+    eq_(entry_balances(app), after)
+    app.doc.oven.cook(until_date=app.doc.date_range.end)
+    eq_(entry_balances(app), after)
+
+def test_cooking_scope_of_transaction_change():
+    app = app_transactions_in_three_accounts()
+    app.show_tview()
+    app.ttable.select([1])
+    app.ttable[1].amount = '25'
+    app.ttable.save_edits()
+    action = app.doc._undoer._actions[-1]
+    from_date, dirty_accounts = action.cooking_scope()
+    eq_(from_date, date(2008, 1, 2))
+    eq_({a.name for a in dirty_accounts}, {'checking', 'visa'})
+
+def test_cooking_scope_of_account_change():
+    # Account changes need a full cooking.
+    app = app_transactions_in_three_accounts()
+    app.show_nwview()
+    app.bsheet.selected = app.bsheet.assets[0]
+    app.bsheet.selected.name = 'renamed'
+    app.bsheet.save_edits()
+    action = app.doc._undoer._actions[-1]
+    eq_(action.cooking_scope(), (None, None))
+
+@with_app(app_transactions_in_three_accounts)
+def test_undo_consecutive_changes_to_same_transaction(app):
+    # Backups of done actions are compacted to deltas, which still restore every change.
+    states = [copydoc(app.doc)]
+    app.show_tview()
+    app.ttable.select([1])
+    app.ttable[1].description = 'foo'
+    app.ttable.save_edits()
+    states.append(copydoc(app.doc))
+    app.ttable[1].amount = '42'
+    app.ttable.save_edits()
+    states.append(copydoc(app.doc))
+    app.ttable[1].description = ''
+    app.ttable[1].to = 'savings'
+    app.ttable.save_edits()
+    states.append(copydoc(app.doc))
+    for state in reversed(states[:-1]):
+        app.doc.undo()
+        compare_apps(state, app.doc)
+    for state in states[1:]:
+        app.doc.redo()
+        compare_apps(state, app.doc)
@@ -11,6 +11,7 @@ import sys
 import gc
 import logging
 import os.path as op
+from multiprocessing import freeze_support
 
 from PyQt5.QtCore import QFile, QTextStream, QSettings
 from PyQt5.QtGui import QIcon, QPixmap
@@ -71,4 +72,7 @@ def main():
     return exec_result
 
 if __name__ == "__main__":
+    # Importing files uses worker processes, which, in a frozen app, are launched with our own
+    # executable.
+    freeze_support()
     sys.exit(main())